@@ -1,12 +1,15 @@
-from botocore.stub import Stubber
 from e3.env import Env
-import botocore.session
+import threading
+
+# Note that botocore is imported only when needed as importing it takes much
+# longer than rendering most templates.
 
 
 class AWSEnv(object):
     """Handle AWS session and clients."""
 
-    def __init__(self, regions=None, stub=False):
+    def __init__(self, regions=None, stub=False, max_pool_connections=None,
+                 endpoint_urls=None, retry_mode=None, max_attempts=None):
         """Initialize an AWS session.
 
         Once intialized AWS environment can be accessed from Env().aws_env
@@ -16,19 +19,88 @@ class AWSEnv(object):
         :type regions: list[str]
         :param stub: if True clients are necessarily stubbed
         :type stub: bool
+        :param max_pool_connections: maximum number of HTTP connections
+            kept by each client. Should be at least the number of threads
+            sharing a client. If None botocore default (10) is used.
+        :type max_pool_connections: int | None
+        :param endpoint_urls: dict associating a client name to the endpoint
+            URL to use instead of the AWS one (for example a local S3
+            compatible server)
+        :type endpoint_urls: dict | None
+        :param retry_mode: botocore retry mode (legacy, standard or
+            adaptive). In adaptive mode each client throttles its own
+            requests when AWS rate limits are hit, which is useful when many
+            threads share a client. If None botocore default is used.
+        :type retry_mode: str | None
+        :param max_attempts: maximum number of attempts of a request. If None
+            the default of the retry mode is used.
+        :type max_attempts: int | None
         """
-        self.session = botocore.session.get_session()
-        if regions is None:
-            self.regions = [self.session.region_name]
-        else:
-            self.regions = regions
+        self._session = None
+        self._regions = regions
         self.default_region = None
         self.force_stub = stub
         self.clients = {}
         self.stubbers = {}
+        self.endpoint_urls = endpoint_urls or {}
+        self.client_config = {}
+        if max_pool_connections is not None:
+            self.client_config['max_pool_connections'] = max_pool_connections
+        if retry_mode is not None or max_attempts is not None:
+            self.client_config['retries'] = {}
+            if retry_mode is not None:
+                self.client_config['retries']['mode'] = retry_mode
+            if max_attempts is not None:
+                self.client_config['retries']['max_attempts'] = max_attempts
+        # Clients can be shared between threads but their creation is not
+        # thread safe.
+        self.lock = threading.Lock()
         env = Env()
         env.aws_env = self
 
+    @property
+    def session(self):
+        """Return the botocore session, creating it if needed.
+
+        :rtype: botocore.session.Session
+        """
+        if self._session is None:
+            import botocore.session
+            self._session = botocore.session.get_session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    @property
+    def regions(self):
+        """Return the list of regions.
+
+        If no region was passed to the constructor, this is the region of
+        the session configuration.
+
+        :rtype: list[str]
+        """
+        if self._regions is None:
+            self._regions = [self.session.region_name]
+        return self._regions
+
+    @regions.setter
+    def regions(self, regions):
+        self._regions = regions
+
+    @property
+    def config(self):
+        """Return the configuration of the clients.
+
+        :rtype: botocore.config.Config | None
+        """
+        if not self.client_config:
+            return None
+        from botocore.config import Config
+        return Config(**self.client_config)
+
     def stub(self, name, region=None):
         """Return stub for a given client.
 
@@ -69,19 +141,24 @@ class AWSEnv(object):
 
         assert region is not None, 'no region or default_region set'
 
-        if name not in self.clients:
-            self.clients[name] = {}
-            self.stubbers[name] = {}
+        with self.lock:
+            if name not in self.clients:
+                self.clients[name] = {}
+                self.stubbers[name] = {}
 
-        if region not in self.clients[name]:
-            self.clients[name][region] = \
-                self.session.create_client(name, region_name=region)
-            if self.force_stub:
-                self.stubbers[name][region] = \
-                    Stubber(self.clients[name][region])
-                self.stubbers[name][region].activate()
+            if region not in self.clients[name]:
+                self.clients[name][region] = self.session.create_client(
+                    name,
+                    region_name=region,
+                    endpoint_url=self.endpoint_urls.get(name),
+                    config=self.config)
+                if self.force_stub:
+                    from botocore.stub import Stubber
+                    self.stubbers[name][region] = \
+                        Stubber(self.clients[name][region])
+                    self.stubbers[name][region].activate()
 
-        return self.clients[name][region]
+            return self.clients[name][region]
 
 
 class default_region(object):
@@ -111,13 +188,16 @@ def client(name):
 
     The function in input should take a mandatory argument called client.
     The function seen by the user will have an optional argument region
-    to select the region in which the client is created.
+    to select the region in which the client is created, or can be passed
+    an existing client.
 
     :param name: client name
     :type name: str
     """
     def decorator(func):
         def wrapper(*args, **kwargs):
+            if 'client' in kwargs:
+                return func(*args, **kwargs)
             aws_env = Env().aws_env
             if 'region' in kwargs:
                 region = kwargs['region']
@@ -1,4 +1,5 @@
 from e3.aws import client
+from e3.aws.cfn.fragment import FragmentPool, FrozenDict, FrozenList
 from enum import Enum
 import re
 import yaml
@@ -11,8 +12,12 @@ VALID_STACK_NAME_MAX_LEN = 128
 class AWSType(Enum):
     """Cloud Formation resource types."""
 
+    AUTOSCALING_GROUP = 'AWS::AutoScaling::AutoScalingGroup'
+    AUTOSCALING_SCALING_POLICY = 'AWS::AutoScaling::ScalingPolicy'
     EC2_INSTANCE = 'AWS::EC2::Instance'
     EC2_INTERNET_GATEWAY = 'AWS::EC2::InternetGateway'
+    EC2_LAUNCH_TEMPLATE = 'AWS::EC2::LaunchTemplate'
+    EC2_PLACEMENT_GROUP = 'AWS::EC2::PlacementGroup'
     EC2_ROUTE = 'AWS::EC2::Route'
     EC2_ROUTE_TABLE = 'AWS::EC2::RouteTable'
     EC2_SECURITY_GROUP = 'AWS::EC2::SecurityGroup'
@@ -21,11 +26,14 @@ class AWSType(Enum):
         'AWS::EC2::SubnetRouteTableAssociation'
     EC2_VOLUME = 'AWS::EC2::Volume'
     EC2_VPC = 'AWS::EC2::VPC'
+    EC2_VPC_ENDPOINT = 'AWS::EC2::VPCEndpoint'
     EC2_VPC_GATEWAY_ATTACHMENT = 'AWS::EC2::VPCGatewayAttachment'
     IAM_ROLE = 'AWS::IAM::Role'
     IAM_POLICY = 'AWS::IAM::Policy'
     IAM_INSTANCE_PROFILE = 'AWS::IAM::InstanceProfile'
+    ROUTE53_HEALTH_CHECK = 'AWS::Route53::HealthCheck'
     ROUTE53_RECORDSET = 'AWS::Route53::RecordSet'
+    ROUTE53_RECORDSET_GROUP = 'AWS::Route53::RecordSetGroup'
     S3_BUCKET = 'AWS::S3::Bucket'
 
 
@@ -68,6 +76,38 @@ class Base64(object):
         self.content = content
 
 
+class FindInMap(object):
+    """Intrinsic function Fn::FindInMap."""
+
+    def __init__(self, map_name, top_level_key, second_level_key):
+        """Initialize a mapping lookup.
+
+        :param map_name: name of a mapping declared in the stack
+        :type map_name: str
+        :param top_level_key: top level key in the mapping
+        :type top_level_key: str
+        :param second_level_key: second level key in the mapping
+        :type second_level_key: str
+        """
+        self.map_name = map_name
+        self.top_level_key = top_level_key
+        self.second_level_key = second_level_key
+
+
+class Sub(object):
+    """Intrinsic function Fn::Sub."""
+
+    def __init__(self, content):
+        """Initialize a substitution.
+
+        :param content: a string containing ${Name} variables where Name is
+            a parameter, a resource logical name or a pseudo parameter such
+            as AWS::Region
+        :type content: str
+        """
+        self.content = content
+
+
 # Declare Yaml representer for intrinsic functions
 
 def getatt_representer(dumper, data):
@@ -80,12 +120,50 @@ def ref_representer(dumper, data):
 
 
 def base64_representer(dumper, data):
-    return dumper.represent_scalar('!Base64', data.content)
+    if isinstance(data.content, str):
+        return dumper.represent_scalar('!Base64', data.content)
+    # The short form cannot directly contain the short form of another
+    # intrinsic function.
+    return dumper.represent_dict({'Fn::Base64': data.content})
+
+
+def findinmap_representer(dumper, data):
+    return dumper.represent_sequence(
+        '!FindInMap',
+        [data.map_name, data.top_level_key, data.second_level_key])
+
+
+def sub_representer(dumper, data):
+    return dumper.represent_scalar('!Sub', data.content)
 
 
 yaml.add_representer(GetAtt, getatt_representer)
 yaml.add_representer(Ref, ref_representer)
 yaml.add_representer(Base64, base64_representer)
+yaml.add_representer(FindInMap, findinmap_representer)
+yaml.add_representer(Sub, sub_representer)
+
+
+class TemplateDumper(yaml.Dumper):
+    """YAML dumper used to serialize templates.
+
+    Objects shared between resources (see Stack.export) are written in
+    full each time instead of using YAML anchors and aliases, which are
+    not supported by CloudFormation. The YAML nodes of shared fragments,
+    which are read-only, are built once and reused for each occurrence.
+    """
+
+    def ignore_aliases(self, data):
+        # Only shared fragments are tracked by the representer
+        return not isinstance(data, (FrozenDict, FrozenList))
+
+    def generate_anchor(self, node):
+        return None
+
+    def serialize_node(self, node, parent, index):
+        # Nodes occurring several times are serialized in full each time
+        self.serialized_nodes.pop(node, None)
+        super(TemplateDumper, self).serialize_node(node, parent, index)
 
 
 class Resource(object):
@@ -171,8 +249,11 @@ class Stack(object):
             len(name) <= VALID_STACK_NAME_MAX_LEN, \
             'invalid stack name: %s' % name
         self.resources = {}
+        self.mappings = {}
         self.name = name
         self.description = description
+        # Map logical names of removed resources to (new name, Ref value)
+        self.references = {}
 
     def add(self, element):
         """Add a resource or merge a stack.
@@ -194,8 +275,95 @@ class Stack(object):
                 assert element.name not in self.resources, \
                     'resource already exist: %s' % resource.name
                 self.resources[resource.name] = resource
+            self.references.update(element.references)
+            for map_name, mapping in element.mappings.items():
+                for key, values in mapping.items():
+                    self.add_mapping(map_name, key, values)
         return self
 
+    def add_mapping(self, map_name, key, values):
+        """Add an entry to a mapping of the stack.
+
+        :param map_name: name of the mapping (alphanumeric)
+        :type map_name: str
+        :param key: top level key of the entry (alphanumeric)
+        :type key: str
+        :param values: dict associating second level keys to values
+        :type values: dict
+        :return: a dict associating each second level key to a FindInMap
+            returning the corresponding value
+        :rtype: dict
+        """
+        assert map_name.isalnum() and key.isalnum(), \
+            'invalid mapping key %s.%s' % (map_name, key)
+        mapping = self.mappings.setdefault(map_name, {})
+        assert mapping.get(key, values) == values, \
+            'mapping entry already exist: %s.%s' % (map_name, key)
+        mapping[key] = values
+        return {k: FindInMap(map_name, key, k) for k in values}
+
+    def remove(self, name, new_name, ref=None):
+        """Remove a resource and redirect references to it.
+
+        In the exported template, GetAtt and DependsOn targeting the removed
+        resource are rewritten to target new_name.
+
+        :param name: logical name of the resource to remove
+        :type name: str
+        :param new_name: logical name of the resource replacing it
+        :type new_name: str
+        :param ref: value that replaces Ref to the removed resource. If None
+            Ref are rewritten to target new_name.
+        :type ref: T | None
+        :return: the removed resource
+        :rtype: Resource
+        """
+        resource = self.resources.pop(name)
+        self.references[name] = (new_name, ref)
+        for old_name, (target, old_ref) in list(self.references.items()):
+            if target == name:
+                self.references[old_name] = (new_name, old_ref)
+        return resource
+
+    def _rewrite(self, value):
+        """Rewrite references to removed resources.
+
+        :param value: a template fragment
+        :type value: T
+        :rtype: T
+        """
+        if isinstance(value, dict):
+            return {k: self._rewrite(v) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [self._rewrite(v) for v in value]
+        elif isinstance(value, Ref) and value.name in self.references:
+            new_name, ref = self.references[value.name]
+            return Ref(new_name) if ref is None else ref
+        elif isinstance(value, GetAtt) and value.name in self.references:
+            return GetAtt(self.references[value.name][0], value.attribute)
+        return value
+
+    def _export_resource(self, resource):
+        result = resource.export()
+        if not self.references:
+            return result
+        result = self._rewrite(result)
+        if 'DependsOn' in result:
+            depends = result['DependsOn']
+            if isinstance(depends, str):
+                depends = [depends]
+            depends = [self.references.get(d, (d, None))[0]
+                       for d in depends]
+            depends = [d for i, d in enumerate(depends)
+                       if d != resource.name and d not in depends[:i]]
+            if not depends:
+                del result['DependsOn']
+            elif len(depends) == 1:
+                result['DependsOn'] = depends[0]
+            else:
+                result['DependsOn'] = depends
+        return result
+
     def __iadd__(self, element):
         """Add a resource or merge a stack.
 
@@ -212,16 +380,27 @@ class Stack(object):
             raise KeyError
         return self.resources[key]
 
-    def export(self):
+    def export(self, dedup=False):
         """Export stack as dict.
 
+        :param dedup: if True structurally equal fragments of the resources
+            are shared (see e3.aws.cfn.fragment). Resource fragments are
+            then read-only and should be copied before being modified.
+            body uses it to represent identical fragments once.
+        :type dedup: bool
         :return: a dict that can be serialized as YAML to produce a template
         :rtype: dict
         """
+        resources = {v.name: self._export_resource(v)
+                     for v in list(self.resources.values())}
+        if dedup:
+            pool = FragmentPool()
+            resources = {k: pool.intern(v) for k, v in resources.items()}
         result = {
             'AWSTemplateFormatVersion': '2010-09-09',
-            'Resources': {v.name: v.export()
-                          for v in list(self.resources.values())}}
+            'Resources': resources}
+        if self.mappings:
+            result['Mappings'] = self.mappings
         if self.description is not None:
             result['Description'] = self.description
         return result
@@ -230,10 +409,13 @@ class Stack(object):
     def body(self):
         """Export stack as a CloudFormation template.
 
+        Fragments shared by several resources (see export) are converted
+        to YAML nodes once.
+
         :return: a valid CloudFormation template
         :rtype: str
         """
-        return yaml.dump(self.export())
+        return yaml.dump(self.export(dedup=True), Dumper=TemplateDumper)
 
     @client('cloudformation')
     def create(self, client):
@@ -248,7 +430,7 @@ class Stack(object):
                                    Capabilities=['CAPABILITY_IAM'])
 
     @client('cloudformation')
-    def create_change_set(self, client, name):
+    def create_change_set(self, client, name, change_set_type=None):
         """Create a change set.
 
         This creates a difference between the state of the stack on AWS servers
@@ -258,11 +440,18 @@ class Stack(object):
         :type client: botocore.client.Client
         :param name: name of the changeset
         :type name: str
+        :param change_set_type: CREATE for a stack that does not exist yet,
+            UPDATE (the default) otherwise
+        :type change_set_type: str | None
         """
+        kwargs = {}
+        if change_set_type is not None:
+            kwargs['ChangeSetType'] = change_set_type
         return client.create_change_set(ChangeSetName=name,
                                         StackName=self.name,
                                         TemplateBody=self.body,
-                                        Capabilities=['CAPABILITY_IAM'])
+                                        Capabilities=['CAPABILITY_IAM'],
+                                        **kwargs)
 
     @client('cloudformation')
     def delete(self, client):
@@ -279,6 +468,9 @@ class Stack(object):
     def cost(self, client):
         """Compute cost of the stack (estimation).
 
+        This returns the URL of an AWS calculator page. See
+        e3.aws.cfn.cost.estimate_cost for an offline estimate.
+
         :param client: a botocore client
         :type client: botocore.client.BaseClient
         """
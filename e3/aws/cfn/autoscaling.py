@@ -0,0 +1,284 @@
+from e3.aws.cfn import AWSType, Resource
+from e3.aws.cfn.ec2 import LaunchTemplate, Subnet
+
+
+class InstancesDistribution(object):
+    """On-Demand/Spot distribution of a mixed instances policy."""
+
+    SPOT_ALLOCATION_STRATEGIES = ('capacity-optimized',
+                                  'capacity-optimized-prioritized',
+                                  'lowest-price',
+                                  'price-capacity-optimized')
+
+    def __init__(self,
+                 on_demand_base_capacity=0,
+                 on_demand_percentage=100,
+                 spot_allocation_strategy='price-capacity-optimized',
+                 spot_max_price=None):
+        """Initialize an instances distribution.
+
+        :param on_demand_base_capacity: minimum number of On-Demand
+            instances
+        :type on_demand_base_capacity: int
+        :param on_demand_percentage: percentage of On-Demand instances
+            above the base capacity, the rest being Spot instances
+        :type on_demand_percentage: int
+        :param spot_allocation_strategy: one of SPOT_ALLOCATION_STRATEGIES
+        :type spot_allocation_strategy: str
+        :param spot_max_price: maximum price per hour for Spot instances.
+            If None the On-Demand price is used
+        :type spot_max_price: str | None
+        """
+        assert on_demand_base_capacity >= 0
+        assert 0 <= on_demand_percentage <= 100, \
+            'invalid On-Demand percentage %s' % on_demand_percentage
+        assert spot_allocation_strategy in self.SPOT_ALLOCATION_STRATEGIES, \
+            'invalid Spot allocation strategy %s' % spot_allocation_strategy
+        self.on_demand_base_capacity = on_demand_base_capacity
+        self.on_demand_percentage = on_demand_percentage
+        self.spot_allocation_strategy = spot_allocation_strategy
+        self.spot_max_price = spot_max_price
+
+    @property
+    def properties(self):
+        result = {
+            'OnDemandBaseCapacity': self.on_demand_base_capacity,
+            'OnDemandPercentageAboveBaseCapacity': self.on_demand_percentage,
+            'SpotAllocationStrategy': self.spot_allocation_strategy}
+        if self.spot_max_price is not None:
+            result['SpotMaxPrice'] = self.spot_max_price
+        return result
+
+
+class AutoScalingGroup(Resource):
+    """Auto Scaling group."""
+
+    # Maximum number of instance types in a mixed instances policy
+    MAX_INSTANCE_TYPES = 40
+
+    def __init__(self, name, launch_template, subnets,
+                 min_size=0,
+                 max_size=1,
+                 desired_capacity=None,
+                 instance_types=None,
+                 distribution=None,
+                 capacity_rebalance=None,
+                 health_check_grace_period=None):
+        """Initialize an Auto Scaling group.
+
+        :param name: logical name in stack
+        :type name: str
+        :param launch_template: template used to launch instances
+        :type launch_template: e3.aws.cfn.ec2.LaunchTemplate
+        :param subnets: subnets in which instances are launched
+        :type subnets: list[e3.aws.cfn.ec2.Subnet]
+        :param min_size: minimum number of instances
+        :type min_size: int
+        :param max_size: maximum number of instances
+        :type max_size: int
+        :param desired_capacity: initial number of instances. If None
+            min_size is used
+        :type desired_capacity: int | None
+        :param instance_types: if not None, instance types overriding the
+            launch template one in a mixed instances policy
+        :type instance_types: list[str] | None
+        :param distribution: if not None, On-Demand/Spot distribution of a
+            mixed instances policy
+        :type distribution: InstancesDistribution | None
+        :param capacity_rebalance: if True, Spot instances at an elevated
+            risk of interruption are replaced proactively
+        :type capacity_rebalance: bool | None
+        :param health_check_grace_period: time in seconds before checking
+            the health of a new instance
+        :type health_check_grace_period: int | None
+        """
+        super(AutoScalingGroup, self).__init__(
+            name, kind=AWSType.AUTOSCALING_GROUP)
+        assert isinstance(launch_template, LaunchTemplate)
+        assert subnets and all(isinstance(s, Subnet) for s in subnets), \
+            'at least one subnet is expected'
+        assert 0 <= min_size <= max_size, \
+            'invalid size range %s-%s' % (min_size, max_size)
+        assert desired_capacity is None or \
+            min_size <= desired_capacity <= max_size, \
+            'desired capacity %s not in %s-%s' % (desired_capacity,
+                                                  min_size, max_size)
+        assert instance_types is None or \
+            0 < len(instance_types) <= self.MAX_INSTANCE_TYPES, \
+            'between 1 and %s instance types are expected' % \
+            self.MAX_INSTANCE_TYPES
+        assert distribution is None or \
+            isinstance(distribution, InstancesDistribution)
+        self.launch_template = launch_template
+        self.subnets = subnets
+        self.min_size = min_size
+        self.max_size = max_size
+        self.desired_capacity = desired_capacity
+        self.instance_types = instance_types
+        self.distribution = distribution
+        self.capacity_rebalance = capacity_rebalance
+        self.health_check_grace_period = health_check_grace_period
+        self.metrics = []
+
+    def enable_metrics(self, *metrics):
+        """Enable collection of group metrics.
+
+        :param metrics: metric names (e.g. GroupInServiceInstances)
+        :type metrics: list[str]
+        :return: the group itself
+        :rtype: AutoScalingGroup
+        """
+        for metric in metrics:
+            if metric not in self.metrics:
+                self.metrics.append(metric)
+        return self
+
+    @property
+    def properties(self):
+        result = {'MinSize': str(self.min_size),
+                  'MaxSize': str(self.max_size),
+                  'VPCZoneIdentifier': [s.ref for s in self.subnets]}
+        if self.desired_capacity is not None:
+            result['DesiredCapacity'] = str(self.desired_capacity)
+        if self.instance_types is None and self.distribution is None:
+            result['LaunchTemplate'] = self.launch_template.specification
+        else:
+            template = {'LaunchTemplateSpecification':
+                        self.launch_template.specification}
+            if self.instance_types is not None:
+                template['Overrides'] = [{'InstanceType': t}
+                                         for t in self.instance_types]
+            policy = {'LaunchTemplate': template}
+            if self.distribution is not None:
+                policy['InstancesDistribution'] = \
+                    self.distribution.properties
+            result['MixedInstancesPolicy'] = policy
+        if self.capacity_rebalance is not None:
+            result['CapacityRebalance'] = self.capacity_rebalance
+        if self.health_check_grace_period is not None:
+            result['HealthCheckGracePeriod'] = self.health_check_grace_period
+        if self.metrics:
+            result['MetricsCollection'] = [{'Granularity': '1Minute',
+                                            'Metrics': self.metrics}]
+        return result
+
+
+class TargetTrackingPolicy(Resource):
+    """Target tracking scaling policy of an Auto Scaling group."""
+
+    PREDEFINED_METRICS = ('ASGAverageCPUUtilization',
+                          'ASGAverageNetworkIn',
+                          'ASGAverageNetworkOut',
+                          'ALBRequestCountPerTarget')
+
+    def __init__(self, name, group, target_value,
+                 predefined_metric=None,
+                 metrics=None,
+                 disable_scale_in=None,
+                 resource_label=None):
+        """Initialize a target tracking scaling policy.
+
+        :param name: logical name in stack
+        :type name: str
+        :param group: the Auto Scaling group to scale
+        :type group: AutoScalingGroup
+        :param target_value: value of the metric to maintain
+        :type target_value: float
+        :param predefined_metric: one of PREDEFINED_METRICS
+        :type predefined_metric: str | None
+        :param metrics: a customized metric as a list of CloudWatch metric
+            data queries (see MetricDataQuery in AWS documentation). Exactly
+            one of predefined_metric and metrics should be set.
+        :type metrics: list[dict] | None
+        :param disable_scale_in: if True the policy never removes instances
+        :type disable_scale_in: bool | None
+        :param resource_label: target group of the ALBRequestCountPerTarget
+            metric, in the form app/<load balancer name>/<id>/targetgroup/
+            <target group name>/<id>. Required for that metric only.
+        :type resource_label: str | e3.aws.cfn.Sub | None
+        """
+        super(TargetTrackingPolicy, self).__init__(
+            name, kind=AWSType.AUTOSCALING_SCALING_POLICY)
+        assert isinstance(group, AutoScalingGroup)
+        assert (predefined_metric is None) != (metrics is None), \
+            'either predefined_metric or metrics should be set'
+        assert predefined_metric is None or \
+            predefined_metric in self.PREDEFINED_METRICS, \
+            'invalid predefined metric %s' % predefined_metric
+        assert metrics is None or \
+            len([m for m in metrics if m.get('ReturnData', True)]) == 1, \
+            'exactly one metric query should return data'
+        assert (resource_label is not None) == \
+            (predefined_metric == 'ALBRequestCountPerTarget'), \
+            'resource_label is required by ALBRequestCountPerTarget only'
+        self.group = group
+        self.target_value = target_value
+        self.predefined_metric = predefined_metric
+        self.metrics = metrics
+        self.disable_scale_in = disable_scale_in
+        self.resource_label = resource_label
+
+    @property
+    def properties(self):
+        configuration = {'TargetValue': self.target_value}
+        if self.predefined_metric is not None:
+            configuration['PredefinedMetricSpecification'] = {
+                'PredefinedMetricType': self.predefined_metric}
+            if self.resource_label is not None:
+                configuration['PredefinedMetricSpecification'][
+                    'ResourceLabel'] = self.resource_label
+        else:
+            configuration['CustomizedMetricSpecification'] = {
+                'Metrics': self.metrics}
+        if self.disable_scale_in is not None:
+            configuration['DisableScaleIn'] = self.disable_scale_in
+        return {'AutoScalingGroupName': self.group.ref,
+                'PolicyType': 'TargetTrackingScaling',
+                'TargetTrackingConfiguration': configuration}
+
+
+def queue_backlog_policy(name, group, queue_name, backlog_per_instance):
+    """Create a policy scaling a group with the backlog of a SQS queue.
+
+    The tracked metric is the number of visible messages in the queue
+    divided by the number of in service instances of the group. Collection
+    of the GroupInServiceInstances metric is enabled on the group.
+
+    :param name: logical name of the policy in stack
+    :type name: str
+    :param group: the Auto Scaling group to scale
+    :type group: AutoScalingGroup
+    :param queue_name: name of the SQS queue
+    :type queue_name: str
+    :param backlog_per_instance: number of messages an instance can handle
+        within the acceptable latency
+    :type backlog_per_instance: float
+    :return: a target tracking policy
+    :rtype: TargetTrackingPolicy
+    """
+    group.enable_metrics('GroupInServiceInstances')
+    metrics = [
+        {'Id': 'messages',
+         'MetricStat': {
+             'Metric': {
+                 'Namespace': 'AWS/SQS',
+                 'MetricName': 'ApproximateNumberOfMessagesVisible',
+                 'Dimensions': [{'Name': 'QueueName',
+                                 'Value': queue_name}]},
+             'Stat': 'Sum'},
+         'ReturnData': False},
+        {'Id': 'instances',
+         'MetricStat': {
+             'Metric': {
+                 'Namespace': 'AWS/AutoScaling',
+                 'MetricName': 'GroupInServiceInstances',
+                 'Dimensions': [{'Name': 'AutoScalingGroupName',
+                                 'Value': group.ref}]},
+             'Stat': 'Average'},
+         'ReturnData': False},
+        {'Id': 'backlog',
+         'Expression': 'messages / instances',
+         'Label': 'Backlog per instance',
+         'ReturnData': True}]
+    return TargetTrackingPolicy(name, group, backlog_per_instance,
+                                metrics=metrics)
@@ -0,0 +1,268 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+from e3.aws import client
+from e3.aws.poll import Backoff
+
+# Status reasons of change sets failing because they contain no change
+NO_CHANGE_REASONS = ("didn't contain changes",
+                     'No updates are to be performed')
+
+
+class ChangeSetTimeout(Exception):
+    """Raised when a change set or a stack operation takes too long."""
+
+
+def wait_change_set(client, stack_name, name, timeout=600, poll_interval=2,
+                    max_poll_interval=30):
+    """Wait for the creation of a change set.
+
+    :param client: a cloudformation client
+    :type client: botocore.client.BaseClient
+    :param stack_name: name of the stack
+    :type stack_name: str
+    :param name: name of the change set
+    :type name: str
+    :param timeout: maximum number of seconds to wait
+    :type timeout: int
+    :param poll_interval: initial delay between two describe_change_set
+    :type poll_interval: float
+    :param max_poll_interval: maximum delay between two describe_change_set
+    :type max_poll_interval: float
+    :return: the result of describe_change_set, Changes containing the
+        changes of all pages
+    :rtype: dict
+    :raise: ChangeSetTimeout if the change set is not created in time
+    """
+    delays = Backoff(poll_interval, max_poll_interval, timeout)
+    while True:
+        if not delays.wait():
+            raise ChangeSetTimeout('timeout waiting for change set %s' %
+                                   name)
+        result = client.describe_change_set(ChangeSetName=name,
+                                            StackName=stack_name)
+        if result['Status'] not in ('CREATE_PENDING', 'CREATE_IN_PROGRESS'):
+            break
+
+    while 'NextToken' in result:
+        page = client.describe_change_set(ChangeSetName=name,
+                                          StackName=stack_name,
+                                          NextToken=result.pop('NextToken'))
+        result['Changes'].extend(page['Changes'])
+        if 'NextToken' in page:
+            result['NextToken'] = page['NextToken']
+    return result
+
+
+def _new_events(client, stack_name, last_event_id):
+    """Return the events of a stack more recent than a given one.
+
+    :return: the events, oldest first. If last_event_id is None all the
+        events are returned.
+    :rtype: list[dict]
+    """
+    result = []
+    paginator = client.get_paginator('describe_stack_events')
+    for page in paginator.paginate(StackName=stack_name):
+        for event in page['StackEvents']:
+            if event['EventId'] == last_event_id:
+                return result[::-1]
+            result.append(event)
+    return result[::-1]
+
+
+def stream_stack_events(client, stack_name, last_event_id, callback=None,
+                        timeout=3600, poll_interval=5, max_poll_interval=30):
+    """Follow the events of a stack until its operation completes.
+
+    :param client: a cloudformation client
+    :type client: botocore.client.BaseClient
+    :param stack_name: name of the stack
+    :type stack_name: str
+    :param last_event_id: id of the last event before the operation
+    :type last_event_id: str | None
+    :param callback: if not None, called with each new event
+    :type callback: (dict) -> None | None
+    :param timeout: maximum number of seconds to wait
+    :type timeout: int
+    :param poll_interval: initial delay between two describe_stack_events
+    :type poll_interval: float
+    :param max_poll_interval: maximum delay between two
+        describe_stack_events
+    :type max_poll_interval: float
+    :return: the events of the operation, oldest first
+    :rtype: list[dict]
+    :raise: ChangeSetTimeout if the operation does not complete in time
+    """
+    result = []
+    delays = Backoff(poll_interval, max_poll_interval, timeout)
+    events = []
+    while True:
+        if not delays.wait(bool(events)):
+            raise ChangeSetTimeout('timeout waiting for stack %s' %
+                                   stack_name)
+        events = _new_events(client, stack_name, last_event_id)
+        for event in events:
+            result.append(event)
+            if callback is not None:
+                callback(event)
+            if event['ResourceType'] == 'AWS::CloudFormation::Stack' and \
+                    event['LogicalResourceId'] == stack_name and \
+                    'IN_PROGRESS' not in event['ResourceStatus']:
+                return result
+        if events:
+            last_event_id = events[-1]['EventId']
+
+
+class ChangeSetResult(object):
+    """Result of the processing of a change set."""
+
+    def __init__(self, stack_name, name):
+        """Initialize a change set result.
+
+        :param stack_name: name of the stack
+        :type stack_name: str
+        :param name: name of the change set
+        :type name: str
+        """
+        self.stack_name = stack_name
+        self.name = name
+        self.changes = []
+        self.empty = False
+        self.executed = False
+        self.events = []
+        self.error = None
+
+    @property
+    def stack_status(self):
+        """Return the stack status at the end of the execution.
+
+        :rtype: str | None
+        """
+        if not self.events:
+            return None
+        return self.events[-1]['ResourceStatus']
+
+    @property
+    def success(self):
+        if self.error is not None:
+            return False
+        return self.stack_status in (None, 'CREATE_COMPLETE',
+                                     'UPDATE_COMPLETE')
+
+    def __str__(self):
+        if self.error is not None:
+            return '%s: FAILED: %s' % (self.stack_name, self.error)
+        elif self.empty:
+            return '%s: no change' % self.stack_name
+        result = ['%s: %s change(s)%s' % (
+            self.stack_name, len(self.changes),
+            ', %s' % self.stack_status if self.executed else '')]
+        for change in self.changes:
+            change = change['ResourceChange']
+            result.append('  %-8s %-40s %s' % (
+                change['Action'], change['LogicalResourceId'],
+                change['ResourceType']))
+        return '\n'.join(result)
+
+
+def process_change_set(client, stack, name, execute=True, callback=None,
+                       change_set_type=None, timeout=3600, poll_interval=2):
+    """Create a change set, wait for it and optionally execute it.
+
+    Change sets without changes are deleted.
+
+    :param client: a cloudformation client
+    :type client: botocore.client.BaseClient
+    :param stack: the stack
+    :type stack: e3.aws.cfn.Stack
+    :param name: name of the change set
+    :type name: str
+    :param execute: if True execute the change set and wait for the end of
+        the stack operation
+    :type execute: bool
+    :param callback: if not None, called with each stack event
+    :type callback: (dict) -> None | None
+    :param change_set_type: see Stack.create_change_set
+    :type change_set_type: str | None
+    :param timeout: maximum number of seconds for the stack operation
+    :type timeout: int
+    :param poll_interval: initial delay between two polling requests
+    :type poll_interval: float
+    :rtype: ChangeSetResult
+    """
+    result = ChangeSetResult(stack.name, name)
+    try:
+        stack.create_change_set(name=name, change_set_type=change_set_type,
+                                client=client)
+        change_set = wait_change_set(client, stack.name, name,
+                                     poll_interval=poll_interval)
+        if change_set['Status'] == 'FAILED':
+            reason = change_set.get('StatusReason', '')
+            if any(r in reason for r in NO_CHANGE_REASONS):
+                result.empty = True
+                client.delete_change_set(ChangeSetName=name,
+                                         StackName=stack.name)
+                return result
+            raise Exception('change set failed: %s' % reason)
+        result.changes = change_set['Changes']
+
+        if execute:
+            last_event_id = None
+            if change_set_type != 'CREATE':
+                events = client.describe_stack_events(
+                    StackName=stack.name)['StackEvents']
+                if events:
+                    last_event_id = events[0]['EventId']
+            client.execute_change_set(ChangeSetName=name,
+                                      StackName=stack.name)
+            result.executed = True
+            result.events = stream_stack_events(
+                client, stack.name, last_event_id, callback=callback,
+                timeout=timeout, poll_interval=poll_interval)
+    except Exception as e:
+        result.error = e
+    return result
+
+
+@client('cloudformation')
+def process_change_sets(stacks, client, name, execute=True, callback=None,
+                        change_set_type=None, timeout=3600, poll_interval=2,
+                        max_workers=8):
+    """Process the change sets of several stacks concurrently.
+
+    :param stacks: list of stacks
+    :type stacks: list[e3.aws.cfn.Stack]
+    :param client: a botocore client
+    :type client: botocore.client.BaseClient
+    :param name: name of the change sets
+    :type name: str
+    :param execute: see process_change_set
+    :type execute: bool
+    :param callback: if not None, called with the stack name and each
+        stack event. Calls come from different threads.
+    :type callback: (str, dict) -> None | None
+    :param change_set_type: see Stack.create_change_set
+    :type change_set_type: str | None
+    :param timeout: see process_change_set
+    :type timeout: int
+    :param poll_interval: see process_change_set
+    :type poll_interval: float
+    :param max_workers: maximum number of stacks processed concurrently
+    :type max_workers: int
+    :return: a dict associating stack names to their ChangeSetResult
+    :rtype: dict
+    """
+    def process(stack):
+        stack_callback = None
+        if callback is not None:
+            stack_callback = functools.partial(callback, stack.name)
+        return process_change_set(client, stack, name, execute=execute,
+                                  callback=stack_callback,
+                                  change_set_type=change_set_type,
+                                  timeout=timeout,
+                                  poll_interval=poll_interval)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process, stacks))
+    return {result.stack_name: result for result in results}
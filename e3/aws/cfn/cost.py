@@ -0,0 +1,267 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+from e3.aws import client
+from e3.aws.cfn import AWSType, TemplateDumper
+import yaml
+
+PRICE_TABLE = os.path.join(os.path.dirname(__file__), 'prices.yaml')
+
+# Number of hours in a month used to convert hourly prices
+HOURS_PER_MONTH = 730
+
+# Baseline performance of gp3 volumes, included in the storage price
+GP3_BASELINE_IOPS = 3000
+GP3_BASELINE_THROUGHPUT = 125
+
+# Results of estimate_cost indexed by cache key, least recently used first
+_CACHE = OrderedDict()
+
+# Maximum number of results kept in memory
+MAX_CACHE_SIZE = 256
+
+
+def load_price_table(path=PRICE_TABLE):
+    """Load a price table.
+
+    :param path: path to the table (see prices.yaml)
+    :type path: str
+    :rtype: dict
+    """
+    with open(path) as fd:
+        return yaml.safe_load(fd)
+
+
+def save_price_table(table, path):
+    """Save a price table.
+
+    :param table: a price table
+    :type table: dict
+    :param path: path to the table file
+    :type path: str
+    """
+    with open(path, 'w') as fd:
+        yaml.safe_dump(table, fd, default_flow_style=False)
+
+
+@client('pricing')
+def update_price_table(table, regions, client, instance_types=None,
+                       date=None):
+    """Refresh the instance prices of a price table using AWS Price List API.
+
+    Note that the Price List API is only available in a few regions such as
+    us-east-1, which should be passed as region argument.
+
+    :param table: a price table, updated in place
+    :type table: dict
+    :param regions: regions whose prices are updated
+    :type regions: list[str]
+    :param client: a botocore client
+    :type client: botocore.client.BaseClient
+    :param instance_types: instance types to update. If None update the
+        instance types already in the table for each region
+    :type instance_types: list[str] | None
+    :param date: date of the prices
+    :type date: str | None
+    :return: the table
+    :rtype: dict
+    """
+    for region in regions:
+        prices = table['regions'].setdefault(region, {}).setdefault('ec2', {})
+        for instance_type in instance_types or sorted(prices):
+            products = client.get_products(
+                ServiceCode='AmazonEC2',
+                Filters=[{'Type': 'TERM_MATCH', 'Field': field,
+                          'Value': value} for field, value in (
+                    ('regionCode', region),
+                    ('instanceType', instance_type),
+                    ('operatingSystem', 'Linux'),
+                    ('tenancy', 'Shared'),
+                    ('preInstalledSw', 'NA'),
+                    ('capacitystatus', 'Used'))])['PriceList']
+            for product in products:
+                product = json.loads(product)
+                for term in product['terms'].get('OnDemand', {}).values():
+                    for dimension in term['priceDimensions'].values():
+                        price = float(dimension['pricePerUnit']['USD'])
+                        if price > 0:
+                            prices[instance_type] = price
+    if date is not None:
+        table['date'] = date
+    return table
+
+
+class CostEstimate(object):
+    """Monthly cost estimate of a stack."""
+
+    def __init__(self, currency='USD', resources=None, unpriced=None):
+        """Initialize an estimate.
+
+        :param currency: currency of the prices
+        :type currency: str
+        :param resources: dict associating resource names to a list of
+            (description, monthly cost)
+        :type resources: dict | None
+        :param unpriced: names of the resources whose price is unknown
+        :type unpriced: list[str] | None
+        """
+        self.currency = currency
+        self.resources = resources or {}
+        self.unpriced = unpriced or []
+
+    def add(self, name, description, monthly_cost):
+        self.resources.setdefault(name, []).append(
+            (description, round(monthly_cost, 4)))
+
+    def resource_cost(self, name):
+        """Return the monthly cost of a resource.
+
+        :rtype: float
+        """
+        return round(sum(c for _, c in self.resources.get(name, [])), 4)
+
+    @property
+    def total(self):
+        return round(sum(self.resource_cost(name)
+                         for name in self.resources), 4)
+
+    def as_dict(self):
+        return {'currency': self.currency,
+                'resources': self.resources,
+                'unpriced': self.unpriced}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(currency=data['currency'],
+                   resources={k: [tuple(item) for item in v]
+                              for k, v in data['resources'].items()},
+                   unpriced=list(data['unpriced']))
+
+    def __str__(self):
+        result = []
+        for name in sorted(self.resources):
+            for description, cost in self.resources[name]:
+                result.append('%-32s %-40s %10.2f' % (name, description,
+                                                      cost))
+        for name in sorted(self.unpriced):
+            result.append('%-32s %-40s %10s' % (name, 'unknown price', '?'))
+        result.append('%-73s %10.2f %s' % ('Total (monthly)', self.total,
+                                           self.currency))
+        return '\n'.join(result)
+
+
+def _volume_cost(estimate, name, prices, device, volume_type, size, iops,
+                 throughput):
+    if volume_type not in prices['ebs']:
+        return False
+    estimate.add(name, '%s %s %sGB' % (device, volume_type, size),
+                 size * prices['ebs'][volume_type])
+    if iops is not None and volume_type in prices['ebs_iops']:
+        if volume_type == 'gp3':
+            iops -= GP3_BASELINE_IOPS
+        if iops > 0:
+            estimate.add(name, '%s %s IOPS' % (device, iops),
+                         iops * prices['ebs_iops'][volume_type])
+    if throughput is not None and volume_type in prices['ebs_throughput']:
+        throughput -= GP3_BASELINE_THROUGHPUT
+        if throughput > 0:
+            estimate.add(name, '%s %sMiB/s' % (device, throughput),
+                         throughput * prices['ebs_throughput'][volume_type])
+    return True
+
+
+def _estimate(template, prices, currency, usage):
+    estimate = CostEstimate(currency=currency)
+    for name, resource in sorted(template['Resources'].items()):
+        properties = resource.get('Properties', {})
+        priced = True
+        if resource['Type'] == AWSType.EC2_INSTANCE.value:
+            instance_type = properties.get('InstanceType')
+            if instance_type in prices['ec2']:
+                estimate.add(name, instance_type,
+                             prices['ec2'][instance_type] * HOURS_PER_MONTH)
+            else:
+                priced = False
+            for device in properties.get('BlockDeviceMappings', []):
+                if 'Ebs' in device:
+                    ebs = device['Ebs']
+                    priced &= _volume_cost(
+                        estimate, name, prices, device['DeviceName'],
+                        ebs.get('VolumeType', 'standard'),
+                        ebs.get('VolumeSize', 8), ebs.get('Iops'),
+                        ebs.get('Throughput'))
+        elif resource['Type'] == AWSType.EC2_VOLUME.value:
+            priced = _volume_cost(
+                estimate, name, prices, 'volume',
+                properties.get('VolumeType', 'gp2'),
+                properties.get('Size', 0), properties.get('Iops'),
+                properties.get('Throughput'))
+        elif resource['Type'] == AWSType.S3_BUCKET.value:
+            for storage_class, size in sorted(usage.get(name, {}).items()):
+                if storage_class in prices['s3']:
+                    estimate.add(name, '%s %sGB' % (storage_class, size),
+                                 size * prices['s3'][storage_class])
+                else:
+                    priced = False
+        else:
+            continue
+        if not priced:
+            estimate.unpriced.append(name)
+    return estimate
+
+
+def estimate_cost(stack, region, usage=None, price_table=None,
+                  cache_dir=None):
+    """Estimate the monthly cost of a stack without calling AWS.
+
+    Instances (with their EBS volumes), volumes and bucket storage are
+    priced using on-demand prices. Other resources are ignored. Results are
+    cached by template hash, in memory (up to MAX_CACHE_SIZE results) and
+    in cache_dir if not None. Each call returns a new CostEstimate.
+
+    :param stack: a stack
+    :type stack: e3.aws.cfn.Stack
+    :param region: region in which the stack is deployed
+    :type region: str
+    :param usage: dict associating bucket names to a dict associating
+        storage classes to the stored size in GB
+    :type usage: dict | None
+    :param price_table: a price table. If None the packaged one is used
+    :type price_table: dict | None
+    :param cache_dir: directory in which results are cached
+    :type cache_dir: str | None
+    :rtype: CostEstimate
+    """
+    if price_table is None:
+        price_table = load_price_table()
+    usage = usage or {}
+    template = stack.export()
+    key = hashlib.sha256(json.dumps(
+        [yaml.dump(template, Dumper=TemplateDumper), region, usage,
+         price_table],
+        sort_keys=True).encode('utf-8')).hexdigest()
+
+    if key not in _CACHE and cache_dir is not None:
+        cache_file = os.path.join(cache_dir, '%s.json' % key)
+        if os.path.isfile(cache_file):
+            with open(cache_file) as fd:
+                _CACHE[key] = CostEstimate.from_dict(json.load(fd))
+
+    if key not in _CACHE:
+        assert region in price_table['regions'], \
+            'no price for region %s' % region
+        _CACHE[key] = _estimate(template, price_table['regions'][region],
+                                price_table['currency'], usage)
+        if cache_dir is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(os.path.join(cache_dir, '%s.json' % key), 'w') as fd:
+                json.dump(_CACHE[key].as_dict(), fd)
+
+    _CACHE.move_to_end(key)
+    while len(_CACHE) > MAX_CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    # Return a copy so that callers cannot alter the cached result
+    return CostEstimate.from_dict(_CACHE[key].as_dict())
@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from e3.aws import client
+from e3.aws.poll import Backoff
+
+# Resource drift statuses reported by default
+DRIFTED_RESOURCE_STATUSES = ('MODIFIED', 'DELETED')
+
+
+class StackDrift(object):
+    """Result of the drift detection of a stack."""
+
+    def __init__(self, name):
+        """Initialize a stack drift result.
+
+        :param name: stack name
+        :type name: str
+        """
+        self.name = name
+        self.detection_id = None
+        self.detection_status = None
+        self.drift_status = None
+        self.reason = None
+        self.resources = []
+        self.error = None
+
+    @property
+    def drifted(self):
+        return self.error is None and self.drift_status == 'DRIFTED'
+
+    def __str__(self):
+        if self.error is not None:
+            return '%s: FAILED: %s' % (self.name, self.error)
+        status = self.drift_status or self.detection_status
+        result = ['%s: %s' % (self.name, status)]
+        for resource in self.resources:
+            result.append('  %-40s %-32s %s' % (
+                resource['LogicalResourceId'],
+                resource['ResourceType'],
+                resource['StackResourceDriftStatus']))
+            for diff in resource.get('PropertyDifferences', []):
+                result.append('    %s %s: %s -> %s' % (
+                    diff['DifferenceType'], diff['PropertyPath'],
+                    diff['ExpectedValue'], diff['ActualValue']))
+        return '\n'.join(result)
+
+
+class DriftReport(object):
+    """Drift detection results of a set of stacks."""
+
+    def __init__(self, stacks):
+        """Initialize a report.
+
+        :param stacks: list of results
+        :type stacks: list[StackDrift]
+        """
+        self.stacks = {s.name: s for s in stacks}
+
+    @property
+    def drifted(self):
+        """Return the names of the drifted stacks.
+
+        :rtype: list[str]
+        """
+        return sorted(s.name for s in self.stacks.values() if s.drifted)
+
+    @property
+    def failed(self):
+        """Return the names of the stacks whose detection failed.
+
+        :rtype: list[str]
+        """
+        return sorted(s.name for s in self.stacks.values()
+                      if s.error is not None)
+
+    @property
+    def resources(self):
+        """Return the drifted resources of all stacks.
+
+        :return: the list of StackResourceDrift dicts returned by
+            describe_stack_resource_drifts
+        :rtype: list[dict]
+        """
+        return [r for name in sorted(self.stacks)
+                for r in self.stacks[name].resources]
+
+    def __str__(self):
+        return '\n'.join(str(self.stacks[name])
+                         for name in sorted(self.stacks))
+
+
+@client('cloudformation')
+def detect_drift(stacks, client, statuses=DRIFTED_RESOURCE_STATUSES,
+                 timeout=1800, poll_interval=5, max_poll_interval=60,
+                 max_workers=8):
+    """Detect the drift of several stacks.
+
+    All detections are started concurrently, then a single poller checks
+    the status of the pending detections at each round. The delay between
+    rounds doubles, up to max_poll_interval, while no detection completes.
+    As CloudFormation requests are rate limited per account and region,
+    consider creating AWSEnv with retry_mode='adaptive' and
+    max_pool_connections set to max_workers.
+
+    :param stacks: stacks or stack names
+    :type stacks: list[e3.aws.cfn.Stack | str]
+    :param client: a botocore client
+    :type client: botocore.client.BaseClient
+    :param statuses: resource drift statuses to report
+    :type statuses: list[str]
+    :param timeout: maximum number of seconds to wait for detections
+    :type timeout: int
+    :param poll_interval: initial delay between two polling rounds
+    :type poll_interval: int
+    :param max_poll_interval: maximum delay between two polling rounds
+    :type max_poll_interval: int
+    :param max_workers: maximum number of concurrent requests
+    :type max_workers: int
+    :rtype: DriftReport
+    """
+    results = [StackDrift(s if isinstance(s, str) else s.name)
+               for s in stacks]
+
+    def start(result):
+        try:
+            result.detection_id = client.detect_stack_drift(
+                StackName=result.name)['StackDriftDetectionId']
+        except Exception as e:
+            result.error = e
+
+    def poll(result):
+        try:
+            status = client.describe_stack_drift_detection_status(
+                StackDriftDetectionId=result.detection_id)
+            result.detection_status = status['DetectionStatus']
+            result.drift_status = status.get('StackDriftStatus')
+            result.reason = status.get('DetectionStatusReason')
+            if result.detection_status == 'DETECTION_FAILED':
+                result.error = result.reason or 'detection failed'
+        except Exception as e:
+            result.error = e
+
+    def collect(result):
+        kwargs = {'StackName': result.name,
+                  'StackResourceDriftStatusFilters': list(statuses)}
+        try:
+            while True:
+                page = client.describe_stack_resource_drifts(**kwargs)
+                result.resources.extend(page['StackResourceDrifts'])
+                if 'NextToken' not in page:
+                    break
+                kwargs['NextToken'] = page['NextToken']
+        except Exception as e:
+            result.error = e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(start, results))
+        pending = [r for r in results if r.error is None]
+        delays = Backoff(poll_interval, max_poll_interval, timeout)
+        progress = False
+        while pending and delays.wait(progress):
+            list(executor.map(poll, pending))
+            still_pending = [r for r in pending if r.error is None]
+            still_pending = [r for r in still_pending
+                             if r.detection_status == 'DETECTION_IN_PROGRESS']
+            progress = len(still_pending) != len(pending)
+            pending = still_pending
+        for result in pending:
+            result.error = 'timeout'
+
+        list(executor.map(collect, [r for r in results
+                                    if r.error is None and r.drifted]))
+    return DriftReport(results)
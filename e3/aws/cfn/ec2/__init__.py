@@ -1,5 +1,12 @@
-from e3.aws.cfn import Resource, AWSType, GetAtt
+import copy
+import re
+
+from e3.aws.cfn import Resource, AWSType, Base64, GetAtt, Sub
+from e3.aws.cfn.ec2.cidr import CidrAllocator
+from e3.aws.cfn.ec2.user_data import EncodedUserData, UserData
 from e3.aws.ec2.ami import AMI
+from e3.aws.ec2.instance_types import (check_instance_type,
+                                       instance_type_info)
 
 
 class BlockDevice(object):
@@ -35,19 +42,167 @@ class EphemeralDisk(BlockDevice):
                 "VirtualName": "ephemeral%s" % self.id}
 
 
+# User data to which the scratch volume script can be prepended
+SHELL_SHEBANG = re.compile('^#!/bin/(ba)?sh')
+
+
+def scratch_volume_script(devices, mount_point):
+    """Return a shell script assembling instance store volumes.
+
+    The volumes are assembled into a RAID0 array (unless there is only one
+    volume), formatted as ext4 and mounted.
+
+    :param devices: device names of the instance store volumes. If None
+        the NVMe instance store volumes are detected at boot.
+    :type devices: list[str] | None
+    :param mount_point: directory on which the volume is mounted
+    :type mount_point: str
+    :rtype: str
+    """
+    if devices is None:
+        detect = [
+            'for name in $(lsblk -d -n -o NAME,MODEL | '
+            'awk \'/Amazon EC2 NVMe Instance Storage/ {print $1}\'); do',
+            '    DEVICES="$DEVICES /dev/$name"',
+            'done']
+    else:
+        # Depending on the kernel /dev/sdX devices might be exposed as
+        # /dev/xvdX
+        detect = [
+            'for dev in %s; do' % ' '.join(devices),
+            '    xen_dev=$(echo $dev | sed \'s,^/dev/sd,/dev/xvd,\')',
+            '    [ -b $dev ] || dev=$xen_dev',
+            '    umount $dev 2>/dev/null || true',
+            '    DEVICES="$DEVICES $dev"',
+            'done']
+    # The commands run in a subshell so that neither set -e nor the
+    # variables and positional parameters leak into the script in which
+    # they may be inserted (see Instance.map_instance_store)
+    lines = ['#!/bin/sh',
+             '# Assemble instance store volumes into a scratch volume',
+             '(',
+             'set -e',
+             'DEVICES=""']
+    lines.extend(detect)
+    lines.extend([
+        'set -- $DEVICES',
+        'if [ $# -gt 1 ]; then',
+        '    mdadm --create /dev/md0 --run --level=0 --raid-devices=$# "$@"',
+        '    SCRATCH=/dev/md0',
+        'else',
+        '    SCRATCH=$1',
+        'fi',
+        'mkfs.ext4 -F -E nodiscard $SCRATCH',
+        'mkdir -p %s' % mount_point,
+        'mount -o noatime $SCRATCH %s' % mount_point,
+        ')',
+        # Not "( ... ) || exit 1" which would disable set -e in the subshell
+        'test $? -eq 0 || exit 1',
+        ''])
+    return '\n'.join(lines)
+
+
 class EBSDisk(BlockDevice):
     """EBS Disk."""
 
-    def __init__(self, device_name, size=20):
+    # Limits for each volume type: size range in GiB, provisioned IOPS range,
+    # maximum IOPS per GiB, throughput range in MiB/s and maximum throughput
+    # per provisioned IOPS. gp3 volumes provide a baseline of 3000 IOPS and
+    # 125 MiB/s whatever their size.
+    VOLUME_TYPES = {
+        'standard': {'size': (1, 1024)},
+        'gp2': {'size': (1, 16384)},
+        'gp3': {'size': (1, 16384),
+                'iops': (3000, 16000),
+                'iops_per_gib': 500,
+                'throughput': (125, 1000),
+                'throughput_per_iops': 0.25},
+        'io1': {'size': (4, 16384),
+                'iops': (100, 64000),
+                'iops_per_gib': 50},
+        'io2': {'size': (4, 16384),
+                'iops': (100, 64000),
+                'iops_per_gib': 500},
+        'st1': {'size': (125, 16384)},
+        'sc1': {'size': (125, 16384)}}
+
+    # Volume types for which IOPS must be provisioned
+    PROVISIONED_IOPS = ('io1', 'io2')
+
+    def __init__(self, device_name, size=20, volume_type='standard',
+                 iops=None, throughput=None, encrypted=None, kms_key_id=None,
+                 delete_on_termination=None):
         """Initialize an EBS disk.
 
         :param device_name: name of the device associated with that disk
         :type device_name: str
         :param size: disk size in Go (default: 20Go)
         :type size: int
+        :param volume_type: one of the keys of VOLUME_TYPES (default:
+            standard)
+        :type volume_type: str
+        :param iops: provisioned IOPS. Mandatory for io1 and io2, optional
+            for gp3 and invalid for other types
+        :type iops: int | None
+        :param throughput: throughput in MiB/s. Only valid for gp3
+        :type throughput: int | None
+        :param encrypted: if True the volume is encrypted. If None the
+            account default is used
+        :type encrypted: bool | None
+        :param kms_key_id: KMS key used to encrypt the volume. If None
+            the default EBS key is used
+        :type kms_key_id: str | None
+        :param delete_on_termination: if not None, whether the volume is
+            deleted when the instance is terminated
+        :type delete_on_termination: bool | None
         """
+        assert volume_type in self.VOLUME_TYPES, \
+            'invalid volume type %s' % volume_type
+        limits = self.VOLUME_TYPES[volume_type]
+
+        assert isinstance(size, int) and \
+            limits['size'][0] <= size <= limits['size'][1], \
+            'invalid size %s for %s volume (should be in %s-%s GiB)' % \
+            ((size, volume_type) + limits['size'])
+
+        if volume_type in self.PROVISIONED_IOPS:
+            assert iops is not None, \
+                'iops is mandatory for %s volumes' % volume_type
+        if iops is not None:
+            assert 'iops' in limits, \
+                'iops cannot be set for %s volumes' % volume_type
+            assert limits['iops'][0] <= iops <= limits['iops'][1], \
+                'invalid iops %s for %s volume (should be in %s-%s)' % \
+                ((iops, volume_type) + limits['iops'])
+            assert iops <= max(limits['iops'][0],
+                               limits['iops_per_gib'] * size), \
+                'iops %s exceeds %s per GiB for a %s GiB %s volume' % \
+                (iops, limits['iops_per_gib'], size, volume_type)
+
+        if throughput is not None:
+            assert 'throughput' in limits, \
+                'throughput cannot be set for %s volumes' % volume_type
+            assert limits['throughput'][0] <= throughput <= \
+                limits['throughput'][1], \
+                'invalid throughput %s for %s volume (should be in %s-%s)' % \
+                ((throughput, volume_type) + limits['throughput'])
+            max_throughput = limits['throughput_per_iops'] * \
+                (iops if iops is not None else limits['iops'][0])
+            assert throughput <= max_throughput, \
+                'throughput %s exceeds %s MiB/s per provisioned IOPS' % \
+                (throughput, limits['throughput_per_iops'])
+
+        assert kms_key_id is None or encrypted, \
+            'kms_key_id requires an encrypted volume'
+
         self.device_name = device_name
         self.size = size
+        self.volume_type = volume_type
+        self.iops = iops
+        self.throughput = throughput
+        self.encrypted = encrypted
+        self.kms_key_id = kms_key_id
+        self.delete_on_termination = delete_on_termination
 
     @property
     def properties(self):
@@ -57,9 +212,20 @@ class EBSDisk(BlockDevice):
 
         :rtype: dict
         """
+        ebs = {"VolumeSize": self.size,
+               "VolumeType": self.volume_type}
+        if self.iops is not None:
+            ebs["Iops"] = self.iops
+        if self.throughput is not None:
+            ebs["Throughput"] = self.throughput
+        if self.encrypted is not None:
+            ebs["Encrypted"] = self.encrypted
+        if self.kms_key_id is not None:
+            ebs["KmsKeyId"] = self.kms_key_id
+        if self.delete_on_termination is not None:
+            ebs["DeleteOnTermination"] = self.delete_on_termination
         return {"DeviceName": self.device_name,
-                "Ebs": {"VolumeSize": str(self.size),
-                        "VolumeType": "standard"}}
+                "Ebs": ebs}
 
 
 class NetworkInterface(object):
@@ -116,6 +282,51 @@ class NetworkInterface(object):
         return result
 
 
+class PlacementGroup(Resource):
+    """EC2 Placement group."""
+
+    STRATEGIES = ('cluster', 'partition', 'spread')
+
+    def __init__(self, name, strategy='cluster', partition_count=None,
+                 spread_level=None):
+        """Initialize a placement group.
+
+        :param name: logical name in stack
+        :type name: str
+        :param strategy: cluster (low latency between instances), partition
+            or spread (default: cluster)
+        :type strategy: str
+        :param partition_count: number of partitions (1 to 7). Only valid
+            for the partition strategy
+        :type partition_count: int | None
+        :param spread_level: host or rack. Only valid for the spread
+            strategy
+        :type spread_level: str | None
+        """
+        super(PlacementGroup, self).__init__(
+            name, kind=AWSType.EC2_PLACEMENT_GROUP)
+        assert strategy in self.STRATEGIES, \
+            'invalid placement strategy %s' % strategy
+        assert partition_count is None or \
+            (strategy == 'partition' and 1 <= partition_count <= 7), \
+            'invalid partition count %s' % partition_count
+        assert spread_level is None or \
+            (strategy == 'spread' and spread_level in ('host', 'rack')), \
+            'invalid spread level %s' % spread_level
+        self.strategy = strategy
+        self.partition_count = partition_count
+        self.spread_level = spread_level
+
+    @property
+    def properties(self):
+        result = {'Strategy': self.strategy}
+        if self.partition_count is not None:
+            result['PartitionCount'] = self.partition_count
+        if self.spread_level is not None:
+            result['SpreadLevel'] = self.spread_level
+        return result
+
+
 class Instance(Resource):
     """EC2 Instance."""
 
@@ -127,7 +338,12 @@ class Instance(Resource):
 
     def __init__(self, name, image,
                  instance_type='t2.micro',
-                 disk_size=None):
+                 disk_size=None,
+                 disk_type='standard',
+                 disk_iops=None,
+                 disk_throughput=None,
+                 disk_encrypted=None,
+                 disk_delete_on_termination=None):
         """Initialize an EC2 instance.
 
         :param name: logical name of the instance
@@ -140,15 +356,43 @@ class Instance(Resource):
             the original AMI one. Note that this affect only the root
             device of the AMI
         :type disk_size: int | None
+        :param disk_type: volume type of the root disk when disk_size is
+            set (see EBSDisk.VOLUME_TYPES)
+        :type disk_type: str
+        :param disk_iops: provisioned IOPS of the root disk
+        :type disk_iops: int | None
+        :param disk_throughput: throughput in MiB/s of the root disk (gp3)
+        :type disk_throughput: int | None
+        :param disk_encrypted: if not None, whether the root disk is
+            encrypted
+        :type disk_encrypted: bool | None
+        :param disk_delete_on_termination: if not None, whether the root
+            disk is deleted when the instance is terminated
+        :type disk_delete_on_termination: bool | None
         """
         super(Instance, self).__init__(name, kind=AWSType.EC2_INSTANCE)
         assert isinstance(image, AMI)
+        check_instance_type(instance_type, image=image)
         self.image = image
         self.instance_type = instance_type
         self.block_devices = []
+        self.placement_group = None
+        self.ebs_optimized = None
+        self.tenancy = None
+        self.core_count = None
+        self.threads_per_core = None
+        self.nitro_enclave = None
+        # Either a script, a UserData builder or a value returned by
+        # UserData.export
+        self.user_data = None
         if disk_size is not None:
             self.add(EBSDisk(device_name=self.image.root_device,
-                             size=disk_size))
+                             size=disk_size,
+                             volume_type=disk_type,
+                             iops=disk_iops,
+                             throughput=disk_throughput,
+                             encrypted=disk_encrypted,
+                             delete_on_termination=disk_delete_on_termination))
         self.instance_profile = None
         self.network_interfaces = {}
 
@@ -163,6 +407,113 @@ class Instance(Resource):
     def set_instance_profile(self, profile):
         self.instance_profile = profile
 
+    def map_instance_store(self, scratch_mount_point=None):
+        """Map all the instance store volumes of the instance type.
+
+        The number and kind of volumes is taken from the instance type
+        table (see e3.aws.ec2.instance_types). NVMe instance store volumes
+        are always exposed to the instance so only non NVMe volumes are
+        added to the block device mapping.
+
+        :param scratch_mount_point: if not None, add to the user data a
+            script that assembles the volumes into a RAID0 scratch volume
+            mounted on that directory at boot
+        :type scratch_mount_point: str | None
+        :return: the Instance itself
+        :rtype: Instance
+        """
+        info = instance_type_info(self.instance_type)
+        assert info is not None and info['instance_store'], \
+            'no known instance store volume for %s' % self.instance_type
+        count = info['instance_store'][0]
+
+        devices = None
+        if not info['instance_store_nvme']:
+            used = {bd.device_name for bd in self.block_devices}
+            devices = []
+            letter = ord('b')
+            while len(devices) < count:
+                device_name = '/dev/sd%s' % chr(letter)
+                letter += 1
+                if device_name not in used:
+                    devices.append(device_name)
+            for index, device_name in enumerate(devices):
+                self.add(EphemeralDisk(device_name, index))
+
+        if scratch_mount_point is not None:
+            script = scratch_volume_script(devices, scratch_mount_point)
+            if self.user_data is None:
+                self.user_data = script
+            elif isinstance(self.user_data, UserData):
+                self.user_data.add(script, first=True)
+            else:
+                # Insert the script commands after the shebang of the
+                # existing shell script
+                assert isinstance(self.user_data, str) and \
+                    re.match(SHELL_SHEBANG, self.user_data), \
+                    'user data should be a shell script'
+                shebang, _, content = self.user_data.partition('\n')
+                self.user_data = '\n'.join(
+                    [shebang, script.split('\n', 1)[1], content])
+        return self
+
+    def configure(self,
+                  placement_group=None,
+                  ebs_optimized=None,
+                  tenancy=None,
+                  core_count=None,
+                  threads_per_core=None,
+                  nitro_enclave=None):
+        """Set placement and performance options.
+
+        Options are checked against the capabilities of the instance type
+        (see e3.aws.ec2.instance_types). Options set to None are left
+        unchanged.
+
+        :param placement_group: placement group in which the instance is
+            launched
+        :type placement_group: PlacementGroup | None
+        :param ebs_optimized: if True the instance is EBS optimized
+        :type ebs_optimized: bool | None
+        :param tenancy: default, dedicated or host
+        :type tenancy: str | None
+        :param core_count: number of CPU cores
+        :type core_count: int | None
+        :param threads_per_core: number of threads per core (1 disables
+            hyperthreading)
+        :type threads_per_core: int | None
+        :param nitro_enclave: if True enable Nitro Enclaves
+        :type nitro_enclave: bool | None
+        :return: the Instance itself
+        :rtype: Instance
+        """
+        options = {'placement_group': placement_group,
+                   'ebs_optimized': ebs_optimized,
+                   'tenancy': tenancy,
+                   'core_count': core_count,
+                   'threads_per_core': threads_per_core,
+                   'nitro_enclave': nitro_enclave}
+        # Check the resulting configuration before changing the instance
+        options = {k: getattr(self, k) if v is None else v
+                   for k, v in options.items()}
+        assert options['placement_group'] is None or \
+            isinstance(options['placement_group'], PlacementGroup)
+        assert options['tenancy'] in (None, 'default', 'dedicated', 'host'), \
+            'invalid tenancy %s' % options['tenancy']
+        check_instance_type(
+            self.instance_type,
+            ebs_optimized=options['ebs_optimized'],
+            placement_strategy=(options['placement_group'].strategy
+                                if options['placement_group'] is not None
+                                else None),
+            core_count=options['core_count'],
+            threads_per_core=options['threads_per_core'],
+            nitro_enclave=options['nitro_enclave'])
+
+        for name, value in options.items():
+            setattr(self, name, value)
+        return self
+
     def add(self, device):
         """Add a device to the instance.
 
@@ -206,6 +557,189 @@ class Instance(Resource):
             result['NetworkInterfaces'] = \
                 [ni.properties
                  for ni in self.network_interfaces.values()]
+        if self.placement_group is not None:
+            result['PlacementGroupName'] = self.placement_group.ref
+        if self.ebs_optimized is not None:
+            result['EbsOptimized'] = self.ebs_optimized
+        if self.tenancy is not None:
+            result['Tenancy'] = self.tenancy
+        if self.core_count is not None or self.threads_per_core is not None:
+            result['CpuOptions'] = {}
+            if self.core_count is not None:
+                result['CpuOptions']['CoreCount'] = self.core_count
+            if self.threads_per_core is not None:
+                result['CpuOptions']['ThreadsPerCore'] = \
+                    self.threads_per_core
+        if self.nitro_enclave is not None:
+            result['EnclaveOptions'] = {'Enabled': self.nitro_enclave}
+        if self.user_data is not None:
+            if isinstance(self.user_data, EncodedUserData):
+                # Already base64 encoded by UserData.export
+                result['UserData'] = str(self.user_data)
+            elif isinstance(self.user_data, str):
+                result['UserData'] = Base64(self.user_data)
+            elif isinstance(self.user_data, UserData):
+                result['UserData'] = self.user_data.export()
+            else:
+                result['UserData'] = self.user_data
+        return result
+
+
+class FleetInstance(Resource):
+    """An EC2 instance of a Fleet."""
+
+    ATTRIBUTES = Instance.ATTRIBUTES
+
+    def __init__(self, name, fleet):
+        """Initialize a fleet instance.
+
+        :param name: logical name of the instance
+        :type name: str
+        :param fleet: the fleet the instance belongs to
+        :type fleet: Fleet
+        """
+        super(FleetInstance, self).__init__(name, kind=AWSType.EC2_INSTANCE)
+        self.fleet = fleet
+
+    @property
+    def public_ip(self):
+        """Return a reference to the public Ip.
+
+        :rtype: e3.aws.cfn.GetAtt
+        """
+        return GetAtt(self.name, 'PublicIp')
+
+    @property
+    def properties(self):
+        return self.fleet.properties
+
+
+class Fleet(object):
+    """Copies of an EC2 instance.
+
+    The properties of the template instance are computed once and each
+    copy gets its own mutable copy of them. Identical properties are shared
+    again when the stack body is rendered (see Stack.export). As the
+    properties are computed on first use, the template should not be
+    modified once the fleet is exported.
+    """
+
+    def __init__(self, template, count, prefix=None):
+        """Initialize a fleet.
+
+        :param template: the instance to copy. It does not need to be added
+            to the stack.
+        :type template: Instance
+        :param count: number of instances
+        :type count: int
+        :param prefix: prefix of the logical names of the instances which
+            are named <prefix><index> with index starting at 1. If None the
+            name of the template is used.
+        :type prefix: str | None
+        """
+        assert isinstance(template, Instance)
+        assert count > 0, 'invalid fleet size %s' % count
+        self.template = template
+        if prefix is None:
+            prefix = template.name
+        self.instances = [FleetInstance('%s%d' % (prefix, index), self)
+                          for index in range(1, count + 1)]
+        self._properties = None
+
+    @property
+    def properties(self):
+        """Return a copy of the properties of the instances.
+
+        :rtype: dict
+        """
+        if self._properties is None:
+            self._properties = self.template.properties
+        return copy.deepcopy(self._properties)
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __getitem__(self, index):
+        return self.instances[index]
+
+
+class LaunchTemplate(Resource):
+    """EC2 Launch template."""
+
+    ATTRIBUTES = ('DefaultVersionNumber',
+                  'LatestVersionNumber',
+                  'LaunchTemplateId')
+
+    def __init__(self, name, instance, template_name=None, subnets=False):
+        """Initialize a launch template from an instance definition.
+
+        The template reuses the AMI, instance type, block devices, network
+        interfaces, instance profile, user data and placement options of
+        the instance. The instance itself does not need to be added to the
+        stack.
+
+        :param name: logical name in stack
+        :type name: str
+        :param instance: the instance definition
+        :type instance: Instance
+        :param template_name: optional name of the launch template
+        :type template_name: str | None
+        :param subnets: if False subnets are removed from the network
+            interfaces. This is needed when the template is used by an
+            AutoScalingGroup spanning several subnets.
+        :type subnets: bool
+        """
+        super(LaunchTemplate, self).__init__(
+            name, kind=AWSType.EC2_LAUNCH_TEMPLATE)
+        assert isinstance(instance, Instance)
+        self.instance = instance
+        self.template_name = template_name
+        self.subnets = subnets
+
+    @property
+    def latest_version(self):
+        return self.getatt('LatestVersionNumber')
+
+    @property
+    def specification(self):
+        """Return a reference to the latest version of the template.
+
+        :rtype: dict
+        """
+        return {'LaunchTemplateId': self.ref,
+                'Version': self.latest_version}
+
+    @property
+    def properties(self):
+        data = dict(self.instance.properties)
+        if not data['BlockDeviceMappings']:
+            del data['BlockDeviceMappings']
+        if 'IamInstanceProfile' in data:
+            data['IamInstanceProfile'] = {'Name': data['IamInstanceProfile']}
+        if 'NetworkInterfaces' in data:
+            interfaces = []
+            for interface in data['NetworkInterfaces']:
+                interface = dict(interface)
+                if 'GroupSet' in interface:
+                    interface['Groups'] = interface.pop('GroupSet')
+                if not self.subnets:
+                    del interface['SubnetId']
+                interfaces.append(interface)
+            data['NetworkInterfaces'] = interfaces
+        placement = {}
+        if 'PlacementGroupName' in data:
+            placement['GroupName'] = data.pop('PlacementGroupName')
+        if 'Tenancy' in data:
+            placement['Tenancy'] = data.pop('Tenancy')
+        if placement:
+            data['Placement'] = placement
+
+        result = {'LaunchTemplateData': data}
+        if self.template_name is not None:
+            result['LaunchTemplateName'] = self.template_name
         return result
 
 
@@ -228,6 +762,7 @@ class VPC(Resource):
         """
         super(VPC, self).__init__(name, kind=AWSType.EC2_VPC)
         self.cidr_block = cidr_block
+        self.allocator = None
 
     @property
     def properties(self):
@@ -237,6 +772,45 @@ class VPC(Resource):
     def cidrblock(self):
         return self.getatt('CidrBlock')
 
+    def subnet(self, name, prefix_length=None, cidr_block=None):
+        """Create a subnet in the VPC address range.
+
+        Subnets created with this method are guaranteed not to overlap.
+
+        :param name: logical name in stack
+        :type name: str
+        :param prefix_length: if not None allocate automatically a free
+            block of that size
+        :type prefix_length: int | None
+        :param cidr_block: if not None reserve that IPv4 address range. An
+            AssertionError is raised if it overlaps an existing subnet.
+        :type cidr_block: str | None
+        :return: a subnet
+        :rtype: Subnet
+        """
+        assert (prefix_length is None) != (cidr_block is None), \
+            'either prefix_length or cidr_block should be set'
+        if self.allocator is None:
+            self.allocator = CidrAllocator(self.cidr_block)
+        if prefix_length is not None:
+            block = self.allocator.allocate(prefix_length)
+        else:
+            block = self.allocator.reserve(cidr_block)
+        return Subnet(name, self, str(block))
+
+    def subnets(self, names, prefix_length):
+        """Create several subnets of the same size in the VPC address range.
+
+        :param names: logical names of the subnets
+        :type names: list[str]
+        :param prefix_length: size of each subnet
+        :type prefix_length: int
+        :return: a list of subnets
+        :rtype: list[Subnet]
+        """
+        return [self.subnet(name, prefix_length=prefix_length)
+                for name in names]
+
 
 class Subnet(Resource):
     """EC2 subnet."""
@@ -384,3 +958,159 @@ class SubnetRouteTableAssociation(Resource):
     def properties(self):
         return {'SubnetId': self.subnet.ref,
                 'RouteTableId': self.route_table.ref}
+
+
+class VPCEndpoint(Resource):
+    """EC2 VPC endpoint."""
+
+    ATTRIBUTES = ('CreationTimestamp',
+                  'DnsEntries',
+                  'Id',
+                  'NetworkInterfaceIds')
+
+    # Services reachable through gateway endpoints
+    GATEWAY_SERVICES = ('dynamodb', 's3')
+
+    def __init__(self, name, vpc, service,
+                 route_tables=None,
+                 subnets=None,
+                 security_groups=None,
+                 private_dns=None,
+                 policy_document=None):
+        """Initialize a VPC endpoint.
+
+        A gateway endpoint is created when route_tables is set, otherwise
+        an interface endpoint is created in subnets.
+
+        :param name: logical name in stack
+        :type name: str
+        :param vpc: the VPC
+        :type vpc: VPC
+        :param service: service short name (e.g. s3, ec2, sts). The
+            endpoint targets the service in the region of the stack.
+        :type service: str
+        :param route_tables: route tables updated with a route to a gateway
+            endpoint. Only valid for GATEWAY_SERVICES
+        :type route_tables: list[RouteTable] | None
+        :param subnets: subnets in which the network interfaces of an
+            interface endpoint are created
+        :type subnets: list[Subnet] | None
+        :param security_groups: security groups of an interface endpoint.
+            They should allow HTTPS traffic from the VPC.
+        :type security_groups: list[e3.aws.cfn.ec2.security.SecurityGroup]
+            | None
+        :param private_dns: if True the default DNS name of the service
+            resolves to the interface endpoint
+        :type private_dns: bool | None
+        :param policy_document: optional policy controlling access to the
+            service through the endpoint
+        :type policy_document: dict | None
+        """
+        super(VPCEndpoint, self).__init__(name, kind=AWSType.EC2_VPC_ENDPOINT)
+        assert isinstance(vpc, VPC)
+        assert (route_tables is None) != (subnets is None), \
+            'either route_tables or subnets should be set'
+        if route_tables is not None:
+            assert service in self.GATEWAY_SERVICES, \
+                'no gateway endpoint for %s' % service
+            assert all(isinstance(rt, RouteTable) for rt in route_tables)
+            assert security_groups is None and private_dns is None, \
+                'security groups and private DNS are only valid for ' \
+                'interface endpoints'
+        else:
+            assert all(isinstance(subnet, Subnet) for subnet in subnets)
+        self.vpc = vpc
+        self.service = service
+        self.route_tables = route_tables
+        self.subnets = subnets
+        self.security_groups = security_groups
+        self.private_dns = private_dns
+        self.policy_document = policy_document
+
+    @property
+    def endpoint_type(self):
+        return 'Gateway' if self.route_tables is not None else 'Interface'
+
+    @property
+    def properties(self):
+        result = {'VpcId': self.vpc.ref,
+                  'ServiceName': Sub('com.amazonaws.${AWS::Region}.%s' %
+                                     self.service),
+                  'VpcEndpointType': self.endpoint_type}
+        if self.route_tables is not None:
+            result['RouteTableIds'] = [rt.ref for rt in self.route_tables]
+        if self.subnets is not None:
+            result['SubnetIds'] = [subnet.ref for subnet in self.subnets]
+        if self.security_groups is not None:
+            result['SecurityGroupIds'] = [sg.ref
+                                          for sg in self.security_groups]
+        if self.private_dns is not None:
+            result['PrivateDnsEnabled'] = self.private_dns
+        if self.policy_document is not None:
+            result['PolicyDocument'] = self.policy_document
+        return result
+
+
+def add_vpc_endpoints(stack, vpc,
+                      route_tables=None,
+                      subnets=None,
+                      security_groups=None,
+                      gateway_services=VPCEndpoint.GATEWAY_SERVICES,
+                      interface_services=()):
+    """Add VPC endpoints to a stack.
+
+    Gateway endpoints are free and keep S3 and DynamoDB traffic off the
+    internet gateway. Interface endpoints are billed per hour and per
+    availability zone so none is created by default.
+
+    Endpoints are named <VPC name><Service>Endpoint, for example
+    BuildVPCEcrApiEndpoint. A service can have both a gateway and an
+    interface endpoint (S3 for example), in which case the interface one
+    is named <VPC name><Service>InterfaceEndpoint.
+
+    :param stack: the stack to which endpoints are added
+    :type stack: e3.aws.cfn.Stack
+    :param vpc: the VPC
+    :type vpc: VPC
+    :param route_tables: route tables of the subnets using the gateway
+        endpoints. If None no gateway endpoint is created
+    :type route_tables: list[RouteTable] | None
+    :param subnets: subnets in which interface endpoints are created
+        (usually one per availability zone). If None no interface endpoint
+        is created
+    :type subnets: list[Subnet] | None
+    :param security_groups: security groups of the interface endpoints
+    :type security_groups: list[e3.aws.cfn.ec2.security.SecurityGroup]
+        | None
+    :param gateway_services: services reachable through gateway endpoints
+    :type gateway_services: list[str]
+    :param interface_services: services reachable through interface
+        endpoints (e.g. ec2, sts, logs, ecr.api)
+    :type interface_services: list[str]
+    :return: the created endpoints
+    :rtype: list[VPCEndpoint]
+    """
+    def endpoint_name(service, kind=''):
+        return '%s%s%sEndpoint' % (
+            vpc.name,
+            ''.join(part.title() for part in service.split('.')),
+            kind)
+
+    result = []
+    gateways = set()
+    if route_tables is not None:
+        for service in gateway_services:
+            gateways.add(service)
+            result.append(VPCEndpoint(endpoint_name(service), vpc, service,
+                                      route_tables=route_tables))
+    if subnets is not None:
+        for service in interface_services:
+            name = endpoint_name(
+                service, 'Interface' if service in gateways else '')
+            result.append(VPCEndpoint(name, vpc, service,
+                                      subnets=subnets,
+                                      security_groups=security_groups,
+                                      private_dns=True))
+    for endpoint in result:
+        stack.add(endpoint)
+    return result
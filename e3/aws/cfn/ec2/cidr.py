@@ -0,0 +1,171 @@
+import heapq
+import ipaddress
+
+
+class CidrAllocator(object):
+    """Buddy allocator of IPv4 CIDR blocks.
+
+    Free blocks are kept per prefix length. Allocating a block takes the
+    lowest free block of the smallest sufficient size and splits it in
+    halves (buddies) until the requested prefix length is reached. Releasing
+    a block merges it back with its buddy when the buddy is free.
+
+    As the number of prefix lengths is bounded by 32, allocation, reservation,
+    release and conflict detection are O(log n) in the number of blocks.
+    """
+
+    def __init__(self, cidr_block):
+        """Initialize an allocator.
+
+        :param cidr_block: the IPv4 address range in which blocks are carved
+        :type cidr_block: str
+        """
+        self.network = ipaddress.IPv4Network(cidr_block)
+        self.free = {}
+        self.free_heaps = {}
+        self.allocated = set()
+        self._add_free(int(self.network.network_address),
+                       self.network.prefixlen)
+
+    def _add_free(self, address, prefixlen):
+        self.free.setdefault(prefixlen, set()).add(address)
+        heapq.heappush(self.free_heaps.setdefault(prefixlen, []), address)
+
+    def _remove_free(self, address, prefixlen):
+        """Remove a given free block.
+
+        The block is left in the heap and skipped by _pop_free. The heap
+        is rebuilt once stale entries outnumber the free blocks, so that
+        allocate/release cycles do not grow it indefinitely.
+        """
+        free = self.free[prefixlen]
+        free.remove(address)
+        heap = self.free_heaps[prefixlen]
+        if len(heap) > 2 * len(free) + 1:
+            heap[:] = [a for a in set(heap) if a in free]
+            heapq.heapify(heap)
+
+    def _pop_free(self, prefixlen):
+        """Remove and return the lowest free block with given prefix length.
+
+        :return: the block address or None
+        :rtype: int | None
+        """
+        free = self.free.get(prefixlen)
+        heap = self.free_heaps.get(prefixlen)
+        while heap:
+            address = heapq.heappop(heap)
+            # The heap may contain blocks that have been taken by reserve or
+            # merged by release.
+            if address in free:
+                free.remove(address)
+                return address
+        return None
+
+    @staticmethod
+    def _size(prefixlen):
+        return 1 << (32 - prefixlen)
+
+    def _check_prefixlen(self, prefixlen):
+        assert self.network.prefixlen <= prefixlen <= 32, \
+            'invalid prefix length %s for %s' % (prefixlen, self.network)
+
+    def allocate(self, prefixlen):
+        """Allocate a block.
+
+        :param prefixlen: prefix length of the block
+        :type prefixlen: int
+        :return: the allocated block
+        :rtype: ipaddress.IPv4Network
+        """
+        self._check_prefixlen(prefixlen)
+        for level in range(prefixlen, self.network.prefixlen - 1, -1):
+            address = self._pop_free(level)
+            if address is not None:
+                break
+        else:
+            assert False, 'no free /%s block left in %s' % (prefixlen,
+                                                            self.network)
+
+        # Split the block, keeping the lower half at each step
+        for level in range(level + 1, prefixlen + 1):
+            self._add_free(address + self._size(level), level)
+
+        self.allocated.add((address, prefixlen))
+        return ipaddress.IPv4Network((address, prefixlen))
+
+    def conflict(self, cidr_block):
+        """Return the allocated block overlapping a given block.
+
+        :param cidr_block: an IPv4 address range
+        :type cidr_block: str
+        :return: None if the block is free. Otherwise the allocated block
+            containing cidr_block, or cidr_block itself if some allocated
+            blocks are included in it.
+        :rtype: ipaddress.IPv4Network | None
+        """
+        network = ipaddress.IPv4Network(cidr_block)
+        # IPv4Network.subnet_of is only available since Python 3.7
+        assert self.network.network_address <= network.network_address \
+            and network.broadcast_address <= self.network.broadcast_address, \
+            '%s is not in %s' % (network, self.network)
+        address = int(network.network_address)
+        for level in range(network.prefixlen, self.network.prefixlen - 1, -1):
+            block = address & ~(self._size(level) - 1)
+            if block in self.free.get(level, ()):
+                return None
+            if (block, level) in self.allocated:
+                return ipaddress.IPv4Network((block, level))
+        return network
+
+    def reserve(self, cidr_block):
+        """Reserve a given block.
+
+        :param cidr_block: an IPv4 address range
+        :type cidr_block: str
+        :return: the reserved block
+        :rtype: ipaddress.IPv4Network
+        """
+        network = ipaddress.IPv4Network(cidr_block)
+        conflict = self.conflict(network)
+        assert conflict is None, \
+            '%s overlaps allocated block %s' % (network, conflict)
+
+        address = int(network.network_address)
+        level = network.prefixlen
+        while address & ~(self._size(level) - 1) not in \
+                self.free.get(level, ()):
+            level -= 1
+        self._remove_free(address & ~(self._size(level) - 1), level)
+
+        # Split the free block, keeping the half that contains the network
+        for level in range(level + 1, network.prefixlen + 1):
+            block = address & ~(self._size(level) - 1)
+            self._add_free(block ^ self._size(level), level)
+
+        self.allocated.add((address, network.prefixlen))
+        return network
+
+    def release(self, cidr_block):
+        """Release an allocated block.
+
+        :param cidr_block: an IPv4 address range previously returned by
+            allocate or reserve
+        :type cidr_block: str | ipaddress.IPv4Network
+        """
+        network = ipaddress.IPv4Network(cidr_block)
+        address = int(network.network_address)
+        level = network.prefixlen
+        assert (address, level) in self.allocated, \
+            '%s is not allocated' % network
+        self.allocated.remove((address, level))
+
+        # Merge with the buddy as long as it is free
+        while level > self.network.prefixlen:
+            buddy = address ^ self._size(level)
+            if buddy not in self.free.get(level, ()):
+                break
+            self._remove_free(buddy, level)
+            address = min(address, buddy)
+            level -= 1
+        self._add_free(address, level)
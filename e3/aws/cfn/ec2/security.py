@@ -1,4 +1,7 @@
 import abc
+import ipaddress
+from bisect import bisect_right
+from collections import OrderedDict
 
 from e3.aws.cfn import AWSType, Resource
 from e3.aws.cfn.ec2 import VPC
@@ -93,6 +96,217 @@ class Ipv4IngressRule(IngressRule):
     RULE_TYPE = 'CidrIp'
 
 
+# Protocols for which FromPort/ToPort denote a port range. For other
+# protocols (icmp, -1, ...) the port fields are considered as opaque values.
+PORT_RANGE_PROTOCOLS = {'tcp': 'tcp', '6': 'tcp', 'udp': 'udp', '17': 'udp'}
+
+
+def protocol_key(protocol):
+    """Return a normalized protocol name.
+
+    :param protocol: an ip protocol name or number
+    :type protocol: str | int
+    :return: the normalized name ('6' and 'tcp' are both mapped to 'tcp')
+    :rtype: str
+    """
+    protocol = str(protocol).lower()
+    return PORT_RANGE_PROTOCOLS.get(protocol, protocol)
+
+
+def rule_network(rule):
+    """Return the IPv4 network targeted by a rule.
+
+    :param rule: a security group rule
+    :type rule: GroupSecurityRule
+    :return: the network or None if the rule target is not an IPv4 CIDR
+        (reference to another group, intrinsic function, ...)
+    :rtype: ipaddress.IPv4Network | None
+    """
+    if not isinstance(rule, (Ipv4IngressRule, Ipv4EgressRule)) or \
+            not isinstance(rule.target, str):
+        return None
+    try:
+        return ipaddress.IPv4Network(rule.target, strict=False)
+    except ValueError:
+        return None
+
+
+def _contains(supernet, network):
+    """Check whether a network is included in another one.
+
+    IPv4Network.supernet_of is only available since Python 3.7.
+
+    :param supernet: the enclosing network
+    :type supernet: ipaddress.IPv4Network
+    :param network: the network to check
+    :type network: ipaddress.IPv4Network
+    :rtype: bool
+    """
+    return supernet.network_address <= network.network_address and \
+        supernet.broadcast_address >= network.broadcast_address
+
+
+def _merge_port_ranges(ranges):
+    """Merge overlapping or touching port ranges.
+
+    :param ranges: list of (from_port, to_port, descriptions)
+    :type ranges: list[(int, int, frozenset)]
+    :return: sorted list of disjoint (from_port, to_port, descriptions)
+    :rtype: list[(int, int, frozenset)]
+    """
+    result = []
+    for low, high, descriptions in sorted(ranges, key=lambda r: r[:2]):
+        if result and low <= result[-1][1] + 1:
+            last_low, last_high, last_descriptions = result[-1]
+            result[-1] = (last_low,
+                          max(last_high, high),
+                          last_descriptions | descriptions)
+        else:
+            result.append((low, high, descriptions))
+    return result
+
+
+def _aggregate_networks(networks):
+    """Aggregate networks into the minimal list of supernets.
+
+    Networks contained in another one are removed and sibling networks are
+    replaced by their common supernet (recursively).
+
+    :param networks: list of (network, descriptions)
+    :type networks: list[(ipaddress.IPv4Network, frozenset)]
+    :return: sorted list of (network, descriptions)
+    :rtype: list[(ipaddress.IPv4Network, frozenset)]
+    """
+    stack = []
+    for network, descriptions in sorted(
+            networks, key=lambda n: (n[0].network_address, n[0].prefixlen)):
+        if stack and _contains(stack[-1][0], network):
+            stack[-1] = (stack[-1][0], stack[-1][1] | descriptions)
+            continue
+        stack.append((network, descriptions))
+        while len(stack) >= 2 and \
+                stack[-1][0].prefixlen == stack[-2][0].prefixlen and \
+                stack[-1][0].prefixlen > 0 and \
+                stack[-1][0].supernet() == stack[-2][0].supernet():
+            right = stack.pop()
+            left = stack.pop()
+            stack.append((left[0].supernet(), left[1] | right[1]))
+    return stack
+
+
+def _drop_covered(by_network):
+    """Drop port ranges already allowed on an enclosing network.
+
+    Networks are visited in address order so that the enclosing networks of
+    the current one are always on a stack whose depth is bounded by the
+    prefix length (at most 32). Each port range is then checked against
+    each ancestor with a binary search.
+
+    :param by_network: map network to its sorted list of disjoint
+        (from_port, to_port, descriptions)
+    :type by_network: dict
+    :return: list of (network, from_port, to_port, descriptions)
+    :rtype: list
+    """
+    result = []
+    ancestors = []
+    for network in sorted(by_network,
+                          key=lambda n: (n.network_address, n.prefixlen)):
+        ranges = by_network[network]
+        while ancestors and not _contains(ancestors[-1][0], network):
+            ancestors.pop()
+        for low, high, descriptions in ranges:
+            for _, starts, ends in ancestors:
+                index = bisect_right(starts, low) - 1
+                if index >= 0 and ends[index] >= high:
+                    break
+            else:
+                result.append((network, low, high, descriptions))
+        ancestors.append((network,
+                          [r[0] for r in ranges],
+                          [r[1] for r in ranges]))
+    return result
+
+
+def compact_rules(rules):
+    """Compact a list of security group rules.
+
+    Ipv4IngressRule and Ipv4EgressRule instances with the same protocol are
+    merged: port ranges that overlap or touch are joined, adjacent CIDR
+    blocks sharing a port range are aggregated into supernets and port
+    ranges already allowed by a rule on an enclosing CIDR block are dropped.
+    Description of a resulting rule is kept only if all the rules it
+    replaces share it. Other rules are kept untouched. The overall
+    complexity is O(n log n).
+
+    :param rules: list of rules
+    :type rules: list[GroupSecurityRule]
+    :return: a new list of rules
+    :rtype: list[GroupSecurityRule]
+    """
+    result = []
+    groups = OrderedDict()
+    for rule in rules:
+        network = rule_network(rule)
+        if network is None:
+            result.append(rule)
+            continue
+        descriptions = frozenset([rule.description])
+        proto = protocol_key(rule.ip_protocol)
+        is_range = proto in PORT_RANGE_PROTOCOLS.values() and \
+            isinstance(rule.from_port, int) and \
+            isinstance(rule.to_port, int)
+        key = (rule.__class__, proto, is_range)
+        if key not in groups:
+            groups[key] = (rule.ip_protocol, [])
+        groups[key][1].append(
+            (network, rule.from_port, rule.to_port, descriptions))
+
+    for (cls, _, is_range), (ip_protocol, entries) in groups.items():
+        if is_range:
+            # Merge port ranges for each network
+            by_network = {}
+            for network, low, high, descriptions in entries:
+                by_network.setdefault(network, []).append(
+                    (low, high, descriptions))
+            entries = [(network, low, high, descriptions)
+                       for network, ranges in by_network.items()
+                       for low, high, descriptions
+                       in _merge_port_ranges(ranges)]
+
+        # Aggregate networks sharing the same port range
+        by_ports = OrderedDict()
+        for network, low, high, descriptions in entries:
+            by_ports.setdefault((low, high), []).append(
+                (network, descriptions))
+        entries = [(network, low, high, descriptions)
+                   for (low, high), networks in by_ports.items()
+                   for network, descriptions
+                   in _aggregate_networks(networks)]
+
+        if is_range:
+            # Aggregation may have created new mergeable port ranges
+            by_network = {}
+            for network, low, high, descriptions in entries:
+                by_network.setdefault(network, []).append(
+                    (low, high, descriptions))
+            entries = _drop_covered(
+                {network: _merge_port_ranges(ranges)
+                 for network, ranges in by_network.items()})
+
+        for network, low, high, descriptions in entries:
+            result.append(cls(ip_protocol,
+                              str(network),
+                              from_port=low,
+                              to_port=high,
+                              # None if there is no description or
+                              # several different ones
+                              description=(next(iter(descriptions))
+                                           if len(descriptions) == 1
+                                           else None)))
+    return result
+
+
 class SecurityGroup(Resource):
     """EC2 Security group resource."""
 
@@ -132,6 +346,18 @@ class SecurityGroup(Resource):
         else:
             assert False, "a security group rule is expected"
 
+    def compact(self):
+        """Compact ingress and egress rules.
+
+        See compact_rules for details.
+
+        :return: the security group itself
+        :rtype: SecurityGroup
+        """
+        self.ingress = compact_rules(self.ingress)
+        self.egress = compact_rules(self.egress)
+        return self
+
     @property
     def properties(self):
         result = {'VpcId': self.vpc.ref}
@@ -144,3 +370,252 @@ class SecurityGroup(Resource):
         if self.description is not None:
             result['GroupDescription'] = self.description
         return result
+
+
+class IntervalTree(object):
+    """Static centered interval tree.
+
+    Building the tree is O(n log n). Stabbing and overlap queries are
+    O(log n + k) where k is the number of reported intervals.
+    """
+
+    def __init__(self, intervals):
+        """Initialize an interval tree.
+
+        :param intervals: list of (low, high, value). Bounds are inclusive.
+        :type intervals: list[(int, int, T)]
+        """
+        self.root = self._build(list(intervals))
+
+    @classmethod
+    def _build(cls, intervals):
+        if not intervals:
+            return None
+        bounds = sorted(b for interval in intervals for b in interval[:2])
+        center = bounds[len(bounds) // 2]
+        left = [i for i in intervals if i[1] < center]
+        right = [i for i in intervals if i[0] > center]
+        middle = [i for i in intervals if i[0] <= center <= i[1]]
+        return (center,
+                sorted(middle, key=lambda i: i[0]),
+                sorted(middle, key=lambda i: -i[1]),
+                cls._build(left),
+                cls._build(right))
+
+    def overlap(self, low, high):
+        """Return values of intervals overlapping [low, high].
+
+        :param low: lower bound
+        :type low: int
+        :param high: upper bound
+        :type high: int
+        :rtype: list[T]
+        """
+        result = []
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+            center, by_start, by_end, left, right = node
+            if high < center:
+                for interval in by_start:
+                    if interval[0] > high:
+                        break
+                    result.append(interval[2])
+                nodes.append(left)
+            elif low > center:
+                for interval in by_end:
+                    if interval[1] < low:
+                        break
+                    result.append(interval[2])
+                nodes.append(right)
+            else:
+                result.extend(interval[2] for interval in by_start)
+                nodes.append(left)
+                nodes.append(right)
+        return result
+
+    def covering(self, low, high):
+        """Return values of intervals containing [low, high].
+
+        :param low: lower bound
+        :type low: int
+        :param high: upper bound
+        :type high: int
+        :rtype: list[T]
+        """
+        return [value for value in self.overlap(low, low)
+                if value[1][1] >= high]
+
+
+class _TrieNode(object):
+    """Node of the CIDR prefix trie used by SecurityGroupIndex."""
+
+    __slots__ = ('children', 'entries', 'tree')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.entries = []
+        self.tree = None
+
+    def interval_tree(self):
+        if self.tree is None:
+            self.tree = IntervalTree(
+                (entry[1][0], entry[1][1], entry) for entry in self.entries)
+        return self.tree
+
+
+class SecurityGroupIndex(object):
+    """Index answering "is this traffic allowed" queries.
+
+    Rules are indexed per direction and protocol in a binary prefix trie on
+    their CIDR block. Each trie node holds an interval tree on the port
+    ranges of its rules. A query walks at most 32 trie nodes, each one
+    answered in O(log n), whatever the number of indexed rules.
+
+    Only IPv4 CIDR rules are indexed. Port fields of protocols that do not
+    have ports (icmp, -1, ...) are ignored. Rules with protocol -1 match
+    any protocol.
+    """
+
+    ALL_PORTS = (-1, 65535)
+
+    def __init__(self, groups=None):
+        """Initialize an index.
+
+        :param groups: security groups to index
+        :type groups: list[SecurityGroup] | None
+        """
+        self.tries = {}
+        if groups is not None:
+            for group in groups:
+                self.add(group)
+
+    def add(self, group):
+        """Index the rules of a security group.
+
+        :param group: a security group
+        :type group: SecurityGroup
+        :return: the index itself
+        :rtype: SecurityGroupIndex
+        """
+        for direction, rules in (('ingress', group.ingress),
+                                 ('egress', group.egress)):
+            for rule in rules:
+                network = rule_network(rule)
+                if network is None:
+                    continue
+                proto = protocol_key(rule.ip_protocol)
+                if proto in PORT_RANGE_PROTOCOLS.values() and \
+                        rule.from_port is not None:
+                    ports = (rule.from_port, rule.to_port)
+                else:
+                    ports = self.ALL_PORTS
+                node = self.tries.setdefault((direction, proto), _TrieNode())
+                address = int(network.network_address)
+                for bit in range(network.prefixlen):
+                    child = (address >> (31 - bit)) & 1
+                    if node.children[child] is None:
+                        node.children[child] = _TrieNode()
+                    node = node.children[child]
+                node.entries.append((group, ports, rule))
+                node.tree = None
+        return self
+
+    def query(self, protocol, port, cidr, direction='ingress',
+              covering=False):
+        """Return the rules allowing some traffic.
+
+        :param protocol: ip protocol name or number
+        :type protocol: str | int
+        :param port: a port, an inclusive (from, to) port range or None for
+            any port
+        :type port: int | (int, int) | None
+        :param cidr: an IPv4 address or CIDR block
+        :type cidr: str
+        :param direction: 'ingress' or 'egress'
+        :type direction: str
+        :param covering: if True return only rules allowing all the ports
+            from all the addresses in cidr. Otherwise return the rules
+            allowing at least one of the ports from one of the addresses.
+        :type covering: bool
+        :return: list of (group, rule)
+        :rtype: list[(SecurityGroup, GroupSecurityRule)]
+        """
+        assert direction in ('ingress', 'egress'), \
+            'invalid direction %s' % direction
+        if port is None:
+            low, high = self.ALL_PORTS
+        elif isinstance(port, int):
+            low, high = port, port
+        else:
+            low, high = port
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        address = int(network.network_address)
+
+        proto = protocol_key(protocol)
+        result = []
+        for key in OrderedDict.fromkeys([proto, '-1']):
+            node = self.tries.get((direction, key))
+
+            # Rules on enclosing networks
+            bit = 0
+            while node is not None:
+                if node.entries:
+                    tree = node.interval_tree()
+                    if covering:
+                        result.extend(tree.covering(low, high))
+                    else:
+                        result.extend(tree.overlap(low, high))
+                if bit == network.prefixlen:
+                    break
+                node = node.children[(address >> (31 - bit)) & 1]
+                bit += 1
+
+            # Rules on networks included in the queried one
+            if node is not None and not covering:
+                nodes = [child for child in node.children
+                         if child is not None]
+                while nodes:
+                    node = nodes.pop()
+                    if node.entries:
+                        result.extend(
+                            node.interval_tree().overlap(low, high))
+                    nodes.extend(child for child in node.children
+                                 if child is not None)
+        return [(group, rule) for group, _, rule in result]
+
+    def groups(self, protocol, port, cidr, direction='ingress',
+               covering=False):
+        """Return the security groups allowing some traffic.
+
+        See query for parameters description.
+
+        :rtype: list[SecurityGroup]
+        """
+        result = OrderedDict()
+        for group, _ in self.query(protocol, port, cidr,
+                                   direction=direction,
+                                   covering=covering):
+            result[group.name] = group
+        return list(result.values())
+
+    def query_many(self, queries):
+        """Run several queries.
+
+        Identical queries are answered only once.
+
+        :param queries: list of dicts containing the arguments of query
+        :type queries: list[dict]
+        :return: for each query the list of security groups
+        :rtype: list[list[SecurityGroup]]
+        """
+        cache = {}
+        result = []
+        for query in queries:
+            key = tuple(sorted(query.items()))
+            if key not in cache:
+                cache[key] = self.groups(**query)
+            result.append(cache[key])
+        return result
@@ -0,0 +1,170 @@
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import base64
+import functools
+import gzip
+import hashlib
+import io
+
+from e3.aws.cfn import Base64
+import yaml
+
+# Maximum size of the user data of an instance, before base64 encoding
+MAX_USER_DATA_SIZE = 16384
+
+# Boundary of multipart user data. A constant is used so that the content
+# and thus its hash only depend on the parts.
+MIME_BOUNDARY = '==e3-aws-user-data=='
+
+# Name of the stack mapping holding shared user data
+USER_DATA_MAPPING = 'UserData'
+
+
+class EncodedUserData(str):
+    """Base64 encoded user data, emitted without further encoding."""
+
+
+def _gzip(content):
+    result = io.BytesIO()
+    # Use a fixed mtime to get reproducible output
+    with gzip.GzipFile(fileobj=result, mode='wb', mtime=0) as fd:
+        fd.write(content)
+    return result.getvalue()
+
+
+@functools.lru_cache(maxsize=64)
+def encode_user_data(content, compress=None):
+    """Encode user data.
+
+    The most recent results are memoized.
+
+    :param content: raw user data
+    :type content: bytes
+    :param compress: if True content is gzip compressed, if False it is
+        not, and if None it is compressed only if this reduces the size of
+        the template or is needed to fit MAX_USER_DATA_SIZE
+    :type compress: bool | None
+    :return: a tuple (value, encoded) where encoded is True if value is
+        the base64 of the (compressed) content and False if value is the
+        content as text
+    :rtype: (str, bool)
+    """
+    if compress is not False:
+        compressed = _gzip(content)
+        encoded = base64.b64encode(compressed).decode('ascii')
+        if compress or len(content) > MAX_USER_DATA_SIZE or \
+                len(encoded) < len(content):
+            assert len(compressed) <= MAX_USER_DATA_SIZE, \
+                'compressed user data too large (%s bytes)' % \
+                len(compressed)
+            return encoded, True
+    assert len(content) <= MAX_USER_DATA_SIZE, \
+        'user data too large (%s bytes)' % len(content)
+    try:
+        return content.decode('utf-8'), False
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode('ascii'), True
+
+
+class UserData(object):
+    """Builder of cloud-init user data.
+
+    A single part is emitted as is. Several parts are assembled into a
+    MIME multipart archive that cloud-init processes in order.
+    """
+
+    def __init__(self, compress=None):
+        """Initialize user data.
+
+        :param compress: see encode_user_data
+        :type compress: bool | None
+        """
+        self.compress = compress
+        self.parts = []
+
+    def add(self, content, content_type='text/x-shellscript',
+            filename=None, first=False):
+        """Add a part.
+
+        :param content: content of the part
+        :type content: str
+        :param content_type: MIME type of the part, for example
+            text/x-shellscript, text/cloud-config or text/cloud-boothook
+        :type content_type: str
+        :param filename: name of the part. If None a name is generated
+        :type filename: str | None
+        :param first: if True insert the part before the existing ones
+        :type first: bool
+        :return: the UserData itself
+        :rtype: UserData
+        """
+        assert content_type.startswith('text/'), \
+            'invalid user data part type %s' % content_type
+        part = (content, content_type, filename)
+        if first:
+            self.parts.insert(0, part)
+        else:
+            self.parts.append(part)
+        return self
+
+    def add_cloud_config(self, config):
+        """Add a cloud-config part.
+
+        :param config: cloud-config directives
+        :type config: dict
+        :return: the UserData itself
+        :rtype: UserData
+        """
+        content = yaml.safe_dump(config, default_flow_style=False)
+        return self.add('#cloud-config\n%s' % content,
+                        content_type='text/cloud-config')
+
+    @property
+    def content(self):
+        """Return the raw user data.
+
+        :rtype: bytes
+        """
+        assert self.parts, 'empty user data'
+        if len(self.parts) == 1:
+            return self.parts[0][0].encode('utf-8')
+
+        archive = MIMEMultipart(boundary=MIME_BOUNDARY)
+        for index, (content, content_type, filename) in enumerate(
+                self.parts, 1):
+            part = MIMEText(content, content_type.split('/', 1)[1],
+                            'utf-8')
+            part.add_header('Content-Disposition', 'attachment',
+                            filename=filename or 'part-%03d' % index)
+            archive.attach(part)
+        return archive.as_bytes()
+
+    @property
+    def digest(self):
+        """Return the SHA-256 of the raw user data.
+
+        :rtype: str
+        """
+        return hashlib.sha256(self.content).hexdigest()
+
+    def export(self, stack=None):
+        """Return the value of the UserData property of an instance.
+
+        :param stack: if not None the encoded user data is stored once in
+            a mapping of the stack, indexed by content hash, and the
+            returned value refers to it. This avoids duplicating the user
+            data in the template when it is shared by several instances.
+        :type stack: e3.aws.cfn.Stack | None
+        :return: either the base64 encoded user data, or a Base64
+            intrinsic function that encodes it
+        :rtype: EncodedUserData | e3.aws.cfn.FindInMap | e3.aws.cfn.Base64
+        """
+        content = self.content
+        value, encoded = encode_user_data(content, self.compress)
+        if stack is not None:
+            key = hashlib.sha256(content).hexdigest()[:16]
+            value = stack.add_mapping(USER_DATA_MAPPING,
+                                      key, {'Value': value})['Value']
+        elif encoded:
+            value = EncodedUserData(value)
+        return value if encoded else Base64(value)
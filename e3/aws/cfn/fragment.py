@@ -0,0 +1,156 @@
+"""Structural sharing of template fragments.
+
+Large stacks often contain many resources whose properties are identical
+except for their logical name (instances of a fleet, security group rules,
+network interfaces...). FragmentPool replaces structurally equal
+dicts, lists and intrinsic functions by a single shared copy, so that the
+exported template keeps one copy of each distinct fragment.
+
+Shared fragments are read-only. They are copy-on-write in the sense that
+copy.copy, copy.deepcopy or the copy method return a plain, mutable
+dict or list that can be modified without affecting other resources.
+"""
+import copy
+import yaml
+
+
+class ReadOnlyFragmentError(TypeError):
+    """Raised when a shared fragment is modified."""
+
+    def __init__(self):
+        """Initialize the error."""
+        super(ReadOnlyFragmentError, self).__init__(
+            'shared template fragments are read-only, copy them first')
+
+
+def _read_only(self, *args, **kwargs):
+    raise ReadOnlyFragmentError()
+
+
+class FrozenDict(dict):
+    """Read-only dict returned by FragmentPool."""
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __init__(self, *args, **kwargs):
+        """Initialize a fragment (see dict and list)."""
+        super(FrozenDict, self).__init__(*args, **kwargs)
+        # Structural key, set by the pool that created the fragment
+        self.key = None
+
+    def copy(self):
+        return dict(self)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return {k: copy.deepcopy(v, memo) for k, v in self.items()}
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self), ))
+
+
+class FrozenList(list):
+    """Read-only list returned by FragmentPool."""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = clear = extend = insert = pop = remove = _read_only
+    reverse = sort = _read_only
+
+    def __init__(self, *args, **kwargs):
+        """Initialize a fragment (see dict and list)."""
+        super(FrozenList, self).__init__(*args, **kwargs)
+        # Structural key, set by the pool that created the fragment
+        self.key = None
+
+    def copy(self):
+        return list(self)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in self]
+
+    def __reduce__(self):
+        return (FrozenList, (list(self), ))
+
+
+yaml.add_representer(FrozenDict,
+                     lambda dumper, data: dumper.represent_dict(data))
+yaml.add_representer(FrozenList,
+                     lambda dumper, data: dumper.represent_list(data))
+
+
+class FragmentPool(object):
+    """Pool of shared template fragments.
+
+    Fragments are interned bottom-up: the structural key of a dict or list
+    is built from the identity of its already interned children, so
+    interning a fragment is linear in its size and interning an already
+    interned fragment is O(1).
+    """
+
+    SCALARS = (str, int, float, bool, type(None))
+
+    def __init__(self):
+        """Initialize an empty pool."""
+        # Map structural keys to the shared fragments. As the pool keeps
+        # the fragments alive, the identities used in keys are never reused
+        self.fragments = {}
+        self.hits = 0
+
+    def _intern(self, value):
+        """Intern value.
+
+        :return: a token identifying the structure of value and the shared
+            copy of value
+        :rtype: (T, T)
+        """
+        if isinstance(value, self.SCALARS):
+            return (type(value), value), value
+        elif isinstance(value, (FrozenDict, FrozenList)) and \
+                value.key is not None:
+            key = value.key
+        elif isinstance(value, dict):
+            items = [(k, self._intern(v)) for k, v in value.items()]
+            key = ('dict', tuple((k, token) for k, (token, _) in items))
+            if key not in self.fragments:
+                value = FrozenDict((k, v) for k, (_, v) in items)
+                value.key = key
+        elif isinstance(value, list):
+            items = [self._intern(v) for v in value]
+            key = ('list', tuple(token for token, _ in items))
+            if key not in self.fragments:
+                value = FrozenList(v for _, v in items)
+                value.key = key
+        elif hasattr(value, '__dict__'):
+            # Intrinsic functions such as Ref or GetAtt are identified by
+            # their attributes. They are shared but not copied.
+            key = (type(value), self._intern(vars(value))[0])
+        else:
+            key = ('id', id(value))
+
+        if key in self.fragments:
+            self.hits += 1
+            value = self.fragments[key]
+        else:
+            self.fragments[key] = value
+        # Shared fragments are identified by their identity so that keys
+        # stay small: the key of a fragment does not contain the keys of
+        # its children.
+        return id(value), value
+
+    def intern(self, value):
+        """Return the shared copy of a fragment.
+
+        :param value: a template fragment (as returned by Resource.export)
+        :type value: T
+        :return: a fragment equal to value. Dicts and lists are replaced
+            by FrozenDict and FrozenList instances
+        :rtype: T
+        """
+        return self._intern(value)[1]
+
+    def __len__(self):
+        return len(self.fragments)
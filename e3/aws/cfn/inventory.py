@@ -0,0 +1,216 @@
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+
+from e3.env import Env
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stacks (
+    stack_id TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    creation_time TEXT NOT NULL,
+    last_updated_time TEXT,
+    description TEXT);
+CREATE INDEX IF NOT EXISTS stacks_name ON stacks (name);
+CREATE INDEX IF NOT EXISTS stacks_status ON stacks (status);
+CREATE TABLE IF NOT EXISTS tags (
+    stack_id TEXT NOT NULL REFERENCES stacks (stack_id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (stack_id, key));
+CREATE INDEX IF NOT EXISTS tags_key_value ON tags (key, value);
+"""
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+class StackInventory(object):
+    """Local index of the CloudFormation stacks of several regions.
+
+    Stacks are listed with list_stacks in all regions concurrently. Only
+    new stacks and stacks whose status or last update time changed are
+    then described to retrieve their tags, one at a time or, when many of
+    them changed, with a single paginated describe_stacks of the region.
+    Stacks are stored in a SQLite database that is queried without calling
+    AWS.
+    """
+
+    # When more stacks than that changed in a region, all stacks of the
+    # region are described with a paginated describe_stacks instead of
+    # one request per stack
+    MAX_SINGLE_DESCRIBE = 10
+
+    def __init__(self, path=':memory:', regions=None):
+        """Initialize an inventory.
+
+        :param path: path to the SQLite database. By default the inventory
+            is kept in memory
+        :type path: str
+        :param regions: list of regions. If None use AWSEnv regions
+        :type regions: list[str] | None
+        """
+        if regions is None:
+            regions = Env().aws_env.regions
+        self.regions = regions
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def _known(self, region):
+        return {row['stack_id']: (row['status'], row['last_updated_time'])
+                for row in self.db.execute(
+                    'SELECT stack_id, status, last_updated_time FROM stacks '
+                    'WHERE region = ?', (region, ))}
+
+    def _fetch(self, region, known):
+        """List the stacks of a region and describe the changed ones.
+
+        :return: a tuple (summaries, details) where summaries is the list
+            of all stack summaries and details a dict associating the id of
+            changed stacks to their description (None for deleted stacks)
+        :rtype: (list[dict], dict)
+        """
+        client = Env().aws_env.client('cloudformation', region)
+        summaries = []
+        for page in client.get_paginator('list_stacks').paginate():
+            summaries.extend(page['StackSummaries'])
+
+        details = {}
+        changed = []
+        for summary in summaries:
+            state = (summary['StackStatus'],
+                     _isoformat(summary.get('LastUpdatedTime')))
+            if known.get(summary['StackId']) == state:
+                continue
+            if summary['StackStatus'] == 'DELETE_COMPLETE':
+                details[summary['StackId']] = None
+            else:
+                changed.append(summary['StackId'])
+
+        if len(changed) > self.MAX_SINGLE_DESCRIBE:
+            changed_ids = set(changed)
+            for page in client.get_paginator('describe_stacks').paginate():
+                for stack in page['Stacks']:
+                    if stack['StackId'] in changed_ids:
+                        details[stack['StackId']] = stack
+        else:
+            for stack_id in changed:
+                details[stack_id] = client.describe_stacks(
+                    StackName=stack_id)['Stacks'][0]
+        # Stacks deleted between the two requests
+        for stack_id in changed:
+            details.setdefault(stack_id, None)
+        return summaries, details
+
+    def refresh(self, max_workers=8):
+        """Update the inventory.
+
+        :param max_workers: maximum number of regions handled concurrently
+        :type max_workers: int
+        :return: the number of new or updated stacks
+        :rtype: int
+        """
+        known = {region: self._known(region) for region in self.regions}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                self._fetch, self.regions,
+                [known[region] for region in self.regions]))
+
+        updated = 0
+        # SQLite connections cannot be shared between threads so the
+        # database is only updated once all regions are fetched.
+        with self.db:
+            for region, (summaries, details) in zip(self.regions, results):
+                listed = {s['StackId'] for s in summaries}
+                for stack_id in set(known[region]) - listed:
+                    self.db.execute('DELETE FROM stacks WHERE stack_id = ?',
+                                    (stack_id, ))
+                for summary in summaries:
+                    if summary['StackId'] not in details:
+                        continue
+                    updated += 1
+                    stack = details[summary['StackId']] or {}
+                    self.db.execute(
+                        'INSERT OR REPLACE INTO stacks VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?)',
+                        (summary['StackId'],
+                         region,
+                         summary['StackName'],
+                         summary['StackStatus'],
+                         _isoformat(summary['CreationTime']),
+                         _isoformat(summary.get('LastUpdatedTime')),
+                         stack.get('Description',
+                                   summary.get('TemplateDescription'))))
+                    self.db.execute('DELETE FROM tags WHERE stack_id = ?',
+                                    (summary['StackId'], ))
+                    self.db.executemany(
+                        'INSERT INTO tags VALUES (?, ?, ?)',
+                        [(summary['StackId'], tag['Key'], tag['Value'])
+                         for tag in stack.get('Tags', [])])
+        return updated
+
+    def query(self, name=None, status=None, region=None, tags=None,
+              include_deleted=False):
+        """Search stacks in the inventory.
+
+        :param name: if not None, a name pattern (wildcards * and ? are
+            accepted)
+        :type name: str | None
+        :param status: if not None, a status or a list of statuses
+        :type status: str | list[str] | None
+        :param region: if not None, only return stacks of that region
+        :type region: str | None
+        :param tags: if not None, only return stacks having these tags. A
+            tag with a None value matches any value.
+        :type tags: dict | None
+        :param include_deleted: if True also return deleted stacks
+        :type include_deleted: bool
+        :return: list of dicts with keys stack_id, region, name, status,
+            creation_time, last_updated_time, description and tags, sorted
+            by region and name
+        :rtype: list[dict]
+        """
+        conditions = []
+        params = []
+        if name is not None:
+            conditions.append('name GLOB ?')
+            params.append(name)
+        if status is not None:
+            if isinstance(status, str):
+                status = [status]
+            conditions.append('status IN (%s)' % ', '.join('?' * len(status)))
+            params.extend(status)
+        if not include_deleted:
+            conditions.append("status != 'DELETE_COMPLETE'")
+        if region is not None:
+            conditions.append('region = ?')
+            params.append(region)
+        for key, value in sorted((tags or {}).items()):
+            if value is None:
+                conditions.append('stack_id IN (SELECT stack_id FROM tags '
+                                  'WHERE key = ?)')
+                params.append(key)
+            else:
+                conditions.append('stack_id IN (SELECT stack_id FROM tags '
+                                  'WHERE key = ? AND value = ?)')
+                params.extend([key, value])
+
+        sql = 'SELECT * FROM stacks'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY region, name'
+        result = []
+        for row in self.db.execute(sql, params):
+            stack = dict(row)
+            stack['tags'] = dict(self.db.execute(
+                'SELECT key, value FROM tags WHERE stack_id = ?',
+                (row['stack_id'], )).fetchall())
+            result.append(stack)
+        return result
+
+    def close(self):
+        self.db.close()
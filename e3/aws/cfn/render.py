@@ -0,0 +1,269 @@
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+
+# Name of the file recording the inputs and outputs of the last rendering
+MANIFEST = '.e3-aws-render.json'
+
+
+def load_attribute(spec, default_name='stack'):
+    """Load an object from a module.
+
+    :param spec: MODULE[:NAME] where MODULE is a module name or a path to
+        a Python file and NAME the name of the object in that module
+    :type spec: str
+    :param default_name: name used when spec contains no NAME
+    :type default_name: str
+    :rtype: T
+    """
+    module_name, _, name = spec.partition(':')
+    if module_name.endswith('.py') or os.path.sep in module_name:
+        module_spec = importlib.util.spec_from_file_location(
+            os.path.splitext(os.path.basename(module_name))[0],
+            module_name)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, name or default_name)
+
+
+def load_stack(spec):
+    """Load a stack from a module.
+
+    :param spec: MODULE[:NAME] where NAME is the name of a Stack or of a
+        function returning a Stack (default: stack), see load_attribute
+    :type spec: str
+    :rtype: e3.aws.cfn.Stack
+    """
+    stack = load_attribute(spec)
+    if callable(stack):
+        stack = stack()
+    return stack
+
+
+class RenderResult(object):
+    """Result of the rendering of a stack."""
+
+    def __init__(self, name, path, sha256, build_time=0.0, render_time=0.0,
+                 skipped=False, error=None):
+        """Initialize a render result.
+
+        :param name: name of the stack factory
+        :type name: str
+        :param path: path to the template
+        :type path: str
+        :param sha256: SHA-256 of the template. None if the rendering
+            failed
+        :type sha256: str | None
+        :param build_time: seconds spent creating the Stack object
+        :type build_time: float
+        :param render_time: seconds spent serializing and writing the
+            template
+        :type render_time: float
+        :param skipped: True if the template was reused from a previous run
+        :type skipped: bool
+        :param error: exception raised by the factory or the rendering
+        :type error: Exception | None
+        """
+        self.name = name
+        self.path = path
+        self.sha256 = sha256
+        self.build_time = build_time
+        self.render_time = render_time
+        self.skipped = skipped
+        self.error = error
+
+    def __str__(self):
+        if self.error is not None:
+            return '%-40s FAILED: %s' % (self.name, self.error)
+        return '%-40s %s %s' % (
+            self.name, self.sha256[:12],
+            'skipped' if self.skipped else
+            'build %.3fs render %.3fs' % (self.build_time, self.render_time))
+
+
+def _factory_file(factory):
+    """Return the path to the source file of a factory.
+
+    :rtype: str | None
+    """
+    if isinstance(factory, str):
+        module_name = factory.partition(':')[0]
+        if module_name.endswith('.py') or os.path.sep in module_name:
+            return module_name
+        spec = importlib.util.find_spec(module_name)
+        return spec.origin if spec is not None else None
+    module = sys.modules.get(factory.__module__)
+    return getattr(module, '__file__', None)
+
+
+def _files_digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode('utf-8'))
+        with open(path, 'rb') as fd:
+            digest.update(hashlib.sha256(fd.read()).digest())
+    return digest.hexdigest()
+
+
+_LIBRARY_DIGEST = []
+
+
+def library_digest():
+    """Return a hash of the installed e3-aws.
+
+    It combines the package version, when e3-aws is installed, with the
+    content of its modules and data files, so that development trees are
+    also covered.
+
+    :rtype: str
+    """
+    if not _LIBRARY_DIGEST:
+        import pkg_resources
+        try:
+            version = pkg_resources.get_distribution('e3-aws').version
+        except pkg_resources.DistributionNotFound:
+            version = None
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+            paths.extend(os.path.join(dirpath, f) for f in sorted(filenames)
+                         if f.endswith(('.py', '.yaml')))
+        _LIBRARY_DIGEST.append('%s:%s' % (version, _files_digest(paths)))
+    return _LIBRARY_DIGEST[0]
+
+
+def input_hash(factory, params, extra_inputs=None):
+    """Return a hash of the inputs of a stack factory.
+
+    The inputs are the factory name, its parameters, the content of the
+    source file defining it, e3-aws itself (see library_digest) and the
+    content of extra_inputs. Note that changes in other modules imported
+    by the factory are detected only if they are listed in extra_inputs.
+
+    :param factory: a stack factory (see render_stacks)
+    :type factory: str | callable
+    :param params: parameters of the factory
+    :type params: dict
+    :param extra_inputs: additional input files. Glob patterns (including
+        ** for recursive matching) are accepted.
+    :type extra_inputs: list[str] | None
+    :rtype: str
+    """
+    if isinstance(factory, str):
+        factory_id = factory
+    else:
+        factory_id = '%s:%s' % (factory.__module__, factory.__qualname__)
+    paths = []
+    path = _factory_file(factory)
+    if path is not None and os.path.isfile(path):
+        paths.append(path)
+    for pattern in extra_inputs or []:
+        matches = sorted(p for p in glob.glob(pattern, recursive=True)
+                         if os.path.isfile(p))
+        assert matches, 'no input file matches %s' % pattern
+        paths.extend(matches)
+    return hashlib.sha256(json.dumps(
+        [factory_id, params, library_digest(), _files_digest(paths)],
+        sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _render(name, factory, params, path):
+    """Build a stack and write its template (run in worker processes).
+
+    :rtype: RenderResult
+    """
+    start = time.perf_counter()
+    if isinstance(factory, str):
+        factory = load_attribute(factory)
+    stack = factory(**params)
+    built = time.perf_counter()
+    body = stack.body
+    with open(path, 'w') as fd:
+        fd.write(body)
+    return RenderResult(name, path,
+                        hashlib.sha256(body.encode('utf-8')).hexdigest(),
+                        build_time=built - start,
+                        render_time=time.perf_counter() - built)
+
+
+def render_stacks(factories, output_dir, params=None, skip_unchanged=False,
+                  extra_inputs=None, max_workers=None):
+    """Build and render stacks in parallel processes.
+
+    :param factories: dict associating a name to a stack factory, that is
+        a function returning a Stack. Factories can be given as
+        MODULE[:NAME] strings (see load_attribute) or as
+        functions defined at the top level of a module, since they are sent
+        to worker processes. The template of a factory is written in
+        output_dir/<name>.yaml.
+    :type factories: dict
+    :param output_dir: directory in which templates are written
+    :type output_dir: str
+    :param params: dict associating factory names to the keyword arguments
+        (JSON serializable) passed to the factory
+    :type params: dict | None
+    :param skip_unchanged: if True, stacks whose inputs (see input_hash)
+        are the same as in the previous run, and whose template is still
+        present, are not rendered again
+    :type skip_unchanged: bool
+    :param extra_inputs: files or glob patterns, such as shared modules
+        imported by the factories, whose changes trigger the rendering of
+        all stacks (see input_hash)
+    :type extra_inputs: list[str] | None
+    :param max_workers: number of worker processes. If None use the number
+        of CPUs
+    :type max_workers: int | None
+    :return: a dict associating factory names to their RenderResult. The
+        failure of a factory does not stop the others, its error is set in
+        its result.
+    :rtype: dict
+    """
+    params = params or {}
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as fd:
+            manifest = json.load(fd)
+
+    results = {}
+    inputs = {}
+    jobs = []
+    for name, factory in sorted(factories.items()):
+        path = os.path.join(output_dir, '%s.yaml' % name)
+        inputs[name] = input_hash(factory, params.get(name, {}),
+                                  extra_inputs)
+        previous = manifest.get(name)
+        if skip_unchanged and previous is not None and \
+                previous['inputs'] == inputs[name] and os.path.isfile(path):
+            results[name] = RenderResult(name, path, previous['sha256'],
+                                         skipped=True)
+        else:
+            jobs.append((name, factory, params.get(name, {}), path))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_render, *job) for job in jobs]
+            for (name, _, _, path), future in zip(jobs, futures):
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = RenderResult(name, path, None, error=e)
+
+    # Failed stacks are not recorded so that they are rendered next time
+    with open(manifest_path, 'w') as fd:
+        json.dump({name: {'inputs': inputs[name],
+                          'sha256': result.sha256}
+                   for name, result in results.items()
+                   if result.error is None}, fd, indent=2, sort_keys=True)
+    return results
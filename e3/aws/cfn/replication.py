@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from e3.aws.ec2.ami import AMI
+from e3.env import Env
+
+
+class RegionResult(object):
+    """Result of the replication of a stack in a region."""
+
+    def __init__(self, region):
+        """Initialize a region result.
+
+        :param region: the region
+        :type region: str
+        """
+        self.region = region
+        self.images = {}
+        self.stack = None
+        self.body = None
+        self.response = None
+        self.error = None
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def __str__(self):
+        if self.error is not None:
+            return '%-16s FAILED: %s' % (self.region, self.error)
+        elif self.response is not None:
+            return '%-16s %s' % (self.region, self.response.get('StackId'))
+        return '%-16s rendered' % self.region
+
+
+def _replicate(result, stack_factory, images, owners, deploy):
+    try:
+        if images:
+            result.images = AMI.find(images, region=result.region,
+                                     owners=owners)
+            missing = set(images) - set(result.images)
+            assert not missing, \
+                'cannot find AMI %s' % ', '.join(sorted(missing))
+        result.stack = stack_factory(result.region, result.images)
+        result.body = result.stack.body
+        if deploy:
+            result.response = result.stack.create(region=result.region)
+    except Exception as e:
+        result.error = e
+
+
+def replicate(stack_factory, regions=None, images=None, owners=None,
+              deploy=True, max_workers=8):
+    """Deploy a stack in several regions.
+
+    In each region the AMIs are resolved with a single request (see
+    AMI.find), then the stack is rendered and deployed. Regions are handled
+    concurrently and a failure in a region does not prevent the deployment
+    in the other ones.
+
+    :param stack_factory: function taking a region and a dict associating
+        AMI names to the AMI of that region, and returning the Stack to
+        deploy in that region. The function is called concurrently for the
+        different regions so it should not rely on the default region.
+    :type stack_factory: (str, dict) -> e3.aws.cfn.Stack
+    :param regions: list of regions. If None use AWSEnv regions
+    :type regions: list[str] | None
+    :param images: names of the AMIs passed to stack_factory
+    :type images: list[str] | None
+    :param owners: owners of the AMIs (see AMI.find)
+    :type owners: list[str] | None
+    :param deploy: if False only render the templates
+    :type deploy: bool
+    :param max_workers: maximum number of regions handled concurrently
+    :type max_workers: int
+    :return: a dict associating each region to its RegionResult
+    :rtype: dict
+    """
+    if regions is None:
+        regions = Env().aws_env.regions
+    results = {region: RegionResult(region) for region in regions}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for result in results.values():
+            executor.submit(_replicate, result, stack_factory, images,
+                            owners, deploy)
+    return results
@@ -1,5 +1,131 @@
 from e3.aws.cfn import AWSType, Resource
 
+# Valid values of the Failover property
+FAILOVER_TYPES = ('PRIMARY', 'SECONDARY')
+
+
+class AliasTarget(object):
+    """Target of an alias record."""
+
+    def __init__(self, dns_name, hosted_zone_id,
+                 evaluate_target_health=False):
+        """Initialize an alias target.
+
+        :param dns_name: DNS name of the target (load balancer, CloudFront
+            distribution, S3 website endpoint, record of the same zone...)
+        :type dns_name: str | e3.aws.cfn.GetAtt
+        :param hosted_zone_id: id of the hosted zone of the target
+        :type hosted_zone_id: str | e3.aws.cfn.GetAtt
+        :param evaluate_target_health: if True the record is considered
+            unhealthy when the target is
+        :type evaluate_target_health: bool
+        """
+        self.dns_name = dns_name
+        self.hosted_zone_id = hosted_zone_id
+        self.evaluate_target_health = evaluate_target_health
+
+    @property
+    def properties(self):
+        return {'DNSName': self.dns_name,
+                'HostedZoneId': self.hosted_zone_id,
+                'EvaluateTargetHealth': self.evaluate_target_health}
+
+
+class HealthCheck(Resource):
+    """Route53 health check."""
+
+    ATTRIBUTES = ('HealthCheckId',)
+
+    CHECK_TYPES = ('HTTP', 'HTTPS', 'HTTP_STR_MATCH', 'HTTPS_STR_MATCH',
+                   'TCP')
+
+    def __init__(self, name,
+                 check_type='HTTPS',
+                 fqdn=None,
+                 ip_address=None,
+                 port=None,
+                 resource_path=None,
+                 search_string=None,
+                 request_interval=30,
+                 failure_threshold=3,
+                 measure_latency=False,
+                 regions=None):
+        """Initialize a health check.
+
+        :param name: logical name used in the stack
+        :type name: str
+        :param check_type: one of CHECK_TYPES
+        :type check_type: str
+        :param fqdn: domain name of the checked endpoint
+        :type fqdn: str | None
+        :param ip_address: IP address of the checked endpoint. At least one
+            of fqdn and ip_address should be set
+        :type ip_address: str | None
+        :param port: port of the endpoint. If None the default port of the
+            protocol is used
+        :type port: int | None
+        :param resource_path: path requested by HTTP(S) checks
+        :type resource_path: str | None
+        :param search_string: string expected in the response body of
+            *_STR_MATCH checks
+        :type search_string: str | None
+        :param request_interval: seconds between two checks (10 or 30)
+        :type request_interval: int
+        :param failure_threshold: number of consecutive failed checks (1 to
+            10) before the endpoint is considered unhealthy
+        :type failure_threshold: int
+        :param measure_latency: if True latency is measured and reported
+            in CloudWatch
+        :type measure_latency: bool
+        :param regions: regions from which the checks are done. If None
+            Route53 default regions are used
+        :type regions: list[str] | None
+        """
+        super(HealthCheck, self).__init__(
+            name, kind=AWSType.ROUTE53_HEALTH_CHECK)
+        assert check_type in self.CHECK_TYPES, \
+            'invalid health check type %s' % check_type
+        assert fqdn is not None or ip_address is not None, \
+            'health check needs a domain name or an IP address'
+        assert (search_string is not None) == \
+            check_type.endswith('_STR_MATCH'), \
+            'search string required only by *_STR_MATCH checks'
+        assert request_interval in (10, 30), \
+            'invalid request interval %s' % request_interval
+        assert 1 <= failure_threshold <= 10, \
+            'invalid failure threshold %s' % failure_threshold
+        self.check_type = check_type
+        self.fqdn = fqdn
+        self.ip_address = ip_address
+        self.port = port
+        self.resource_path = resource_path
+        self.search_string = search_string
+        self.request_interval = request_interval
+        self.failure_threshold = failure_threshold
+        self.measure_latency = measure_latency
+        self.regions = regions
+
+    @property
+    def properties(self):
+        config = {'Type': self.check_type,
+                  'RequestInterval': self.request_interval,
+                  'FailureThreshold': self.failure_threshold}
+        if self.fqdn is not None:
+            config['FullyQualifiedDomainName'] = self.fqdn
+        if self.ip_address is not None:
+            config['IPAddress'] = self.ip_address
+        if self.port is not None:
+            config['Port'] = self.port
+        if self.resource_path is not None:
+            config['ResourcePath'] = self.resource_path
+        if self.search_string is not None:
+            config['SearchString'] = self.search_string
+        if self.measure_latency:
+            config['MeasureLatency'] = True
+        if self.regions is not None:
+            config['Regions'] = self.regions
+        return {'HealthCheckConfig': config}
+
 
 class RecordSet(Resource):
     """DNS Record."""
@@ -9,8 +135,14 @@ class RecordSet(Resource):
                  hosted_zone_name,
                  dns_name,
                  dns_type,
-                 ttl,
-                 resource_records):
+                 ttl=None,
+                 resource_records=None,
+                 set_identifier=None,
+                 region=None,
+                 weight=None,
+                 failover=None,
+                 alias_target=None,
+                 health_check=None):
         """Initialize a DNS Record.
 
         :param name: logical name used in the stack
@@ -21,22 +153,235 @@ class RecordSet(Resource):
         :type dns_name: str
         :param dns_type: record type
         :type dns_type: str
-        :param ttl: dns TTL
-        :type ttl: int
-        :param resource_records: list of resourses associated with the entry
-        :type resource_records: list[str]
+        :param ttl: dns TTL. Should be None only for alias records
+        :type ttl: int | None
+        :param resource_records: list of resourses associated with the entry.
+            Should be None only for alias records
+        :type resource_records: list[str] | None
+        :param set_identifier: identifier distinguishing the records with
+            the same name and type. Required by latency, weighted and
+            failover routing
+        :type set_identifier: str | None
+        :param region: if not None use latency routing, the record being
+            associated with that region
+        :type region: str | None
+        :param weight: if not None use weighted routing (0 to 255)
+        :type weight: int | None
+        :param failover: if not None use failover routing (see
+            FAILOVER_TYPES)
+        :type failover: str | None
+        :param alias_target: if not None the record is an alias
+        :type alias_target: AliasTarget | None
+        :param health_check: health check associated with the record
+        :type health_check: HealthCheck | str | None
         """
         super(RecordSet, self).__init__(name, kind=AWSType.ROUTE53_RECORDSET)
+        policies = [p for p in (region, weight, failover) if p is not None]
+        assert len(policies) <= 1, 'only one routing policy can be used'
+        assert (set_identifier is None) == (not policies), \
+            'set_identifier is required by routing policies'
+        assert weight is None or 0 <= weight <= 255, \
+            'invalid weight %s' % weight
+        assert failover is None or failover in FAILOVER_TYPES, \
+            'invalid failover type %s' % failover
+        if alias_target is None:
+            assert ttl is not None and resource_records, \
+                'ttl and resource_records are required'
+        else:
+            assert isinstance(alias_target, AliasTarget)
+            assert ttl is None and resource_records is None, \
+                'alias records have no ttl or resource_records'
         self.hosted_zone_name = hosted_zone_name
         self.dns_name = dns_name
         self.dns_type = dns_type
         self.ttl = ttl
         self.resource_records = resource_records
+        self.set_identifier = set_identifier
+        self.region = region
+        self.weight = weight
+        self.failover = failover
+        self.alias_target = alias_target
+        self.health_check = health_check
+
+    @property
+    def properties(self):
+        result = {'HostedZoneName': self.hosted_zone_name,
+                  'Name': self.dns_name,
+                  'Type': self.dns_type}
+        if self.alias_target is None:
+            result['TTL'] = self.ttl
+            result['ResourceRecords'] = self.resource_records
+        else:
+            result['AliasTarget'] = self.alias_target.properties
+        if self.set_identifier is not None:
+            result['SetIdentifier'] = self.set_identifier
+        if self.region is not None:
+            result['Region'] = self.region
+        if self.weight is not None:
+            result['Weight'] = self.weight
+        if self.failover is not None:
+            result['Failover'] = self.failover
+        if isinstance(self.health_check, HealthCheck):
+            result['HealthCheckId'] = self.health_check.ref
+        elif self.health_check is not None:
+            result['HealthCheckId'] = self.health_check
+        return result
+
+
+def latency_record_sets(name, hosted_zone_name, dns_name, targets,
+                        dns_type='CNAME', ttl=60, health_checks=None):
+    """Create one latency record per region.
+
+    Clients are routed to the region with the lowest latency among those
+    whose record is healthy.
+
+    :param name: prefix of the logical names of the records. The region
+        name is appended to it
+    :type name: str
+    :param hosted_zone_name: name of the domain for the hosted zone
+    :type hosted_zone_name: str
+    :param dns_name: domain name (fqdn)
+    :type dns_name: str
+    :param targets: dict associating a region to the target of the record
+        in that region: either a value of the record or an AliasTarget
+    :type targets: dict
+    :param dns_type: record type
+    :type dns_type: str
+    :param ttl: dns TTL of non alias records
+    :type ttl: int
+    :param health_checks: dict associating regions to the health check
+        of their target
+    :type health_checks: dict | None
+    :return: the list of records, sorted by region
+    :rtype: list[RecordSet]
+    """
+    health_checks = health_checks or {}
+    result = []
+    for region, target in sorted(targets.items()):
+        if isinstance(target, AliasTarget):
+            kwargs = {'alias_target': target}
+        else:
+            kwargs = {'ttl': ttl, 'resource_records': [target]}
+        result.append(RecordSet(
+            name + ''.join(c for c in region.title() if c.isalnum()),
+            hosted_zone_name,
+            dns_name,
+            dns_type,
+            set_identifier=region,
+            region=region,
+            health_check=health_checks.get(region),
+            **kwargs))
+    return result
+
+
+class RecordSetGroup(Resource):
+    """Group of DNS Records of a hosted zone."""
+
+    def __init__(self, name, hosted_zone_name, record_sets=None,
+                 comment=None):
+        """Initialize a group of DNS records.
+
+        :param name: logical name used in the stack
+        :type name: str
+        :param hosted_zone_name: name of the domain for the hosted zone
+        :type hosted_zone_name: str
+        :param record_sets: list of records. All of them should belong to
+            hosted_zone_name.
+        :type record_sets: list[RecordSet] | None
+        :param comment: optional comment
+        :type comment: str | None
+        """
+        super(RecordSetGroup, self).__init__(
+            name, kind=AWSType.ROUTE53_RECORDSET_GROUP)
+        self.hosted_zone_name = hosted_zone_name
+        self.comment = comment
+        self.record_sets = []
+        if record_sets is not None:
+            for record_set in record_sets:
+                self.add(record_set)
+
+    def add(self, record_set):
+        """Add a record to the group.
+
+        :param record_set: a record
+        :type record_set: RecordSet
+        :return: the group itself
+        :rtype: RecordSetGroup
+        """
+        assert isinstance(record_set, RecordSet)
+        assert record_set.hosted_zone_name == self.hosted_zone_name, \
+            'record %s does not belong to %s' % (record_set.name,
+                                                 self.hosted_zone_name)
+        self.record_sets.append(record_set)
+        return self
 
     @property
     def properties(self):
-        return {'HostedZoneName': self.hosted_zone_name,
-                'Name': self.dns_name,
-                'Type': self.dns_type,
-                'TTL': self.ttl,
-                'ResourceRecords': self.resource_records}
+        record_sets = []
+        for record_set in self.record_sets:
+            properties = dict(record_set.properties)
+            del properties['HostedZoneName']
+            record_sets.append(properties)
+        result = {'HostedZoneName': self.hosted_zone_name,
+                  'RecordSets': record_sets}
+        if self.comment is not None:
+            result['Comment'] = self.comment
+        return result
+
+
+# Maximum number of records in a RecordSetGroup. The group is updated by
+# CloudFormation in a single Route53 change batch limited to 1000 records,
+# with UPSERT actions counting twice.
+MAX_GROUP_RECORDS = 500
+
+
+def group_record_sets(stack, max_records=MAX_GROUP_RECORDS):
+    """Fold the RecordSet resources of a stack into RecordSetGroup resources.
+
+    RecordSet resources sharing a hosted zone are replaced by as few groups
+    as possible. Ref to a folded RecordSet are replaced by its domain name
+    (the value returned by Ref for a RecordSet) and DependsOn are redirected
+    to the group.
+
+    :param stack: a stack
+    :type stack: e3.aws.cfn.Stack
+    :param max_records: maximum number of records in a group
+    :type max_records: int
+    :return: the list of created groups
+    :rtype: list[RecordSetGroup]
+    """
+    zones = {}
+    for resource in list(stack.resources.values()):
+        if isinstance(resource, RecordSet):
+            zones.setdefault(resource.hosted_zone_name, []).append(resource)
+
+    result = []
+    for zone_name, record_sets in sorted(zones.items()):
+        prefix = ''.join(c for c in zone_name.title() if c.isalnum()) + \
+            'Records'
+        group = None
+        group_records = 0
+        index = 0
+        for record_set in record_sets:
+            records = max(len(record_set.resource_records or []), 1)
+            if group is None or group_records + records > max_records:
+                index += 1
+                while '%s%s' % (prefix, index) in stack.resources:
+                    index += 1
+                group = RecordSetGroup('%s%s' % (prefix, index), zone_name)
+                group.depends = []
+                group_records = 0
+                stack.add(group)
+                result.append(group)
+            group.add(record_set)
+            group_records += records
+            if isinstance(record_set.depends, list):
+                group.depends.extend(record_set.depends)
+            elif record_set.depends is not None:
+                group.depends.append(record_set.depends)
+            stack.remove(record_set.name, group.name,
+                         ref=record_set.dns_name)
+
+    for group in result:
+        group.depends = group.depends or None
+    return result
@@ -16,11 +16,299 @@ class AccessControl(Enum):
     PUBLIC_WRITE = 'PublicReadWrite'
 
 
+def tag_filters(tags):
+    """Return the TagFilters property for a dict of tags.
+
+    :param tags: a dict of key/value tags
+    :type tags: dict
+    :rtype: list[dict]
+    """
+    return [{'Key': k, 'Value': v} for k, v in sorted(tags.items())]
+
+
+class BucketConfiguration(object):
+    """Base class for the named configurations of a bucket."""
+
+    # Maximum length of the configuration id
+    MAX_ID_LENGTH = 64
+
+    def __init__(self, config_id, prefix=None, tags=None):
+        """Initialize a bucket configuration.
+
+        :param config_id: identifier of the configuration, unique in the
+            bucket
+        :type config_id: str
+        :param prefix: if not None, the configuration applies only to the
+            objects with that key prefix
+        :type prefix: str | None
+        :param tags: if not None, the configuration applies only to the
+            objects having these tags
+        :type tags: dict | None
+        """
+        assert 0 < len(config_id) <= self.MAX_ID_LENGTH, \
+            'invalid configuration id %s' % config_id
+        self.config_id = config_id
+        self.prefix = prefix
+        self.tags = tags
+
+    @property
+    def properties(self):
+        result = {'Id': self.config_id}
+        if self.prefix is not None:
+            result['Prefix'] = self.prefix
+        if self.tags:
+            result['TagFilters'] = tag_filters(self.tags)
+        return result
+
+
+class LifecycleRule(BucketConfiguration):
+    """Lifecycle rule of a bucket."""
+
+    MAX_ID_LENGTH = 255
+
+    # Storage classes and minimum number of days before a transition
+    TRANSITIONS = {'DEEP_ARCHIVE': 0,
+                   'GLACIER': 0,
+                   'GLACIER_IR': 0,
+                   'INTELLIGENT_TIERING': 0,
+                   'ONEZONE_IA': 30,
+                   'STANDARD_IA': 30}
+
+    def __init__(self, config_id,
+                 prefix=None,
+                 tags=None,
+                 abort_incomplete_multipart_days=None,
+                 expiration_days=None,
+                 noncurrent_expiration_days=None,
+                 transitions=None,
+                 enabled=True):
+        """Initialize a lifecycle rule.
+
+        :param config_id: identifier of the rule
+        :type config_id: str
+        :param prefix: see BucketConfiguration
+        :type prefix: str | None
+        :param tags: see BucketConfiguration
+        :type tags: dict | None
+        :param abort_incomplete_multipart_days: number of days after which
+            incomplete multipart uploads are aborted and their parts deleted
+        :type abort_incomplete_multipart_days: int | None
+        :param expiration_days: number of days after which objects expire
+        :type expiration_days: int | None
+        :param noncurrent_expiration_days: number of days after which
+            noncurrent object versions are deleted
+        :type noncurrent_expiration_days: int | None
+        :param transitions: dict associating a storage class (see
+            TRANSITIONS) to the number of days after which objects are
+            moved to it
+        :type transitions: dict | None
+        :param enabled: whether the rule is enabled
+        :type enabled: bool
+        """
+        super(LifecycleRule, self).__init__(config_id, prefix, tags)
+        assert abort_incomplete_multipart_days is not None or \
+            expiration_days is not None or \
+            noncurrent_expiration_days is not None or transitions, \
+            'lifecycle rule %s has no action' % config_id
+        for days in (abort_incomplete_multipart_days,
+                     expiration_days,
+                     noncurrent_expiration_days):
+            assert days is None or days >= 1, 'invalid number of days'
+        for storage_class, days in (transitions or {}).items():
+            assert storage_class in self.TRANSITIONS, \
+                'invalid storage class %s' % storage_class
+            assert days >= self.TRANSITIONS[storage_class], \
+                'transition to %s requires at least %s days' % (
+                    storage_class, self.TRANSITIONS[storage_class])
+            assert expiration_days is None or days < expiration_days, \
+                'transition to %s after expiration' % storage_class
+        self.abort_incomplete_multipart_days = abort_incomplete_multipart_days
+        self.expiration_days = expiration_days
+        self.noncurrent_expiration_days = noncurrent_expiration_days
+        self.transitions = transitions
+        self.enabled = enabled
+
+    @property
+    def properties(self):
+        result = super(LifecycleRule, self).properties
+        result['Status'] = 'Enabled' if self.enabled else 'Disabled'
+        if self.abort_incomplete_multipart_days is not None:
+            result['AbortIncompleteMultipartUpload'] = {
+                'DaysAfterInitiation': self.abort_incomplete_multipart_days}
+        if self.expiration_days is not None:
+            result['ExpirationInDays'] = self.expiration_days
+        if self.noncurrent_expiration_days is not None:
+            result['NoncurrentVersionExpiration'] = {
+                'NoncurrentDays': self.noncurrent_expiration_days}
+        if self.transitions:
+            result['Transitions'] = [
+                {'StorageClass': storage_class, 'TransitionInDays': days}
+                for storage_class, days in sorted(self.transitions.items(),
+                                                  key=lambda t: t[1])]
+        return result
+
+
+class IntelligentTieringConfiguration(BucketConfiguration):
+    """Archive tiers of the S3 Intelligent-Tiering storage class."""
+
+    ARCHIVE_DAYS = (90, 730)
+    DEEP_ARCHIVE_DAYS = (180, 730)
+
+    def __init__(self, config_id,
+                 prefix=None,
+                 tags=None,
+                 archive_days=None,
+                 deep_archive_days=None,
+                 enabled=True):
+        """Initialize an Intelligent-Tiering configuration.
+
+        :param config_id: identifier of the configuration
+        :type config_id: str
+        :param prefix: see BucketConfiguration
+        :type prefix: str | None
+        :param tags: see BucketConfiguration
+        :type tags: dict | None
+        :param archive_days: number of days without access after which
+            objects move to the Archive Access tier
+        :type archive_days: int | None
+        :param deep_archive_days: number of days without access after
+            which objects move to the Deep Archive Access tier
+        :type deep_archive_days: int | None
+        :param enabled: whether the configuration is enabled
+        :type enabled: bool
+        """
+        super(IntelligentTieringConfiguration, self).__init__(
+            config_id, prefix, tags)
+        assert archive_days is not None or deep_archive_days is not None, \
+            'at least one archive tier should be set'
+        assert archive_days is None or \
+            self.ARCHIVE_DAYS[0] <= archive_days <= self.ARCHIVE_DAYS[1], \
+            'archive days should be in %s-%s' % self.ARCHIVE_DAYS
+        assert deep_archive_days is None or \
+            self.DEEP_ARCHIVE_DAYS[0] <= deep_archive_days <= \
+            self.DEEP_ARCHIVE_DAYS[1], \
+            'deep archive days should be in %s-%s' % self.DEEP_ARCHIVE_DAYS
+        assert archive_days is None or deep_archive_days is None or \
+            archive_days < deep_archive_days, \
+            'deep archive tier should be reached after archive tier'
+        self.archive_days = archive_days
+        self.deep_archive_days = deep_archive_days
+        self.enabled = enabled
+
+    @property
+    def properties(self):
+        result = super(IntelligentTieringConfiguration, self).properties
+        result['Status'] = 'Enabled' if self.enabled else 'Disabled'
+        result['Tierings'] = []
+        if self.archive_days is not None:
+            result['Tierings'].append({'AccessTier': 'ARCHIVE_ACCESS',
+                                       'Days': self.archive_days})
+        if self.deep_archive_days is not None:
+            result['Tierings'].append({'AccessTier': 'DEEP_ARCHIVE_ACCESS',
+                                       'Days': self.deep_archive_days})
+        return result
+
+
+class MetricsConfiguration(BucketConfiguration):
+    """CloudWatch request metrics for (a subset of) a bucket."""
+
+    pass
+
+
+class InventoryConfiguration(BucketConfiguration):
+    """Inventory report of a bucket."""
+
+    FORMATS = ('CSV', 'ORC', 'Parquet')
+    FREQUENCIES = ('Daily', 'Weekly')
+    OPTIONAL_FIELDS = ('BucketKeyStatus',
+                       'ChecksumAlgorithm',
+                       'ETag',
+                       'EncryptionStatus',
+                       'IntelligentTieringAccessTier',
+                       'IsMultipartUploaded',
+                       'LastModifiedDate',
+                       'ObjectLockLegalHoldStatus',
+                       'ObjectLockMode',
+                       'ObjectLockRetainUntilDate',
+                       'ReplicationStatus',
+                       'Size',
+                       'StorageClass')
+
+    def __init__(self, config_id, destination,
+                 prefix=None,
+                 destination_prefix=None,
+                 report_format='CSV',
+                 frequency='Daily',
+                 all_versions=False,
+                 fields=None,
+                 enabled=True):
+        """Initialize an inventory configuration.
+
+        :param config_id: identifier of the configuration
+        :type config_id: str
+        :param destination: bucket in which reports are stored
+        :type destination: Bucket | str
+        :param prefix: see BucketConfiguration
+        :type prefix: str | None
+        :param destination_prefix: prefix of the reports in destination
+        :type destination_prefix: str | None
+        :param report_format: one of FORMATS
+        :type report_format: str
+        :param frequency: one of FREQUENCIES
+        :type frequency: str
+        :param all_versions: if True list all object versions, otherwise
+            only current versions
+        :type all_versions: bool
+        :param fields: optional fields included in the report (see
+            OPTIONAL_FIELDS)
+        :type fields: list[str] | None
+        :param enabled: whether the inventory is enabled
+        :type enabled: bool
+        """
+        super(InventoryConfiguration, self).__init__(config_id, prefix)
+        assert report_format in self.FORMATS, \
+            'invalid inventory format %s' % report_format
+        assert frequency in self.FREQUENCIES, \
+            'invalid inventory frequency %s' % frequency
+        for field in fields or ():
+            assert field in self.OPTIONAL_FIELDS, \
+                'invalid inventory field %s' % field
+        self.destination = destination
+        self.destination_prefix = destination_prefix
+        self.report_format = report_format
+        self.frequency = frequency
+        self.all_versions = all_versions
+        self.fields = fields
+        self.enabled = enabled
+
+    @property
+    def properties(self):
+        result = super(InventoryConfiguration, self).properties
+        if isinstance(self.destination, Bucket):
+            destination = {'BucketArn': self.destination.arn}
+        else:
+            destination = {'BucketArn': self.destination}
+        destination['Format'] = self.report_format
+        if self.destination_prefix is not None:
+            destination['Prefix'] = self.destination_prefix
+        result['Destination'] = destination
+        result['Enabled'] = self.enabled
+        result['IncludedObjectVersions'] = \
+            'All' if self.all_versions else 'Current'
+        result['ScheduleFrequency'] = self.frequency
+        if self.fields:
+            result['OptionalFields'] = list(self.fields)
+        return result
+
+
 class Bucket(Resource):
     """S3 Bucket."""
 
     ATTRIBUTES = ('Arn', 'DomainName')
 
+    # Maximum number of configurations of each kind
+    MAX_CONFIGURATIONS = 1000
+
     def __init__(self, name, access_control=None):
         """Initialize a S3 bucket.
 
@@ -36,11 +324,100 @@ class Bucket(Resource):
         else:
             assert isinstance(access_control, AccessControl)
             self.access_control = access_control
+        self.transfer_acceleration = None
+        self.lifecycle_rules = []
+        self.intelligent_tiering = []
+        self.metrics = []
+        self.inventories = []
 
     @property
     def arn(self):
         return self.getatt('Arn')
 
+    def set_transfer_acceleration(self, enabled=True):
+        """Enable or suspend S3 Transfer Acceleration.
+
+        :param enabled: if False acceleration is suspended
+        :type enabled: bool
+        :return: the bucket itself
+        :rtype: Bucket
+        """
+        self.transfer_acceleration = enabled
+        return self
+
+    def _add_configuration(self, configurations, configuration, kind):
+        assert isinstance(configuration, kind)
+        assert len(configurations) < self.MAX_CONFIGURATIONS, \
+            'too many %s' % kind.__name__
+        assert configuration.config_id not in \
+            [c.config_id for c in configurations], \
+            'duplicate %s %s' % (kind.__name__, configuration.config_id)
+        configurations.append(configuration)
+        return self
+
+    def add_lifecycle_rule(self, rule):
+        """Add a lifecycle rule.
+
+        :param rule: a lifecycle rule
+        :type rule: LifecycleRule
+        :return: the bucket itself
+        :rtype: Bucket
+        """
+        return self._add_configuration(self.lifecycle_rules, rule,
+                                       LifecycleRule)
+
+    def add_intelligent_tiering(self, configuration):
+        """Add an Intelligent-Tiering configuration.
+
+        :param configuration: an Intelligent-Tiering configuration
+        :type configuration: IntelligentTieringConfiguration
+        :return: the bucket itself
+        :rtype: Bucket
+        """
+        return self._add_configuration(self.intelligent_tiering,
+                                       configuration,
+                                       IntelligentTieringConfiguration)
+
+    def add_metrics(self, configuration):
+        """Add a request metrics configuration.
+
+        :param configuration: a metrics configuration
+        :type configuration: MetricsConfiguration
+        :return: the bucket itself
+        :rtype: Bucket
+        """
+        return self._add_configuration(self.metrics, configuration,
+                                       MetricsConfiguration)
+
+    def add_inventory(self, configuration):
+        """Add an inventory configuration.
+
+        :param configuration: an inventory configuration
+        :type configuration: InventoryConfiguration
+        :return: the bucket itself
+        :rtype: Bucket
+        """
+        return self._add_configuration(self.inventories, configuration,
+                                       InventoryConfiguration)
+
     @property
     def properties(self):
-        return {'AccessControl': self.access_control.value}
+        result = {'AccessControl': self.access_control.value}
+        if self.transfer_acceleration is not None:
+            result['AccelerateConfiguration'] = {
+                'AccelerationStatus': ('Enabled'
+                                       if self.transfer_acceleration
+                                       else 'Suspended')}
+        if self.lifecycle_rules:
+            result['LifecycleConfiguration'] = {
+                'Rules': [r.properties for r in self.lifecycle_rules]}
+        if self.intelligent_tiering:
+            result['IntelligentTieringConfigurations'] = [
+                c.properties for c in self.intelligent_tiering]
+        if self.metrics:
+            result['MetricsConfigurations'] = [
+                c.properties for c in self.metrics]
+        if self.inventories:
+            result['InventoryConfigurations'] = [
+                c.properties for c in self.inventories]
+        return result
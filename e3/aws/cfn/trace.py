@@ -0,0 +1,341 @@
+from datetime import timezone
+import hashlib
+import json
+import os
+import re
+import statistics
+
+from e3.aws import client
+from e3.aws.cfn import GetAtt, Ref, Sub
+
+STACK_TYPE = 'AWS::CloudFormation::Stack'
+
+# Stack statuses starting an operation
+OPERATION_START = ('CREATE_IN_PROGRESS', 'UPDATE_IN_PROGRESS',
+                   'DELETE_IN_PROGRESS', 'IMPORT_IN_PROGRESS')
+
+# Suffixes of the stack statuses starting the cleanup or rollback phase of
+# an operation
+CLEANUP_PHASES = ('CLEANUP_IN_PROGRESS', 'ROLLBACK_IN_PROGRESS')
+
+# Statuses of successfully deployed resources
+DEPLOYED = ('CREATE_COMPLETE', 'UPDATE_COMPLETE')
+
+SUB_VARIABLE = re.compile(r'\$\{([A-Za-z0-9]+)(\.[A-Za-z0-9.]+)?\}')
+
+
+class Span(object):
+    """Time span of the deployment of a resource."""
+
+    def __init__(self, name, kind, start, end=None, status=None):
+        """Initialize a span.
+
+        :param name: logical name of the resource
+        :type name: str
+        :param kind: CloudFormation resource type
+        :type kind: str
+        :param start: start time
+        :type start: datetime
+        :param end: end time. None if the operation is not completed
+        :type end: datetime | None
+        :param status: last status of the resource
+        :type status: str | None
+        """
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.status = status
+
+    @property
+    def duration(self):
+        """Return the duration in seconds.
+
+        :rtype: float | None
+        """
+        if self.end is None:
+            return None
+        return (self.end - self.start).total_seconds()
+
+    def __str__(self):
+        return '%-40s %-40s %8s %s' % (
+            self.name, self.kind,
+            '-' if self.duration is None else '%.0fs' % self.duration,
+            self.status)
+
+
+def event_spans(events, cleanup=False):
+    """Compute the span of each resource from stack events.
+
+    The span of a resource ends at its first terminal status. Once the stack
+    enters its cleanup phase (deletion of replaced or removed resources
+    after an update) or a rollback, the resource events belong to a second
+    phase, ignored by default so that the span of a replaced resource does
+    not include its deletion.
+
+    :param events: events of a single stack operation, oldest first
+    :type events: list[dict]
+    :param cleanup: if True return the spans of the cleanup or rollback
+        phase instead of the spans of the main phase. The stack span is
+        returned in both cases.
+    :type cleanup: bool
+    :return: a dict associating logical names to spans
+    :rtype: dict
+    """
+    result = {}
+    in_cleanup = False
+    for event in events:
+        name = event['LogicalResourceId']
+        status = event['ResourceStatus']
+        is_stack = name == event['StackName'] and \
+            event['ResourceType'] == STACK_TYPE
+        if is_stack and status.endswith(CLEANUP_PHASES):
+            in_cleanup = True
+        elif not is_stack and in_cleanup != cleanup:
+            continue
+        if name not in result:
+            result[name] = Span(name, event['ResourceType'],
+                                event['Timestamp'])
+        span = result[name]
+        if not is_stack and span.end is not None:
+            # The resource is already completed in this phase
+            continue
+        span.status = status
+        if 'IN_PROGRESS' not in status:
+            span.end = event['Timestamp']
+    return result
+
+
+@client('cloudformation')
+def deployment_spans(stack_name, client, cleanup=False):
+    """Return the resource spans of the last operation on a stack.
+
+    :param stack_name: name of the stack
+    :type stack_name: str
+    :param client: a botocore client
+    :type client: botocore.client.BaseClient
+    :param cleanup: see event_spans
+    :type cleanup: bool
+    :return: see event_spans
+    :rtype: dict
+    """
+    events = []
+    paginator = client.get_paginator('describe_stack_events')
+    for page in paginator.paginate(StackName=stack_name):
+        for event in page['StackEvents']:
+            events.append(event)
+            if event['ResourceType'] == STACK_TYPE and \
+                    event['LogicalResourceId'] == stack_name and \
+                    event['ResourceStatus'] in OPERATION_START:
+                return event_spans(events[::-1], cleanup)
+    return event_spans(events[::-1], cleanup)
+
+
+def _origin(spans):
+    return min(span.start for span in spans.values())
+
+
+def _microseconds(delta):
+    return int(delta.total_seconds() * 1000000)
+
+
+def chrome_trace(spans, stack_name='stack'):
+    """Export spans in Chrome trace event format.
+
+    The result, once serialized to JSON, can be loaded in chrome://tracing
+    or Perfetto.
+
+    :param spans: spans returned by event_spans
+    :type spans: dict
+    :param stack_name: name of the stack, used as process name
+    :type stack_name: str
+    :rtype: dict
+    """
+    origin = _origin(spans)
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 1,
+               'args': {'name': stack_name}}]
+    ordered = sorted(spans.values(), key=lambda s: (s.start, s.name))
+    for tid, span in enumerate(ordered, 1):
+        end = span.end if span.end is not None else span.start
+        events.append({'name': span.name,
+                       'cat': span.kind,
+                       'ph': 'X',
+                       'pid': 1,
+                       'tid': tid,
+                       'ts': _microseconds(span.start - origin),
+                       'dur': _microseconds(end - span.start),
+                       'args': {'status': span.status}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _nanoseconds(date):
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return str(int(date.timestamp()) * 1000000000 + date.microsecond * 1000)
+
+
+def otel_spans(spans, stack_name='stack'):
+    """Export spans as OpenTelemetry spans (OTLP JSON encoding).
+
+    Resource spans are children of the stack span. Ids are derived from
+    the stack name and the operation start time so that exporting the
+    same operation twice gives the same trace.
+
+    :param spans: spans returned by event_spans
+    :type spans: dict
+    :param stack_name: name of the stack
+    :type stack_name: str
+    :return: a list of spans suitable for the spans field of an OTLP
+        ScopeSpans message
+    :rtype: list[dict]
+    """
+    origin = _origin(spans)
+    seed = '%s/%s' % (stack_name, origin.isoformat())
+    trace_id = hashlib.sha256(seed.encode('utf-8')).hexdigest()[:32]
+
+    def span_id(name):
+        return hashlib.sha256(
+            ('%s/%s' % (seed, name)).encode('utf-8')).hexdigest()[:16]
+
+    result = []
+    for span in sorted(spans.values(), key=lambda s: (s.start, s.name)):
+        end = span.end if span.end is not None else span.start
+        data = {'traceId': trace_id,
+                'spanId': span_id(span.name),
+                'name': span.name,
+                'kind': 1,
+                'startTimeUnixNano': _nanoseconds(span.start),
+                'endTimeUnixNano': _nanoseconds(end),
+                'attributes': [
+                    {'key': 'aws.cloudformation.resource_type',
+                     'value': {'stringValue': span.kind}},
+                    {'key': 'aws.cloudformation.status',
+                     'value': {'stringValue': span.status or ''}}],
+                'status': {'code': 2 if 'FAILED' in (span.status or '')
+                           else 1}}
+        if span.name != stack_name:
+            data['parentSpanId'] = span_id(stack_name)
+        result.append(data)
+    return result
+
+
+def _references(value, result):
+    if isinstance(value, dict):
+        for v in value.values():
+            _references(v, result)
+    elif isinstance(value, list):
+        for v in value:
+            _references(v, result)
+    elif isinstance(value, (Ref, GetAtt)):
+        result.add(value.name)
+    elif isinstance(value, Sub):
+        result.update(m.group(1) for m in SUB_VARIABLE.finditer(
+            value.content))
+    return result
+
+
+def dependency_graph(stack):
+    """Return the dependencies between the resources of a stack.
+
+    Dependencies come from Ref, GetAtt and Sub intrinsic functions and
+    from DependsOn.
+
+    :param stack: a stack
+    :type stack: e3.aws.cfn.Stack
+    :return: a dict associating each resource name to the set of resources
+        it depends on
+    :rtype: dict
+    """
+    resources = stack.export()['Resources']
+    result = {}
+    for name, resource in resources.items():
+        depends = _references(resource.get('Properties', {}), set())
+        depends_on = resource.get('DependsOn', [])
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        depends.update(depends_on)
+        result[name] = {d for d in depends if d in resources and d != name}
+    return result
+
+
+def critical_path(stack, spans):
+    """Compute the observed critical path of a deployment.
+
+    Starting from the resource completed last, the path goes back at each
+    step to the dependency that completed last, which is the one that
+    delayed the start of the resource.
+
+    :param stack: the deployed stack
+    :type stack: e3.aws.cfn.Stack
+    :param spans: spans returned by event_spans
+    :type spans: dict
+    :return: the spans of the critical path, in deployment order
+    :rtype: list[Span]
+    """
+    graph = dependency_graph(stack)
+    completed = {name: span for name, span in spans.items()
+                 if name in graph and span.status in DEPLOYED}
+    if not completed:
+        return []
+    current = max(completed.values(), key=lambda s: s.end)
+    result = [current]
+    while True:
+        depends = [completed[d] for d in graph[current.name]
+                   if d in completed]
+        if not depends:
+            break
+        current = max(depends, key=lambda s: s.end)
+        result.append(current)
+    return result[::-1]
+
+
+class DurationHistory(object):
+    """Local history of resource deployment durations per resource type."""
+
+    # Number of durations kept per resource type
+    MAX_SAMPLES = 100
+
+    def __init__(self, path):
+        """Initialize a history.
+
+        :param path: path to the JSON file storing the history
+        :type path: str
+        """
+        self.path = path
+        self.durations = {}
+        if os.path.isfile(path):
+            with open(path) as fd:
+                self.durations = json.load(fd)
+
+    def record(self, spans):
+        """Add the durations of created or updated resources and save.
+
+        Deletions and failed operations are not recorded.
+
+        :param spans: spans returned by event_spans
+        :type spans: dict
+        """
+        for span in spans.values():
+            if span.kind == STACK_TYPE or span.status not in DEPLOYED:
+                continue
+            samples = self.durations.setdefault(span.kind, [])
+            samples.append(span.duration)
+            del samples[:-self.MAX_SAMPLES]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump(self.durations, fd)
+        os.replace(tmp_path, self.path)
+
+    def estimate(self, kind):
+        """Return the median duration of a resource type.
+
+        :param kind: a resource type
+        :type kind: e3.aws.cfn.AWSType | str
+        :return: the duration in seconds or None if unknown
+        :rtype: float | None
+        """
+        if not isinstance(kind, str):
+            kind = kind.value
+        if not self.durations.get(kind):
+            return None
+        return statistics.median(self.durations[kind])
@@ -1,5 +1,17 @@
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import json
+import os
+import time
+
+from e3.aws.poll import Backoff
 from e3.env import Env
 
+# Errors of describe_images after which copies are considered as pending
+PENDING_ERRORS = ('InvalidAMIID.NotFound', 'RequestLimitExceeded',
+                  'Throttling')
+
 
 class AMI(object):
     """Represent an AMI."""
@@ -41,6 +53,40 @@ class AMI(object):
                                     self.data['ImageId'],
                                     self.data.get('Description', ''))
 
+    @classmethod
+    def find(cls, names, region=None, owners=None):
+        """Find the latest AMIs with given names using a single request.
+
+        :param names: AMI names. Wildcards (* and ?) are accepted.
+        :type names: list[str]
+        :param region: region in which to look for AMIs. If None the
+            default region is used
+        :type region: str | None
+        :param owners: if not None, only consider AMIs of these owners
+            (account ids, 'self' or 'amazon')
+        :type owners: list[str] | None
+        :return: a dict associating each name to the most recent AMI
+            matching it. Names without matching AMI are not in the result.
+        :rtype: dict
+        """
+        aws_env = Env().aws_env
+        if region is None:
+            region = aws_env.default_region
+        kwargs = {'Filters': [{'Name': 'name', 'Values': list(names)}]}
+        if owners is not None:
+            kwargs['Owners'] = owners
+        images = aws_env.client('ec2', region).describe_images(
+            **kwargs)['Images']
+
+        result = {}
+        for name in names:
+            matching = [ami for ami in images
+                        if fnmatch.fnmatchcase(ami['Name'], name)]
+            if matching:
+                latest = max(matching, key=lambda ami: ami['CreationDate'])
+                result[name] = AMI(latest['ImageId'], region, data=latest)
+        return result
+
     @classmethod
     def ls(cls):
         """List user AMIs."""
@@ -53,3 +99,360 @@ class AMI(object):
             for ami in region_result['Images']:
                 result.append(AMI(ami['ImageId'], r, data=ami))
         return result
+
+    def copy_to(self, regions=None, name=None, description=None,
+                encrypted=None, wait=True, timeout=3600, poll_interval=15,
+                max_poll_interval=120, max_workers=8):
+        """Copy the AMI to other regions.
+
+        Copies are started concurrently then tracked by a single poller
+        doing one describe_images request per region at each round. The
+        delay between rounds doubles, up to max_poll_interval, while no
+        copy completes.
+
+        :param regions: target regions. If None use AWSEnv regions. The
+            region of the AMI is ignored.
+        :type regions: list[str] | None
+        :param name: name of the copies. If None use the AMI name
+        :type name: str | None
+        :param description: description of the copies. If None use the
+            AMI description
+        :type description: str | None
+        :param encrypted: if True encrypt the snapshots of the copies
+        :type encrypted: bool | None
+        :param wait: if False return once copies are started
+        :type wait: bool
+        :param timeout: maximum number of seconds to wait for the copies
+        :type timeout: int
+        :param poll_interval: initial delay between two polling rounds
+        :type poll_interval: int
+        :param max_poll_interval: maximum delay between two polling rounds
+        :type max_poll_interval: int
+        :param max_workers: maximum number of concurrent requests
+        :type max_workers: int
+        :return: a dict associating each target region to its AMICopy
+        :rtype: dict
+        """
+        aws_env = Env().aws_env
+        if regions is None:
+            regions = aws_env.regions
+        kwargs = {'SourceImageId': self.id,
+                  'SourceRegion': self.region,
+                  'Name': name or self.data['Name']}
+        if description is not None or 'Description' in self.data:
+            kwargs['Description'] = description or self.data['Description']
+        if encrypted is not None:
+            kwargs['Encrypted'] = encrypted
+
+        copies = {region: AMICopy(self, region)
+                  for region in regions if region != self.region}
+
+        def start(copy):
+            copy.start = time.time()
+            try:
+                copy.ami_id = aws_env.client(
+                    'ec2', copy.region).copy_image(**kwargs)['ImageId']
+            except Exception as e:
+                copy.error = e
+
+        def poll(region, pending):
+            from botocore.exceptions import ClientError
+            try:
+                images = aws_env.client('ec2', region).describe_images(
+                    ImageIds=[copy.ami_id for copy in pending])['Images']
+            except ClientError as e:
+                # New image ids take a moment to become visible, so
+                # missing images are still pending
+                if e.response['Error']['Code'] in PENDING_ERRORS:
+                    return {}
+                return e
+            return {image['ImageId']: image for image in images}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(start, copies.values()))
+            pending = [c for c in copies.values() if c.error is None]
+            delays = Backoff(poll_interval, max_poll_interval, timeout)
+            progress = False
+            while wait and pending and delays.wait(progress):
+                regions = sorted({c.region for c in pending})
+                results = dict(zip(regions, executor.map(
+                    poll, regions,
+                    [[c for c in pending if c.region == r]
+                     for r in regions])))
+                now = time.time()
+                still_pending = []
+                for copy in pending:
+                    if isinstance(results[copy.region], Exception):
+                        copy.end = now
+                        copy.error = results[copy.region]
+                        continue
+                    image = results[copy.region].get(copy.ami_id)
+                    state = image['State'] if image else 'pending'
+                    if state == 'available':
+                        copy.end = now
+                        copy.ami = AMI(copy.ami_id, copy.region, data=image)
+                    elif state != 'pending':
+                        copy.end = now
+                        copy.error = 'copy is %s: %s' % (
+                            state, image.get('StateReason', {}).get(
+                                'Message', ''))
+                    else:
+                        still_pending.append(copy)
+                progress = len(still_pending) != len(pending)
+                pending = still_pending
+            if wait:
+                for copy in pending:
+                    copy.error = 'timeout'
+        return copies
+
+
+class AMICopy(object):
+    """Copy of an AMI to another region."""
+
+    def __init__(self, source, region):
+        """Initialize an AMI copy.
+
+        :param source: the copied AMI
+        :type source: AMI
+        :param region: the target region
+        :type region: str
+        """
+        self.source = source
+        self.region = region
+        self.ami_id = None
+        self.ami = None
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """Return the copy duration in seconds.
+
+        The precision depends on the polling interval.
+
+        :return: the duration or None if the copy is not completed
+        :rtype: float | None
+        """
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    def __str__(self):
+        if self.error is not None:
+            return '%-12s FAILED: %s' % (self.region, self.error)
+        elif self.ami is None:
+            return '%-12s %-24s: pending' % (self.region, self.ami_id)
+        return '%-12s %-24s: %ds' % (self.region, self.ami_id,
+                                     self.duration)
+
+
+class AMICatalog(object):
+    """Index of the AMIs available in several regions.
+
+    The catalog is filled with describe_images requests using server side
+    filters, one region per thread. Images are then indexed by name, to
+    answer queries on name patterns starting with a fixed prefix without
+    scanning all images, and by tag key and value. The catalog can be saved
+    to disk and reloaded, regions being refreshed only when their data is
+    too old.
+    """
+
+    VERSION = 1
+
+    def __init__(self, regions=None, owners=None, names=None, tags=None):
+        """Initialize a catalog.
+
+        :param regions: list of regions. If None use AWSEnv regions
+        :type regions: list[str] | None
+        :param owners: if not None, only consider AMIs of these owners
+        :type owners: list[str] | None
+        :param names: if not None, only consider AMIs whose name matches
+            one of these patterns
+        :type names: list[str] | None
+        :param tags: if not None, only consider AMIs having these tags. A
+            tag with a None value matches any value.
+        :type tags: dict | None
+        """
+        if regions is None:
+            regions = Env().aws_env.regions
+        self.regions = regions
+        self.owners = owners
+        self.names = names
+        self.tags = tags
+        # Per region images and time of the last refresh
+        self.images = {region: {} for region in regions}
+        self.timestamps = {}
+        self.name_index = []
+        self.tag_index = {}
+
+    @property
+    def filters(self):
+        """Return the describe_images server side filters.
+
+        :rtype: list[dict]
+        """
+        result = []
+        if self.names is not None:
+            result.append({'Name': 'name', 'Values': list(self.names)})
+        for key, value in sorted((self.tags or {}).items()):
+            if value is None:
+                result.append({'Name': 'tag-key', 'Values': [key]})
+            else:
+                result.append({'Name': 'tag:%s' % key, 'Values': [value]})
+        return result
+
+    def _fetch(self, region):
+        kwargs = {}
+        if self.owners is not None:
+            kwargs['Owners'] = self.owners
+        if self.filters:
+            kwargs['Filters'] = self.filters
+        client = Env().aws_env.client('ec2', region)
+        return client.describe_images(**kwargs)['Images']
+
+    def refresh(self, max_age=None, max_workers=8):
+        """Update the catalog.
+
+        :param max_age: if not None, only refresh the regions whose data
+            is older than max_age seconds
+        :type max_age: int | None
+        :param max_workers: maximum number of regions fetched concurrently
+        :type max_workers: int
+        :return: the list of refreshed regions
+        :rtype: list[str]
+        """
+        now = time.time()
+        if max_age is None:
+            regions = list(self.regions)
+        else:
+            regions = [r for r in self.regions
+                       if now - self.timestamps.get(r, 0) > max_age]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self._fetch, regions))
+        for region, images in zip(regions, results):
+            self.images[region] = {image['ImageId']: image
+                                   for image in images}
+            self.timestamps[region] = now
+        self._index()
+        return regions
+
+    def _index(self):
+        self.name_index = []
+        self.tag_index = {}
+        for region, images in self.images.items():
+            for ami_id, image in images.items():
+                self.name_index.append((image.get('Name', ''), region,
+                                        ami_id))
+                # Images are also indexed under (key, None) so that
+                # queries on any value of a tag are a single lookup
+                for tag in image.get('Tags', []):
+                    for index_key in ((tag['Key'], tag['Value']),
+                                      (tag['Key'], None)):
+                        self.tag_index.setdefault(index_key, []).append(
+                            (region, ami_id))
+        self.name_index.sort()
+
+    def _ami(self, region, ami_id):
+        return AMI(ami_id, region, data=self.images[region][ami_id])
+
+    def _newest_first(self, keys):
+        return [self._ami(region, ami_id) for region, ami_id in sorted(
+            keys,
+            key=lambda k: self.images[k[0]][k[1]]['CreationDate'],
+            reverse=True)]
+
+    def match(self, pattern, region=None):
+        """Return the AMIs whose name matches a pattern.
+
+        :param pattern: a name pattern (wildcards * and ? are accepted)
+        :type pattern: str
+        :param region: if not None, only consider AMIs of that region
+        :type region: str | None
+        :return: the matching AMIs, newest first
+        :rtype: list[AMI]
+        """
+        prefix = pattern
+        for index, char in enumerate(pattern):
+            if char in '*?[':
+                prefix = pattern[:index]
+                break
+        keys = []
+        start = bisect_left(self.name_index, (prefix, ))
+        for name, ami_region, ami_id in self.name_index[start:]:
+            if not name.startswith(prefix):
+                break
+            if (region is None or region == ami_region) and \
+                    fnmatch.fnmatchcase(name, pattern):
+                keys.append((ami_region, ami_id))
+        return self._newest_first(keys)
+
+    def latest(self, pattern, region=None):
+        """Return the most recent AMI whose name matches a pattern.
+
+        :param pattern: a name pattern (see match)
+        :type pattern: str
+        :param region: if not None, only consider AMIs of that region
+        :type region: str | None
+        :return: the AMI or None if no AMI match
+        :rtype: AMI | None
+        """
+        result = self.match(pattern, region=region)
+        return result[0] if result else None
+
+    def by_tag(self, key, value=None, region=None):
+        """Return the AMIs having a given tag.
+
+        :param key: tag key
+        :type key: str
+        :param value: if not None, the tag value
+        :type value: str | None
+        :param region: if not None, only consider AMIs of that region
+        :type region: str | None
+        :return: the AMIs, newest first
+        :rtype: list[AMI]
+        """
+        keys = [k for k in self.tag_index.get((key, value), [])
+                if region is None or k[0] == region]
+        return self._newest_first(keys)
+
+    def save(self, path):
+        """Save the catalog.
+
+        :param path: path to the catalog file
+        :type path: str
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump({'version': self.VERSION,
+                       'filters': self.filters,
+                       'owners': self.owners,
+                       'timestamps': self.timestamps,
+                       'images': self.images}, fd)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Load a catalog saved by save.
+
+        Data saved with different filters, or for regions not handled by
+        the catalog, is ignored.
+
+        :param path: path to the catalog file
+        :type path: str
+        :return: True if the file was loaded
+        :rtype: bool
+        """
+        if not os.path.isfile(path):
+            return False
+        with open(path) as fd:
+            data = json.load(fd)
+        if data.get('version') != self.VERSION or \
+                data['filters'] != self.filters or \
+                data['owners'] != self.owners:
+            return False
+        for region in self.regions:
+            if region in data['timestamps']:
+                self.images[region] = data['images'][region]
+                self.timestamps[region] = data['timestamps'][region]
+        self._index()
+        return True
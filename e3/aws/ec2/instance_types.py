@@ -0,0 +1,111 @@
+import functools
+import os
+
+import yaml
+
+INSTANCE_TYPES_TABLE = os.path.join(os.path.dirname(__file__),
+                                    'instance_types.yaml')
+
+
+@functools.lru_cache(maxsize=None)
+def instance_types():
+    """Return the packaged instance type capability table.
+
+    The table is loaded only once.
+
+    :return: a dict associating an instance type name (e.g. m5.large) to
+        a dict of capabilities (see instance_types.yaml)
+    :rtype: dict
+    """
+    with open(INSTANCE_TYPES_TABLE) as fd:
+        families = yaml.safe_load(fd)
+    result = {}
+    for family, info in families.items():
+        for size, size_info in info['sizes'].items():
+            capabilities = {'instance_store': None,
+                            'instance_store_nvme': False}
+            capabilities.update((k, v) for k, v in info.items()
+                                if k != 'sizes')
+            capabilities.update(size_info)
+            capabilities['nitro_enclave'] = \
+                capabilities['nitro_enclave'] and capabilities['vcpus'] >= 4
+            result['%s.%s' % (family, size)] = capabilities
+    return result
+
+
+def instance_type_info(instance_type):
+    """Return the capabilities of an instance type.
+
+    :param instance_type: an instance type name (e.g. m5.large)
+    :type instance_type: str
+    :return: a dict of capabilities or None if the type is unknown
+    :rtype: dict | None
+    """
+    return instance_types().get(instance_type)
+
+
+def check_instance_type(instance_type,
+                        image=None,
+                        ebs_optimized=None,
+                        placement_strategy=None,
+                        core_count=None,
+                        threads_per_core=None,
+                        nitro_enclave=None):
+    """Check that an instance type supports a set of features.
+
+    Checks are done offline using the packaged capability table. Unknown
+    instance types are not checked. An AssertionError is raised on the
+    first incompatibility found.
+
+    :param instance_type: an instance type name (e.g. m5.large)
+    :type instance_type: str
+    :param image: the AMI used by the instance
+    :type image: e3.aws.ec2.ami.AMI | None
+    :param ebs_optimized: whether EBS optimization is requested
+    :type ebs_optimized: bool | None
+    :param placement_strategy: strategy of the placement group
+    :type placement_strategy: str | None
+    :param core_count: requested number of CPU cores
+    :type core_count: int | None
+    :param threads_per_core: requested number of threads per core
+    :type threads_per_core: int | None
+    :param nitro_enclave: whether Nitro Enclaves are requested
+    :type nitro_enclave: bool | None
+    """
+    info = instance_type_info(instance_type)
+    if info is None:
+        return
+
+    if image is not None:
+        architecture = image.data.get('Architecture')
+        assert architecture is None or \
+            architecture == info['architecture'], \
+            '%s is a %s image, %s requires %s' % (
+                image.id, architecture, instance_type, info['architecture'])
+        assert info['enhanced_networking'] != 'ena' or \
+            image.data.get('EnaSupport', True), \
+            '%s requires an image with ENA support' % instance_type
+
+    if ebs_optimized:
+        assert info['ebs_optimized'] != 'unsupported', \
+            '%s cannot be EBS optimized' % instance_type
+
+    if placement_strategy == 'cluster':
+        assert info['cluster_placement'], \
+            '%s cannot be launched in a cluster placement group' % \
+            instance_type
+
+    if core_count is not None or threads_per_core is not None:
+        assert info['cpu_options'], \
+            'CPU options cannot be set for %s' % instance_type
+    if core_count is not None:
+        assert 1 <= core_count <= info['cores'], \
+            '%s has at most %s cores' % (instance_type, info['cores'])
+    if threads_per_core is not None:
+        assert threads_per_core in (1, info['threads_per_core']), \
+            'invalid threads per core for %s: %s' % (
+                instance_type, threads_per_core)
+
+    if nitro_enclave:
+        assert info['nitro_enclave'], \
+            '%s does not support Nitro Enclaves' % instance_type
@@ -0,0 +1,92 @@
+"""e3-aws command line interface.
+
+Render, estimate the cost of or deploy a stack defined in a Python module.
+The module should define a Stack, or a function returning a Stack, named
+stack (another name can be selected with MODULE:NAME). MODULE can be a
+module name or a path to a Python file.
+
+The render and cost commands work offline and do not import botocore.
+"""
+import argparse
+import sys
+
+from e3.aws.cfn.render import load_stack
+
+
+def render(args, stack):
+    if args.output is None:
+        sys.stdout.write(stack.body)
+    else:
+        with open(args.output, 'w') as fd:
+            fd.write(stack.body)
+    return 0
+
+
+def cost(args, stack):
+    from e3.aws.cfn.cost import estimate_cost
+    print(estimate_cost(stack, args.region, cache_dir=args.cache_dir))
+    return 0
+
+
+def deploy(args, stack):
+    from e3.aws import AWSEnv
+    from e3.aws.cfn.changeset import process_change_sets
+
+    def show_event(stack_name, event):
+        print('%s %-40s %-40s %s' % (event['Timestamp'].strftime('%H:%M:%S'),
+                                     event['LogicalResourceId'],
+                                     event['ResourceType'],
+                                     event['ResourceStatus']))
+
+    AWSEnv(regions=[args.region])
+    result = process_change_sets(
+        [stack], region=args.region, name=args.change_set,
+        execute=not args.no_execute, callback=show_event,
+        change_set_type='CREATE' if args.create else None)[stack.name]
+    print(result)
+    return 0 if result.success else 1
+
+
+def main(argv=None):
+    """Run the e3-aws command.
+
+    :param argv: command line arguments. If None use sys.argv
+    :type argv: list[str] | None
+    :return: the exit status
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(prog='e3-aws', description=__doc__)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('render', help='print the template')
+    command.add_argument('--output', help='write the template to a file')
+    command.set_defaults(func=render)
+
+    command = commands.add_parser('cost',
+                                  help='estimate the monthly cost offline')
+    command.add_argument('--region', required=True)
+    command.add_argument('--cache-dir', help='directory caching estimates')
+    command.set_defaults(func=cost)
+
+    command = commands.add_parser('deploy',
+                                  help='deploy using a change set')
+    command.add_argument('--region', required=True)
+    command.add_argument('--change-set', default='e3-aws',
+                         help='name of the change set')
+    command.add_argument('--create', action='store_true',
+                         help='the stack does not exist yet')
+    command.add_argument('--no-execute', action='store_true',
+                         help='only create the change set')
+    command.set_defaults(func=deploy)
+
+    for command in commands.choices.values():
+        command.add_argument('stack', metavar='MODULE[:NAME]',
+                             help='module defining the stack')
+
+    args = parser.parse_args(argv)
+    return args.func(args, load_stack(args.stack))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import time
+
+
+class Backoff(object):
+    """Delays between the rounds of a polling loop.
+
+    The delay doubles at each round, up to max_poll_interval, and is reset
+    to poll_interval after a round in which some progress was made::
+
+        delays = Backoff(poll_interval, max_poll_interval, timeout)
+        progress = False
+        while pending and delays.wait(progress):
+            ...
+    """
+
+    def __init__(self, poll_interval, max_poll_interval, timeout):
+        """Initialize a backoff.
+
+        :param poll_interval: initial delay in seconds
+        :type poll_interval: float
+        :param max_poll_interval: maximum delay in seconds
+        :type max_poll_interval: float
+        :param timeout: maximum total duration in seconds
+        :type timeout: float
+        """
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.deadline = time.time() + timeout
+        self.interval = None
+
+    @property
+    def expired(self):
+        return time.time() >= self.deadline
+
+    def wait(self, progress=False):
+        """Wait before the next polling round.
+
+        :param progress: True if the previous round made some progress
+        :type progress: bool
+        :return: False, without waiting, if the timeout is exceeded
+        :rtype: bool
+        """
+        if self.expired:
+            return False
+        if self.interval is None or progress:
+            self.interval = self.poll_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_poll_interval)
+        time.sleep(self.interval)
+        return True
@@ -0,0 +1,241 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from e3.aws import client
+
+# Limits of a single change_resource_record_sets request. Note that UPSERT
+# actions count twice.
+MAX_CHANGE_RECORDS = 1000
+MAX_CHANGE_CHARACTERS = 32000
+
+
+def normalize_dns_name(name):
+    """Return a DNS name as returned by Route53 API.
+
+    :param name: a domain name
+    :type name: str
+    :return: the lowercase fully qualified name ending with a dot
+    :rtype: str
+    """
+    return name.replace('\\052', '*').lower().rstrip('.') + '.'
+
+
+def api_record_set(record_set):
+    """Convert a RecordSet resource into a Route53 API ResourceRecordSet.
+
+    :param record_set: a RecordSet resource
+    :type record_set: e3.aws.cfn.route53.RecordSet
+    :return: a dict suitable for change_resource_record_sets
+    :rtype: dict
+    """
+    result = {}
+    for key, value in record_set.properties.items():
+        if key == 'HostedZoneName':
+            continue
+        elif key == 'Name':
+            value = normalize_dns_name(value)
+        elif key in ('TTL', 'Weight'):
+            value = int(value)
+        elif key == 'ResourceRecords':
+            value = [{'Value': str(v)} for v in value]
+        elif key == 'HealthCheckId':
+            assert isinstance(value, str), \
+                'health check of %s should be an id' % record_set.name
+        result[key] = value
+    return result
+
+
+def record_set_key(record_set):
+    """Return the key identifying a Route53 API ResourceRecordSet.
+
+    :param record_set: a Route53 API ResourceRecordSet
+    :type record_set: dict
+    :rtype: (str, str, str | None)
+    """
+    return (normalize_dns_name(record_set['Name']),
+            record_set['Type'],
+            record_set.get('SetIdentifier'))
+
+
+def _canonical(record_set):
+    result = dict(record_set)
+    result['Name'] = normalize_dns_name(result['Name'])
+    if 'ResourceRecords' in result:
+        result['ResourceRecords'] = sorted(
+            r['Value'] for r in result['ResourceRecords'])
+    if 'AliasTarget' in result:
+        alias = dict(result['AliasTarget'])
+        alias['DNSName'] = normalize_dns_name(alias['DNSName'])
+        result['AliasTarget'] = alias
+    return result
+
+
+def diff_record_sets(desired, current, zone_name, delete=False):
+    """Compute the changes needed to go from current to desired records.
+
+    :param desired: list of Route53 API ResourceRecordSet
+    :type desired: list[dict]
+    :param current: list of Route53 API ResourceRecordSet
+    :type current: list[dict]
+    :param zone_name: name of the hosted zone
+    :type zone_name: str
+    :param delete: if True current records that are not desired are deleted.
+        SOA and NS records of the zone apex are never deleted.
+    :type delete: bool
+    :return: list of changes
+    :rtype: list[dict]
+    """
+    current = {record_set_key(r): r for r in current}
+    result = []
+    desired_keys = set()
+    for record_set in desired:
+        key = record_set_key(record_set)
+        desired_keys.add(key)
+        if key in current and \
+                _canonical(current[key]) == _canonical(record_set):
+            continue
+        result.append({'Action': 'UPSERT',
+                       'ResourceRecordSet': record_set})
+    if delete:
+        apex = normalize_dns_name(zone_name)
+        for key, record_set in current.items():
+            if key in desired_keys or \
+                    (key[0] == apex and key[1] in ('SOA', 'NS')):
+                continue
+            result.append({'Action': 'DELETE',
+                           'ResourceRecordSet': record_set})
+    return result
+
+
+def batch_changes(changes):
+    """Split changes into maximal change_resource_record_sets batches.
+
+    :param changes: list of changes
+    :type changes: list[dict]
+    :return: list of batches, each of them being a list of changes
+    :rtype: list[list[dict]]
+    """
+    result = []
+    batch = []
+    records = 0
+    characters = 0
+    for change in changes:
+        values = [r['Value'] for r in
+                  change['ResourceRecordSet'].get('ResourceRecords', [])]
+        factor = 2 if change['Action'] == 'UPSERT' else 1
+        change_records = factor * max(len(values), 1)
+        change_characters = factor * sum(len(v) for v in values)
+        full = any((len(batch) == MAX_CHANGE_RECORDS,
+                    records + change_records > MAX_CHANGE_RECORDS,
+                    characters + change_characters > MAX_CHANGE_CHARACTERS))
+        if batch and full:
+            result.append(batch)
+            batch = []
+            records = 0
+            characters = 0
+        batch.append(change)
+        records += change_records
+        characters += change_characters
+    if batch:
+        result.append(batch)
+    return result
+
+
+def hosted_zone_id(client, zone_name):
+    """Return the id of a hosted zone.
+
+    :param client: a route53 client
+    :type client: botocore.client.BaseClient
+    :param zone_name: name of the hosted zone
+    :type zone_name: str
+    :rtype: str
+    """
+    zone_name = normalize_dns_name(zone_name)
+    zones = client.list_hosted_zones_by_name(DNSName=zone_name,
+                                             MaxItems='1')['HostedZones']
+    assert zones and normalize_dns_name(zones[0]['Name']) == zone_name, \
+        'cannot find hosted zone %s' % zone_name
+    return zones[0]['Id']
+
+
+def sync_zone(client, zone_name, record_sets, delete=False, wait=False):
+    """Apply the changes needed to get the given records in a hosted zone.
+
+    :param client: a route53 client
+    :type client: botocore.client.BaseClient
+    :param zone_name: name of the hosted zone
+    :type zone_name: str
+    :param record_sets: list of Route53 API ResourceRecordSet
+    :type record_sets: list[dict]
+    :param delete: if True delete records not in record_sets
+    :type delete: bool
+    :param wait: if True wait for the changes to be propagated
+    :type wait: bool
+    :return: the ChangeInfo of each change_resource_record_sets request
+    :rtype: list[dict]
+    """
+    zone_id = hosted_zone_id(client, zone_name)
+    current = []
+    paginator = client.get_paginator('list_resource_record_sets')
+    for page in paginator.paginate(HostedZoneId=zone_id):
+        current.extend(page['ResourceRecordSets'])
+
+    result = []
+    for batch in batch_changes(diff_record_sets(record_sets, current,
+                                                zone_name, delete=delete)):
+        result.append(client.change_resource_record_sets(
+            HostedZoneId=zone_id,
+            ChangeBatch={'Changes': batch})['ChangeInfo'])
+    if wait:
+        waiter = client.get_waiter('resource_record_sets_changed')
+        for change_info in result:
+            waiter.wait(Id=change_info['Id'])
+    return result
+
+
+@client('route53')
+def sync_record_sets(record_sets, client, delete=False, wait=False,
+                     max_workers=8):
+    """Apply RecordSet resources directly through Route53 API.
+
+    This is an alternative to the deployment of RecordSet resources through
+    CloudFormation when handling a large number of records. For each hosted
+    zone the current records are listed and only the differences are
+    applied, using as few requests as possible. Hosted zones are handled
+    concurrently.
+
+    :param record_sets: list of records
+    :type record_sets: list[e3.aws.cfn.route53.RecordSet]
+    :param client: a botocore client
+    :type client: botocore.client.BaseClient
+    :param delete: if True records present in the hosted zones but not in
+        record_sets are deleted
+    :type delete: bool
+    :param wait: if True wait for the changes to be propagated
+    :type wait: bool
+    :param max_workers: maximum number of zones handled concurrently
+    :type max_workers: int
+    :return: a dict associating each hosted zone name to the list of
+        ChangeInfo of the change requests
+    :rtype: dict
+    """
+    zones = {}
+    keys = set()
+    for record_set in record_sets:
+        api_record = api_record_set(record_set)
+        # Route53 rejects a change batch with two changes of one record
+        key = (record_set.hosted_zone_name, record_set_key(api_record))
+        assert key not in keys, \
+            'duplicate record %s %s in %s' % (key[1][0], key[1][1], key[0])
+        keys.add(key)
+        zones.setdefault(record_set.hosted_zone_name, []).append(api_record)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {zone_name: executor.submit(sync_zone,
+                                              client,
+                                              zone_name,
+                                              zone_record_sets,
+                                              delete=delete,
+                                              wait=wait)
+                   for zone_name, zone_record_sets in zones.items()}
+    return {zone_name: future.result()
+            for zone_name, future in futures.items()}
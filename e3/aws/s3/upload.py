@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mmap
+import os
+import threading
+
+from botocore.exceptions import ClientError
+from e3.env import Env
+
+# S3 multipart upload limits
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Objects larger than that are uploaded using multipart uploads
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+
+# Metadata holding the SHA-256 of the object content
+HASH_METADATA = 'sha256'
+
+
+class MappedFile(object):
+    """Read-only memory mapping of a file."""
+
+    def __init__(self, path):
+        """Map a file.
+
+        :param path: path to the file
+        :type path: str
+        """
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.fd = None
+        self.data = b''
+
+    def __enter__(self):
+        if self.size > 0:
+            self.fd = open(self.path, 'rb')
+            self.data = mmap.mmap(self.fd.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, _type, _value, _tb):
+        del _type, _value, _tb
+        if self.fd is not None:
+            self.data.close()
+            self.fd.close()
+            self.data = b''
+            self.fd = None
+
+    def sha256(self):
+        """Return the hexadecimal SHA-256 of the file content.
+
+        :rtype: str
+        """
+        return hashlib.sha256(self.data).hexdigest()
+
+    def read(self, start, end):
+        """Return a part of the file content.
+
+        :param start: offset of the first byte
+        :type start: int
+        :param end: offset after the last byte
+        :type end: int
+        :rtype: bytes
+        """
+        return self.data[start:end]
+
+
+class Uploader(object):
+    """Upload files to a S3 bucket.
+
+    Files are memory mapped and their SHA-256 is stored as object metadata,
+    so that objects whose content is already up-to-date are not uploaded
+    again. Large files are sent using multipart uploads whose parts, as well
+    as the objects, are transferred concurrently through a single client
+    (botocore clients are thread safe). AWSEnv should be created with a
+    max_pool_connections at least equal to max_workers.
+    """
+
+    def __init__(self, bucket, region=None, max_workers=8,
+                 part_size=MIN_PART_SIZE * 2,
+                 multipart_threshold=MULTIPART_THRESHOLD,
+                 progress=None):
+        """Initialize an uploader.
+
+        :param bucket: bucket name
+        :type bucket: str
+        :param region: region of the bucket. If None the default region is
+            used
+        :type region: str | None
+        :param max_workers: maximum number of concurrent requests
+        :type max_workers: int
+        :param part_size: size of multipart upload parts. It is increased
+            when needed to stay below the maximum number of parts.
+        :type part_size: int
+        :param multipart_threshold: files larger than that are uploaded
+            with multipart uploads
+        :type multipart_threshold: int
+        :param progress: if not None, function called with the object key,
+            the number of bytes transferred so far for that object and its
+            size each time a request completes
+        :type progress: (str, int, int) -> None | None
+        """
+        assert part_size >= MIN_PART_SIZE, \
+            'part size should be at least %s' % MIN_PART_SIZE
+        self.bucket = bucket
+        self.client = Env().aws_env.client('s3', region=region)
+        self.max_workers = max_workers
+        self.part_size = part_size
+        self.multipart_threshold = max(multipart_threshold, part_size)
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.transferred = {}
+
+    @classmethod
+    def from_stack(cls, stack_name, bucket, region=None, **kwargs):
+        """Create an uploader for a Bucket resource of a deployed stack.
+
+        :param stack_name: name of the stack
+        :type stack_name: str
+        :param bucket: the Bucket resource or its logical name
+        :type bucket: e3.aws.cfn.s3.Bucket | str
+        :param region: region of the stack
+        :type region: str | None
+        :param kwargs: additional parameters passed to Uploader
+        :rtype: Uploader
+        """
+        if not isinstance(bucket, str):
+            bucket = bucket.name
+        cfn = Env().aws_env.client('cloudformation', region=region)
+        result = cfn.describe_stack_resource(StackName=stack_name,
+                                             LogicalResourceId=bucket)
+        return cls(result['StackResourceDetail']['PhysicalResourceId'],
+                   region=region, **kwargs)
+
+    def _report(self, key, size, total):
+        with self.lock:
+            self.transferred[key] = self.transferred.get(key, 0) + size
+            transferred = self.transferred[key]
+        if self.progress is not None:
+            self.progress(key, transferred, total)
+
+    def is_uptodate(self, key, digest):
+        """Check whether an object exists with the given content hash.
+
+        :param key: object key
+        :type key: str
+        :param digest: hexadecimal SHA-256 of the expected content
+        :type digest: str
+        :rtype: bool
+        """
+        try:
+            result = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return result.get('Metadata', {}).get(HASH_METADATA) == digest
+
+    def _put(self, key, mapped, metadata):
+        self.client.put_object(Bucket=self.bucket,
+                               Key=key,
+                               Body=mapped.read(0, mapped.size),
+                               Metadata=metadata)
+        self._report(key, mapped.size, mapped.size)
+
+    def _upload_part(self, key, upload_id, number, mapped, start, end):
+        result = self.client.upload_part(Bucket=self.bucket,
+                                         Key=key,
+                                         UploadId=upload_id,
+                                         PartNumber=number,
+                                         Body=mapped.read(start, end))
+        self._report(key, end - start, mapped.size)
+        return {'ETag': result['ETag'], 'PartNumber': number}
+
+    def _multipart(self, executor, key, mapped, metadata):
+        part_size = max(self.part_size, -(-mapped.size // MAX_PARTS))
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, Metadata=metadata)['UploadId']
+        try:
+            futures = [executor.submit(self._upload_part, key, upload_id,
+                                       number, mapped, start,
+                                       min(start + part_size, mapped.size))
+                       for number, start in enumerate(
+                           range(0, mapped.size, part_size), 1)]
+            parts = [f.result() for f in futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts})
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket,
+                                               Key=key,
+                                               UploadId=upload_id)
+            raise
+
+    def _upload_small(self, key, path):
+        with MappedFile(path) as mapped:
+            digest = mapped.sha256()
+            if self.is_uptodate(key, digest):
+                self._report(key, mapped.size, mapped.size)
+                return False
+            self._put(key, mapped, {HASH_METADATA: digest})
+        return True
+
+    def _upload_large(self, executor, key, path):
+        with MappedFile(path) as mapped:
+            digest = mapped.sha256()
+            if self.is_uptodate(key, digest):
+                self._report(key, mapped.size, mapped.size)
+                return False
+            self._multipart(executor, key, mapped, {HASH_METADATA: digest})
+        return True
+
+    def upload(self, files):
+        """Upload files.
+
+        Each file is opened and mapped only while it is being processed,
+        so large batches of files do not exhaust file descriptors.
+
+        :param files: dict associating object keys to file paths
+        :type files: dict
+        :return: a dict associating each key to True if it was uploaded or
+            False if the object was already up-to-date
+        :rtype: dict
+        """
+        with self.lock:
+            self.transferred = {}
+        small = {}
+        large = {}
+        for key, path in files.items():
+            if os.path.getsize(path) <= self.multipart_threshold:
+                small[key] = path
+            else:
+                large[key] = path
+
+        result = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            futures = {key: ex.submit(self._upload_small, key, path)
+                       for key, path in small.items()}
+            # Parts are queued in the same pool after the small objects,
+            # large objects being handled one after the other.
+            for key, path in large.items():
+                result[key] = self._upload_large(ex, key, path)
+            for key, future in futures.items():
+                result[key] = future.result()
+        return result
@@ -9,5 +9,8 @@ setup(
     description="E3 Cloud Formation Extension",
     author="AdaCore's Production Team",
     packages=find_packages(),
+    package_data={'e3.aws.cfn': ['*.yaml'],
+                  'e3.aws.ec2': ['*.yaml']},
     install_requires=('botocore', 'pyyaml', 'e3-core'),
+    entry_points={'console_scripts': ['e3-aws = e3.aws.main:main']},
     namespace_packages=['e3'])
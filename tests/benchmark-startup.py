@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# measure the time needed to import the template modules, which is the
+# cold start cost of e3-aws render, and check it against a budget
+# usage: benchmark-startup.py [runs]
+
+from __future__ import absolute_import, division, print_function
+
+import subprocess
+import sys
+import time
+
+# Maximum import time, in seconds, of the template modules
+STARTUP_BUDGET = 0.5
+
+
+def run_time(code, runs):
+    """Return the best wall clock time of running Python code."""
+    result = None
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        duration = time.time() - start
+        if result is None or duration < result:
+            result = duration
+    return result
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    import_time = run_time('import e3.aws.cfn.ec2', runs) - \
+        run_time('pass', runs)
+    print('e3.aws.cfn.ec2 import time: %.3fs (budget %.3fs)'
+          % (import_time, STARTUP_BUDGET))
+    sys.exit(0 if import_time < STARTUP_BUDGET else 1)
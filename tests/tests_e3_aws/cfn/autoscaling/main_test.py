@@ -0,0 +1,94 @@
+import pytest
+from e3.aws.cfn import Stack
+from e3.aws.cfn.autoscaling import (AutoScalingGroup, InstancesDistribution,
+                                    TargetTrackingPolicy,
+                                    queue_backlog_policy)
+from e3.aws.cfn.ec2 import (VPC, Instance, LaunchTemplate, NetworkInterface,
+                            PlacementGroup)
+from e3.aws.cfn.ec2.security import SecurityGroup
+from e3.aws.ec2.ami import AMI
+
+
+def test_autoscaling_group():
+    image = AMI('ami-1234', region='us-east-1',
+                data={'ImageId': 'ami-1234', 'RootDeviceName': '/dev/sda1'})
+    vpc = VPC('VPC', '10.10.0.0/16')
+    subnets = vpc.subnets(['Subnet1', 'Subnet2'], 24)
+    group = SecurityGroup('Builders', vpc)
+    placement = PlacementGroup('FarmPlacement')
+
+    instance = Instance('Builder', image, instance_type='c5.2xlarge',
+                        disk_size=100, disk_type='gp3')
+    instance.add(NetworkInterface(subnets[0], groups=[group]))
+    instance.configure(placement_group=placement, tenancy='default')
+    instance.user_data = '#!/bin/sh\necho build\n'
+
+    template = LaunchTemplate('BuilderTemplate', instance)
+    data = template.properties['LaunchTemplateData']
+    assert data['ImageId'] == 'ami-1234'
+    assert data['InstanceType'] == 'c5.2xlarge'
+    assert data['BlockDeviceMappings'][0]['Ebs']['VolumeType'] == 'gp3'
+    assert data['Placement']['Tenancy'] == 'default'
+    assert data['Placement']['GroupName'].name == 'FarmPlacement'
+    assert 'SubnetId' not in data['NetworkInterfaces'][0]
+    assert [g.name for g in data['NetworkInterfaces'][0]['Groups']] == \
+        ['Builders']
+    assert data['UserData'].content == '#!/bin/sh\necho build\n'
+
+    asg = AutoScalingGroup(
+        'Farm', template, subnets, min_size=1, max_size=20,
+        instance_types=['c5.2xlarge', 'c5d.2xlarge', 'm5.2xlarge'],
+        distribution=InstancesDistribution(on_demand_base_capacity=1,
+                                           on_demand_percentage=0),
+        capacity_rebalance=True)
+    policy = queue_backlog_policy('FarmScaling', asg, 'build-queue', 10)
+    props = asg.properties
+    assert props['MinSize'] == '1'
+    assert [s.name for s in props['VPCZoneIdentifier']] == \
+        ['Subnet1', 'Subnet2']
+    mixed = props['MixedInstancesPolicy']
+    assert mixed['InstancesDistribution'] == {
+        'OnDemandBaseCapacity': 1,
+        'OnDemandPercentageAboveBaseCapacity': 0,
+        'SpotAllocationStrategy': 'price-capacity-optimized'}
+    assert len(mixed['LaunchTemplate']['Overrides']) == 3
+    assert props['MetricsCollection'][0]['Metrics'] == \
+        ['GroupInServiceInstances']
+    assert policy.properties['TargetTrackingConfiguration'][
+        'TargetValue'] == 10
+
+    cpu = TargetTrackingPolicy('CPU', asg, 60.0,
+                               predefined_metric='ASGAverageCPUUtilization')
+    assert 'PredefinedMetricSpecification' in \
+        cpu.properties['TargetTrackingConfiguration']
+    label = 'app/web/50dc6c495c0c9188/targetgroup/web/943f017f100becff'
+    requests = TargetTrackingPolicy(
+        'Requests', asg, 1000.0,
+        predefined_metric='ALBRequestCountPerTarget', resource_label=label)
+    assert requests.properties['TargetTrackingConfiguration'][
+        'PredefinedMetricSpecification'] == {
+            'PredefinedMetricType': 'ALBRequestCountPerTarget',
+            'ResourceLabel': label}
+    with pytest.raises(AssertionError):
+        TargetTrackingPolicy('Requests', asg, 1000.0,
+                             predefined_metric='ALBRequestCountPerTarget')
+    with pytest.raises(AssertionError):
+        TargetTrackingPolicy('CPU', asg, 60.0,
+                             predefined_metric='ASGAverageCPUUtilization',
+                             resource_label=label)
+
+    s = Stack('Farm')
+    s += vpc
+    for resource in subnets + [group, placement, template, asg, policy]:
+        s += resource
+    assert s.body
+
+    simple = AutoScalingGroup('Simple', template, subnets, max_size=2)
+    assert 'LaunchTemplate' in simple.properties
+    for kwargs in ({'min_size': 3, 'max_size': 2},
+                   {'desired_capacity': 5},
+                   {'instance_types': []}):
+        with pytest.raises(AssertionError):
+            AutoScalingGroup('Bad', template, subnets, **kwargs)
+    with pytest.raises(AssertionError):
+        InstancesDistribution(spot_allocation_strategy='cheapest')
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+from botocore.stub import ANY
+from e3.aws import AWSEnv, default_region
+from e3.aws.cfn import Stack
+from e3.aws.cfn.changeset import (ChangeSetTimeout, process_change_sets,
+                                  stream_stack_events, wait_change_set)
+from e3.aws.cfn.s3 import Bucket
+
+
+def change(name):
+    return {'Type': 'Resource',
+            'ResourceChange': {'Action': 'Add',
+                               'LogicalResourceId': name,
+                               'ResourceType': 'AWS::S3::Bucket'}}
+
+
+def event(event_id, name, status, stack_name='farm'):
+    return {'StackId': 'stack-' + stack_name,
+            'EventId': event_id,
+            'StackName': stack_name,
+            'LogicalResourceId': name,
+            'ResourceType': ('AWS::CloudFormation::Stack'
+                             if name == stack_name else 'AWS::S3::Bucket'),
+            'ResourceStatus': status,
+            'Timestamp': datetime(2020, 1, 1)}
+
+
+def change_set(status, changes=None, reason=None, next_token=None):
+    result = {'ChangeSetName': 'cs', 'StackName': 'farm', 'Status': status,
+              'ExecutionStatus': 'AVAILABLE',
+              'Changes': changes or []}
+    if reason is not None:
+        result['StatusReason'] = reason
+    if next_token is not None:
+        result['NextToken'] = next_token
+    return result
+
+
+def test_process_change_sets():
+    farm = Stack('farm')
+    farm += Bucket('Logs')
+    farm += Bucket('Data')
+    web = Stack('web')
+
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('cloudformation')
+        farm_cs = {'ChangeSetName': 'cs', 'StackName': 'farm'}
+        web_cs = {'ChangeSetName': 'cs', 'StackName': 'web'}
+
+        # farm stack: two pages of changes then execution
+        stub.add_response('create_change_set', {'Id': 'cs-1'},
+                          dict(farm_cs, TemplateBody=ANY,
+                               Capabilities=['CAPABILITY_IAM']))
+        stub.add_response('describe_change_set',
+                          change_set('CREATE_IN_PROGRESS'), farm_cs)
+        stub.add_response('describe_change_set',
+                          change_set('CREATE_COMPLETE', [change('Logs')],
+                                     next_token='t1'), farm_cs)
+        stub.add_response('describe_change_set',
+                          change_set('CREATE_COMPLETE', [change('Data')]),
+                          dict(farm_cs, NextToken='t1'))
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [event('e1', 'farm',
+                                                 'CREATE_COMPLETE')]},
+                          {'StackName': 'farm'})
+        stub.add_response('execute_change_set', {}, farm_cs)
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [
+                              event('e3', 'Logs', 'CREATE_IN_PROGRESS'),
+                              event('e2', 'farm', 'UPDATE_IN_PROGRESS'),
+                              event('e1', 'farm', 'CREATE_COMPLETE')]},
+                          {'StackName': 'farm'})
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [
+                              event('e5', 'farm', 'UPDATE_COMPLETE'),
+                              event('e4', 'Logs', 'CREATE_COMPLETE'),
+                              event('e3', 'Logs', 'CREATE_IN_PROGRESS')]},
+                          {'StackName': 'farm'})
+
+        # web stack: no change
+        stub.add_response('create_change_set', {'Id': 'cs-2'},
+                          dict(web_cs, TemplateBody=ANY,
+                               Capabilities=['CAPABILITY_IAM']))
+        stub.add_response(
+            'describe_change_set',
+            change_set('FAILED', reason="The submitted information didn't "
+                       "contain changes. Submit different information to "
+                       "create a change set."), web_cs)
+        stub.add_response('delete_change_set', {}, web_cs)
+
+        events = []
+        results = process_change_sets(
+            [farm, web], name='cs', poll_interval=0, max_workers=1,
+            callback=lambda s, e: events.append((s, e['EventId'])))
+        stub.assert_no_pending_responses()
+
+    assert results['farm'].success
+    assert [c['ResourceChange']['LogicalResourceId']
+            for c in results['farm'].changes] == ['Logs', 'Data']
+    assert results['farm'].stack_status == 'UPDATE_COMPLETE'
+    assert events == [('farm', 'e2'), ('farm', 'e3'), ('farm', 'e4'),
+                      ('farm', 'e5')]
+    assert results['web'].empty
+    assert str(results['web']) == 'web: no change'
+
+
+def test_timeout():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        client = aws_env.client('cloudformation')
+        stub = aws_env.stub('cloudformation')
+        with pytest.raises(ChangeSetTimeout):
+            wait_change_set(client, 'farm', 'cs', timeout=0)
+        with pytest.raises(ChangeSetTimeout):
+            stream_stack_events(client, 'farm', None, timeout=0)
+        stub.assert_no_pending_responses()
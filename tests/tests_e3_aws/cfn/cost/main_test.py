@@ -0,0 +1,49 @@
+import os
+
+from e3.aws.cfn import Stack
+from e3.aws.cfn.cost import estimate_cost, load_price_table
+from e3.aws.cfn.ec2 import EBSDisk, Instance
+from e3.aws.cfn.s3 import Bucket
+from e3.aws.ec2.ami import AMI
+
+
+def test_estimate_cost():
+    image = AMI('ami-1234', region='us-east-1',
+                data={'ImageId': 'ami-1234', 'RootDeviceName': '/dev/sda1'})
+    stack = Stack('farm')
+    stack += Instance('Builder', image, instance_type='m5.large',
+                      disk_size=100, disk_type='gp3', disk_iops=4000)
+    stack['Builder'].add(EBSDisk('/dev/sdb', size=200, volume_type='st1'))
+    stack += Instance('Other', image, instance_type='t2.micro')
+    stack['Other'].instance_type = 'x9.huge'
+    stack += Bucket('Artifacts')
+
+    table = load_price_table()
+    estimate = estimate_cost(stack, 'us-east-1',
+                             usage={'Artifacts': {'STANDARD': 1000}},
+                             cache_dir='cache')
+    assert estimate.resources['Builder'] == [
+        ('m5.large', 70.08),
+        ('/dev/sda1 gp3 100GB', 8.0),
+        ('/dev/sda1 1000 IOPS', 5.0),
+        ('/dev/sdb st1 200GB', 9.0)]
+    assert estimate.resource_cost('Artifacts') == 23.0
+    assert estimate.unpriced == ['Other']
+    assert estimate.total == 115.08
+    assert 'Total (monthly)' in str(estimate)
+
+    # Results are cached in memory and on disk. Modifying a result does
+    # not alter the cache.
+    estimate.add('Builder', 'extra', 10)
+    estimate.unpriced.append('Builder')
+    cached = estimate_cost(stack, 'us-east-1',
+                           usage={'Artifacts': {'STANDARD': 1000}})
+    assert cached is not estimate
+    assert cached.total == 115.08
+    assert cached.unpriced == ['Other']
+    assert len(os.listdir('cache')) == 1
+
+    table['regions']['us-east-1']['ec2']['m5.large'] = 0.1
+    estimate = estimate_cost(stack, 'us-east-1', price_table=table,
+                             usage={'Artifacts': {'STANDARD': 1000}})
+    assert estimate.resources['Builder'][0] == ('m5.large', 73.0)
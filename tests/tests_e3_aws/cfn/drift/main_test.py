@@ -0,0 +1,91 @@
+from datetime import datetime
+
+from e3.aws import AWSEnv, default_region
+from e3.aws.cfn import Stack
+from e3.aws.cfn.drift import detect_drift
+
+
+def status(detection_id, detection_status, drift_status=None):
+    result = {'StackId': detection_id.replace('d-', 'stack-'),
+              'StackDriftDetectionId': detection_id,
+              'DetectionStatus': detection_status,
+              'Timestamp': datetime(2020, 1, 1)}
+    if drift_status is not None:
+        result['StackDriftStatus'] = drift_status
+    return result
+
+
+def test_detect_drift():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True,
+                     retry_mode='adaptive', max_pool_connections=1)
+    assert aws_env.config.retries == {'mode': 'adaptive'}
+    with default_region('us-east-1'):
+        stub = aws_env.stub('cloudformation')
+        for name in ('farm', 'web', 'gone'):
+            if name == 'gone':
+                stub.add_client_error(
+                    'detect_stack_drift',
+                    service_error_code='ValidationError',
+                    service_message='Stack gone does not exist')
+            else:
+                stub.add_response('detect_stack_drift',
+                                  {'StackDriftDetectionId': 'd-' + name},
+                                  {'StackName': name})
+        stub.add_response(
+            'describe_stack_drift_detection_status',
+            status('d-farm', 'DETECTION_IN_PROGRESS'),
+            {'StackDriftDetectionId': 'd-farm'})
+        stub.add_response(
+            'describe_stack_drift_detection_status',
+            status('d-web', 'DETECTION_COMPLETE', 'IN_SYNC'),
+            {'StackDriftDetectionId': 'd-web'})
+        stub.add_response(
+            'describe_stack_drift_detection_status',
+            status('d-farm', 'DETECTION_COMPLETE', 'DRIFTED'),
+            {'StackDriftDetectionId': 'd-farm'})
+        stub.add_response(
+            'describe_stack_resource_drifts',
+            {'StackResourceDrifts': [{
+                'StackId': 'stack-farm',
+                'LogicalResourceId': 'Builder',
+                'ResourceType': 'AWS::EC2::Instance',
+                'StackResourceDriftStatus': 'MODIFIED',
+                'PropertyDifferences': [{
+                    'PropertyPath': '/InstanceType',
+                    'ExpectedValue': 'c5.xlarge',
+                    'ActualValue': 'c5.2xlarge',
+                    'DifferenceType': 'NOT_EQUAL'}],
+                'Timestamp': datetime(2020, 1, 1)}]},
+            {'StackName': 'farm',
+             'StackResourceDriftStatusFilters': ['MODIFIED', 'DELETED']})
+
+        report = detect_drift([Stack('farm'), 'web', 'gone'],
+                              poll_interval=0, max_workers=1)
+        stub.assert_no_pending_responses()
+
+    assert report.drifted == ['farm']
+    assert report.failed == ['gone']
+    assert report.stacks['web'].drift_status == 'IN_SYNC'
+    assert [r['LogicalResourceId'] for r in report.resources] == ['Builder']
+    assert '/InstanceType: c5.xlarge -> c5.2xlarge' in str(report)
+
+
+def test_detect_drift_failed():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('cloudformation')
+        stub.add_response('detect_stack_drift',
+                          {'StackDriftDetectionId': 'd-farm'},
+                          {'StackName': 'farm'})
+        failed = status('d-farm', 'DETECTION_FAILED', 'DRIFTED')
+        failed['DetectionStatusReason'] = 'Failed to detect drift: Builder'
+        stub.add_response('describe_stack_drift_detection_status', failed,
+                          {'StackDriftDetectionId': 'd-farm'})
+
+        report = detect_drift(['farm'], poll_interval=0, max_workers=1)
+        stub.assert_no_pending_responses()
+
+    assert report.failed == ['farm']
+    assert report.drifted == []
+    assert report.resources == []
+    assert str(report) == 'farm: FAILED: Failed to detect drift: Builder'
@@ -1,13 +1,22 @@
 from __future__ import absolute_import, division, print_function
 
+import base64
+import gzip
+
 import pytest
+import yaml
 from botocore.stub import ANY
 from e3.aws import AWSEnv, default_region
 from e3.aws.cfn import Stack
-from e3.aws.cfn.ec2 import (VPC, EphemeralDisk, Instance, InternetGateway,
-                            NetworkInterface, Route, RouteTable, Subnet,
-                            SubnetRouteTableAssociation, VPCGatewayAttachment)
+from e3.aws.cfn.ec2 import (VPC, EBSDisk, EphemeralDisk, Fleet, Instance,
+                            InternetGateway, NetworkInterface, PlacementGroup,
+                            Route, RouteTable, Subnet,
+                            SubnetRouteTableAssociation, VPCEndpoint,
+                            VPCGatewayAttachment, add_vpc_endpoints)
+from e3.aws.cfn.ec2.cidr import CidrAllocator
 from e3.aws.cfn.ec2.security import SecurityGroup
+from e3.aws.cfn.ec2.user_data import (MAX_USER_DATA_SIZE, UserData,
+                                      encode_user_data)
 from e3.aws.ec2.ami import AMI
 
 
@@ -65,3 +74,323 @@ def test_create_instance():
 
         with pytest.raises(AssertionError):
             i.add("non valid ec2 device")
+
+
+def test_cidr_allocator():
+    allocator = CidrAllocator('10.0.0.0/16')
+    assert str(allocator.allocate(24)) == '10.0.0.0/24'
+    assert str(allocator.allocate(20)) == '10.0.16.0/20'
+    assert str(allocator.allocate(24)) == '10.0.1.0/24'
+    assert str(allocator.reserve('10.0.128.0/17')) == '10.0.128.0/17'
+    assert str(allocator.conflict('10.0.200.0/24')) == '10.0.128.0/17'
+    assert str(allocator.conflict('10.0.0.0/20')) == '10.0.0.0/20'
+    assert allocator.conflict('10.0.2.0/24') is None
+
+    with pytest.raises(AssertionError):
+        allocator.reserve('10.0.1.128/25')
+    with pytest.raises(AssertionError):
+        allocator.allocate(16)
+
+    allocator.release('10.0.128.0/17')
+    assert str(allocator.allocate(17)) == '10.0.128.0/17'
+
+    # Releasing all blocks gives back the whole range
+    for block in ('10.0.0.0/24', '10.0.1.0/24', '10.0.16.0/20',
+                  '10.0.128.0/17'):
+        allocator.release(block)
+    assert str(allocator.allocate(16)) == '10.0.0.0/16'
+    allocator.release('10.0.0.0/16')
+
+    with pytest.raises(AssertionError):
+        allocator.conflict('10.1.0.0/24')
+
+    # Heaps do not accumulate blocks coalesced on release
+    for _ in range(1000):
+        allocator.reserve('10.0.5.0/24')
+        allocator.release('10.0.5.0/24')
+    assert max(len(h) for h in allocator.free_heaps.values()) <= 2
+
+
+def test_vpc_subnets():
+    vpc = VPC('VPC', '10.10.0.0/16')
+    public = vpc.subnet('Public', cidr_block='10.10.0.0/24')
+    private = vpc.subnets(['Private%s' % i for i in range(3)], 24)
+    assert public.properties['CidrBlock'] == '10.10.0.0/24'
+    assert [s.cidr_block for s in private] == \
+        ['10.10.1.0/24', '10.10.2.0/24', '10.10.3.0/24']
+    with pytest.raises(AssertionError):
+        vpc.subnet('Overlap', cidr_block='10.10.2.128/25')
+
+    # Fill the VPC with /28 subnets
+    subnets = vpc.subnets(['S%s' % i for i in range(4032)], 28)
+    assert len({s.cidr_block for s in subnets}) == 4032
+    with pytest.raises(AssertionError):
+        vpc.subnet('Full', prefix_length=28)
+
+
+def test_ebs_disk():
+    assert EBSDisk('/dev/sda1').properties == {
+        'DeviceName': '/dev/sda1',
+        'Ebs': {'VolumeSize': 20, 'VolumeType': 'standard'}}
+    assert EBSDisk('/dev/sdb', size=100, volume_type='gp3', iops=4000,
+                   throughput=1000, encrypted=True,
+                   delete_on_termination=True).properties == {
+        'DeviceName': '/dev/sdb',
+        'Ebs': {'VolumeSize': 100, 'VolumeType': 'gp3', 'Iops': 4000,
+                'Throughput': 1000, 'Encrypted': True,
+                'DeleteOnTermination': True}}
+    assert EBSDisk('/dev/sdb', size=8, volume_type='gp3').properties
+    assert EBSDisk('/dev/sdb', size=100, volume_type='io2',
+                   iops=50000).properties['Ebs']['Iops'] == 50000
+
+    for kwargs in ({'volume_type': 'magnetic'},
+                   {'volume_type': 'st1', 'size': 100},
+                   {'volume_type': 'standard', 'size': 2000},
+                   {'volume_type': 'io1', 'size': 100},
+                   {'volume_type': 'io1', 'size': 100, 'iops': 10000},
+                   {'volume_type': 'gp2', 'iops': 3000},
+                   {'volume_type': 'gp3', 'size': 8, 'iops': 5000},
+                   {'volume_type': 'gp3', 'throughput': 1000},
+                   {'volume_type': 'io2', 'iops': 1000, 'throughput': 200},
+                   {'volume_type': 'gp3', 'kms_key_id': 'key'}):
+        with pytest.raises(AssertionError):
+            EBSDisk('/dev/sdb', **kwargs)
+
+
+def test_instance_root_disk():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('ec2', region='us-east-1')
+        stub.add_response(
+            'describe_images',
+            {'Images': [{'ImageId': 'ami-1234',
+                         'RootDeviceName': '/dev/sda1'}]},
+            {'ImageIds': ANY})
+        i = Instance('testmachine', AMI('ami-1234'), disk_size=50,
+                     disk_type='gp3', disk_iops=6000, disk_throughput=500,
+                     disk_delete_on_termination=False)
+        assert i.properties['BlockDeviceMappings'] == [
+            {'DeviceName': '/dev/sda1',
+             'Ebs': {'VolumeSize': 50, 'VolumeType': 'gp3', 'Iops': 6000,
+                     'Throughput': 500, 'DeleteOnTermination': False}}]
+
+
+def test_instance_performance_options():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('ec2', region='us-east-1')
+        stub.add_response(
+            'describe_images',
+            {'Images': [{'ImageId': 'ami-1234',
+                         'RootDeviceName': '/dev/sda1',
+                         'Architecture': 'x86_64',
+                         'EnaSupport': True}]},
+            {'ImageIds': ANY})
+        image = AMI('ami-1234')
+
+    group = PlacementGroup('BuildFarm')
+    assert group.properties == {'Strategy': 'cluster'}
+    assert PlacementGroup('Spread', strategy='spread',
+                          spread_level='rack').properties == \
+        {'Strategy': 'spread', 'SpreadLevel': 'rack'}
+    with pytest.raises(AssertionError):
+        PlacementGroup('Spread', strategy='spread', partition_count=2)
+
+    i = Instance('builder', image, instance_type='c5.4xlarge')
+    i.configure(placement_group=group, ebs_optimized=True,
+                tenancy='dedicated', core_count=4, threads_per_core=1,
+                nitro_enclave=True)
+    props = i.properties
+    assert props['PlacementGroupName'].name == 'BuildFarm'
+    assert props['EbsOptimized'] is True
+    assert props['Tenancy'] == 'dedicated'
+    assert props['CpuOptions'] == {'CoreCount': 4, 'ThreadsPerCore': 1}
+    assert props['EnclaveOptions'] == {'Enabled': True}
+
+    for kwargs in ({'placement_group': group},
+                   {'ebs_optimized': True},
+                   {'core_count': 1}):
+        with pytest.raises(AssertionError):
+            Instance('small', image, instance_type='t2.micro').configure(
+                **kwargs)
+
+    # A rejected configuration leaves the instance unchanged
+    t2 = Instance('small', image, instance_type='t2.micro')
+    with pytest.raises(AssertionError):
+        t2.configure(tenancy='dedicated', placement_group=group)
+    assert t2.tenancy is None and t2.placement_group is None
+    t2.configure(tenancy='dedicated')
+    assert t2.properties['Tenancy'] == 'dedicated'
+
+    for kwargs in ({'core_count': 9},
+                   {'threads_per_core': 3},
+                   {'tenancy': 'shared'}):
+        with pytest.raises(AssertionError):
+            Instance('i', image, instance_type='c5.2xlarge').configure(
+                **kwargs)
+    with pytest.raises(AssertionError):
+        Instance('i', image, instance_type='c5.large').configure(
+            nitro_enclave=True)
+
+    # Architecture mismatch between the image and the instance type
+    with pytest.raises(AssertionError):
+        Instance('arm', image, instance_type='m6g.large')
+
+    # Unknown instance types are not checked
+    Instance('i', image, instance_type='x42.large').configure(
+        core_count=128)
+
+
+def test_instance_store():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('ec2', region='us-east-1')
+        stub.add_response(
+            'describe_images',
+            {'Images': [{'ImageId': 'ami-1234',
+                         'RootDeviceName': '/dev/sda1'}]},
+            {'ImageIds': ANY})
+        image = AMI('ami-1234')
+
+    # Non NVMe volumes are added to the block device mapping
+    i = Instance('c3', image, instance_type='c3.xlarge')
+    i.add(EBSDisk('/dev/sdb'))
+    i.user_data = '#!/bin/bash\necho hello\n'
+    i.map_instance_store(scratch_mount_point='/scratch')
+    assert i.properties['BlockDeviceMappings'][1:] == [
+        {'DeviceName': '/dev/sdc', 'VirtualName': 'ephemeral0'},
+        {'DeviceName': '/dev/sdd', 'VirtualName': 'ephemeral1'}]
+    user_data = i.properties['UserData'].content
+    assert user_data.startswith('#!/bin/bash\n# Assemble')
+    assert 'for dev in /dev/sdc /dev/sdd; do' in user_data
+    # The scratch volume setup does not change the shell state of the
+    # user script
+    assert '#!/bin/bash\n# Assemble instance store volumes into a ' \
+        'scratch volume\n(\nset -e\n' in user_data
+    assert user_data.endswith(
+        '/scratch\n)\ntest $? -eq 0 || exit 1\n\necho hello\n')
+
+    # NVMe volumes are detected at boot
+    i = Instance('i3', image, instance_type='i3.8xlarge')
+    i.map_instance_store(scratch_mount_point='/scratch')
+    assert i.properties['BlockDeviceMappings'] == []
+    assert 'NVMe Instance Storage' in i.properties['UserData'].content
+
+    with pytest.raises(AssertionError):
+        Instance('m5', image, instance_type='m5.large').map_instance_store()
+
+
+def test_vpc_endpoints():
+    s = Stack(name='MyStack')
+    s += VPC('BuildVPC', '10.10.0.0/16')
+    subnets = s['BuildVPC'].subnets(['Private1', 'Private2'], 24)
+    for subnet in subnets:
+        s += subnet
+    s += RouteTable('RT', s['BuildVPC'])
+    s += SecurityGroup('Endpoints', s['BuildVPC'])
+    endpoints = add_vpc_endpoints(s, s['BuildVPC'],
+                                  route_tables=[s['RT']],
+                                  subnets=subnets,
+                                  security_groups=[s['Endpoints']],
+                                  interface_services=['sts', 'ecr.api'])
+    assert [e.name for e in endpoints] == [
+        'BuildVPCDynamodbEndpoint', 'BuildVPCS3Endpoint',
+        'BuildVPCStsEndpoint', 'BuildVPCEcrApiEndpoint']
+    assert s['BuildVPCS3Endpoint'].properties['VpcEndpointType'] == \
+        'Gateway'
+    props = s['BuildVPCStsEndpoint'].properties
+    assert props['VpcEndpointType'] == 'Interface'
+    assert props['PrivateDnsEnabled'] is True
+    assert "!Sub 'com.amazonaws.${AWS::Region}.s3'" in s.body
+
+    with pytest.raises(AssertionError):
+        VPCEndpoint('Bad', s['BuildVPC'], 'sts', route_tables=[s['RT']])
+
+    # S3 can be reached through both kinds of endpoints
+    endpoints = add_vpc_endpoints(Stack('Other'), s['BuildVPC'],
+                                  route_tables=[s['RT']],
+                                  subnets=subnets,
+                                  gateway_services=['s3'],
+                                  interface_services=['s3'])
+    assert [e.name for e in endpoints] == [
+        'BuildVPCS3Endpoint', 'BuildVPCS3InterfaceEndpoint']
+
+
+def test_user_data():
+    image = AMI('ami-1234', region='us-east-1',
+                data={'ImageId': 'ami-1234', 'RootDeviceName': '/dev/sda1'})
+    script = '#!/bin/bash\n' + 'echo "configure the instance"\n' * 200
+
+    # Small user data is emitted as is
+    user_data = UserData().add('#!/bin/bash\necho hello\n')
+    assert user_data.export().content == '#!/bin/bash\necho hello\n'
+
+    # Repetitive multipart user data is compressed
+    user_data = UserData()
+    user_data.add_cloud_config({'packages': ['git']})
+    user_data.add(script)
+    encoded = user_data.export()
+    assert isinstance(encoded, str)
+    content = gzip.decompress(base64.b64decode(encoded))
+    assert content == user_data.content
+    assert b'text/cloud-config' in content
+    assert user_data.export() == encoded
+    # Encoding is memoized
+    assert encode_user_data(content) is encode_user_data(content)
+
+    # Encoded user data is emitted unchanged by instances
+    instance = Instance('Builder', image)
+    instance.user_data = encoded
+    assert instance.properties['UserData'] == encoded
+    stack = Stack('test-stack')
+    stack += instance
+    assert yaml.safe_load(stack.body)['Resources']['Builder'][
+        'Properties']['UserData'] == encoded
+
+    with pytest.raises(AssertionError):
+        UserData(compress=False).add('#' * (MAX_USER_DATA_SIZE + 1)).export()
+
+    # User data shared by instances is stored once in the template
+    stack = Stack('test-stack')
+    for name in ('Builder1', 'Builder2'):
+        instance = Instance(name, image)
+        instance.user_data = user_data.export(stack)
+        stack += instance
+    instance = Instance('Builder3', image, instance_type='c5d.xlarge')
+    instance.user_data = UserData().add(script)
+    instance.map_instance_store(scratch_mount_point='/scratch')
+    stack += instance
+
+    template = stack.export()
+    assert list(template['Mappings']['UserData'].values()) == [
+        {'Value': encoded}]
+    assert 'Fn::FindInMap' not in stack.body
+    assert '!FindInMap' in stack.body
+    assert len(instance.user_data.parts) == 2
+
+
+def test_fleet():
+    image = AMI('ami-1234', region='us-east-1',
+                data={'ImageId': 'ami-1234', 'RootDeviceName': '/dev/sda1'})
+    stack = Stack('test-stack')
+    stack += VPC('VPC', '10.10.0.0/16')
+    stack += Subnet('Subnet', stack['VPC'], '10.10.10.0/24')
+    template = Instance('Worker', image, disk_size=20)
+    template.add(NetworkInterface(stack['Subnet']))
+    fleet = Fleet(template, 100)
+    assert len(fleet) == 100
+    for instance in fleet:
+        stack += instance
+    assert fleet[0].public_ip.name == 'Worker1'
+
+    resources = stack.export(dedup=True)['Resources']
+    assert yaml.dump(resources['Worker100']) == \
+        yaml.dump(template.export())
+    assert resources['Worker1'] is resources['Worker100']
+    assert stack.body.count('AWS::EC2::Instance') == 100
+    assert '&id' not in stack.body
+
+    # Plain exports stay mutable
+    resources = stack.export()['Resources']
+    resources['Worker1']['Properties']['InstanceType'] = 'c5.xlarge'
+    assert resources['Worker2']['Properties']['InstanceType'] == 't2.micro'
@@ -1,6 +1,9 @@
 import pytest
 from e3.aws.cfn.ec2 import VPC
-from e3.aws.cfn.ec2.security import EgressRule, IngressRule, SecurityGroup
+from e3.aws.cfn.ec2.security import (EgressRule, IngressRule, IntervalTree,
+                                     Ipv4EgressRule, Ipv4IngressRule,
+                                     SecurityGroup, SecurityGroupIndex,
+                                     compact_rules)
 
 
 def test_security_group():
@@ -20,3 +23,119 @@ def test_security_group():
 
     with pytest.raises(AssertionError):
         sg.add_rule("invalid object")
+
+
+def test_compact_rules():
+    rules = [
+        Ipv4IngressRule('tcp', '10.10.1.0/24', from_port=80, to_port=90),
+        Ipv4IngressRule('tcp', '10.10.1.0/24', from_port=85, to_port=100),
+        Ipv4IngressRule('6', '10.10.1.0/24', from_port=101),
+        Ipv4IngressRule('tcp', '10.10.0.0/24', from_port=80, to_port=101),
+        # Covered by the /23 resulting from the aggregation above
+        Ipv4IngressRule('tcp', '10.10.1.12/32', from_port=90),
+        # Same ports but another protocol
+        Ipv4IngressRule('udp', '10.10.1.12/32', from_port=90),
+        Ipv4IngressRule('-1', '10.20.0.0/25'),
+        Ipv4IngressRule('-1', '10.20.0.128/25'),
+        IngressRule('ssh', '10.10.1.1/32')]
+    result = compact_rules(rules)
+    # Rules not targeting an IPv4 CIDR are kept as is
+    assert result[0] is rules[-1]
+    assert [r.properties for r in result[1:]] == [
+        {'CidrIp': '10.10.0.0/23', 'IpProtocol': 'tcp',
+         'FromPort': 80, 'ToPort': 101},
+        {'CidrIp': '10.10.1.12/32', 'IpProtocol': 'udp',
+         'FromPort': 90, 'ToPort': 90},
+        {'CidrIp': '10.20.0.0/24', 'IpProtocol': '-1'}]
+
+
+def test_compact_security_group():
+    vpc = VPC("vpc", cidr_block="10.10.0.0/16")
+    sg = SecurityGroup(
+        "SecurityGroup",
+        vpc,
+        rules=[Ipv4IngressRule('ssh', '0.0.0.0/0', description='ssh'),
+               Ipv4IngressRule('ssh', '10.0.0.0/8', description='ssh'),
+               Ipv4EgressRule('tcp', '0.0.0.0/0', from_port=1,
+                              to_port=1000),
+               Ipv4EgressRule('tcp', '0.0.0.0/0', from_port=1001,
+                              to_port=65535, description='high ports')])
+    sg.compact()
+    assert sg.properties['SecurityGroupIngress'] == [
+        {'CidrIp': '0.0.0.0/0', 'IpProtocol': 'tcp',
+         'FromPort': 22, 'ToPort': 22, 'Description': 'ssh'}]
+    # Descriptions differ (one of the rules has none) so none is kept
+    assert sg.properties['SecurityGroupEgress'] == [
+        {'CidrIp': '0.0.0.0/0', 'IpProtocol': 'tcp',
+         'FromPort': 1, 'ToPort': 65535}]
+
+
+def test_compact_many_rules():
+    rules = [Ipv4IngressRule('tcp', '10.%s.%s.0/24' % (i // 256, i % 256),
+                             from_port=1000 + i % 2 * 5,
+                             to_port=1005 + i % 2 * 5)
+             for i in range(4096)]
+    rules += [Ipv4IngressRule('tcp', '10.%s.%s.0/24' % (i // 256, i % 256),
+                              from_port=1000 + (i + 1) % 2 * 5,
+                              to_port=1005 + (i + 1) % 2 * 5)
+              for i in range(4096)]
+    result = compact_rules(rules)
+    assert [r.properties for r in result] == [
+        {'CidrIp': '10.0.0.0/12', 'IpProtocol': 'tcp',
+         'FromPort': 1000, 'ToPort': 1010}]
+
+
+def test_security_group_index():
+    vpc = VPC("vpc", cidr_block="10.0.0.0/8")
+    db = SecurityGroup(
+        "DB", vpc,
+        rules=[Ipv4IngressRule('tcp', '10.2.0.0/16', from_port=5432),
+               Ipv4EgressRule('-1', '0.0.0.0/0')])
+    web = SecurityGroup(
+        "Web", vpc,
+        rules=[Ipv4IngressRule('tcp', '0.0.0.0/0', from_port=80,
+                               to_port=443),
+               Ipv4IngressRule('6', '10.2.3.0/24', from_port=5000,
+                               to_port=6000)])
+    admin = SecurityGroup(
+        "Admin", vpc,
+        rules=[Ipv4IngressRule('-1', '10.2.3.4/32'),
+               IngressRule('ssh', 'sg-1234')])
+    index = SecurityGroupIndex([db, web, admin])
+
+    def names(groups):
+        return sorted(g.name for g in groups)
+
+    assert names(index.groups('tcp', 5432, '10.2.3.4')) == \
+        ['Admin', 'DB', 'Web']
+    assert names(index.groups('tcp', 5432, '10.2.4.4')) == ['DB']
+    assert names(index.groups('udp', 5432, '10.2.3.4')) == ['Admin']
+    assert names(index.groups('tcp', 22, '192.168.0.1')) == []
+    assert names(index.groups('tcp', 443, '192.168.0.1')) == ['Web']
+    assert names(index.groups('tcp', 5432, '8.8.8.8',
+                              direction='egress')) == ['DB']
+
+    # Range queries
+    assert names(index.groups('tcp', (1, 1024), '10.2.0.0/16')) == \
+        ['Admin', 'Web']
+    assert names(index.groups('tcp', (5400, 5500), '10.2.0.0/16',
+                              covering=True)) == []
+    assert names(index.groups('tcp', (5400, 5500), '10.2.3.0/24',
+                              covering=True)) == ['Web']
+    assert names(index.groups('tcp', None, '10.0.0.0/8')) == \
+        ['Admin', 'DB', 'Web']
+
+    assert [names(r) for r in index.query_many(
+        [{'protocol': 'tcp', 'port': 5432, 'cidr': '10.2.4.4'},
+         {'protocol': 'tcp', 'port': 80, 'cidr': '1.2.3.4'},
+         {'protocol': 'tcp', 'port': 5432, 'cidr': '10.2.4.4'}])] == \
+        [['DB'], ['Web'], ['DB']]
+
+
+def test_interval_tree():
+    intervals = [(i, i + 10, i) for i in range(0, 1000, 5)]
+    tree = IntervalTree(intervals)
+    for low, high in ((0, 0), (12, 12), (100, 200), (990, 2000),
+                      (-10, -1)):
+        assert sorted(tree.overlap(low, high)) == \
+            [v for s, e, v in intervals if s <= high and e >= low]
@@ -0,0 +1,84 @@
+import copy
+import pickle
+
+import pytest
+import yaml
+from e3.aws.cfn import GetAtt, Ref, Stack, TemplateDumper
+from e3.aws.cfn.ec2 import VPC, Subnet
+from e3.aws.cfn.ec2.security import SecurityGroup
+from e3.aws.cfn.fragment import (FragmentPool, FrozenDict,
+                                 ReadOnlyFragmentError)
+
+
+def test_intern():
+    pool = FragmentPool()
+    first = pool.intern({'Port': 22, 'Target': [Ref('VPC'), 'x'],
+                         'Enabled': True})
+    second = pool.intern({'Port': 22, 'Target': [Ref('VPC'), 'x'],
+                          'Enabled': True})
+    assert first is second
+    assert isinstance(first, FrozenDict)
+    assert pool.intern(first) is first
+
+    # Values of different types or intrinsics with different attributes are
+    # not merged
+    assert pool.intern({'Port': 22.0}) is not pool.intern({'Port': 22})
+    assert pool.intern({'Enabled': 1}) is not pool.intern({'Enabled': True})
+    assert pool.intern([GetAtt('A', 'Arn')]) is not \
+        pool.intern([GetAtt('B', 'Arn')])
+    assert pool.intern([Ref('VPC')])[0] is first['Target'][0]
+
+
+def test_copy_on_write():
+    shared = FragmentPool().intern({'Tags': [{'Key': 'a', 'Value': 'b'}]})
+    with pytest.raises(ReadOnlyFragmentError):
+        shared['Tags'] = []
+    with pytest.raises(ReadOnlyFragmentError):
+        shared['Tags'].append({})
+    with pytest.raises(ReadOnlyFragmentError):
+        shared.update({'Key': 'c'})
+
+    private = copy.deepcopy(shared)
+    private['Tags'][0]['Value'] = 'c'
+    assert shared['Tags'][0]['Value'] == 'b'
+    mutable = shared.copy()
+    mutable['Name'] = 'x'
+    assert 'Name' not in shared
+    assert pickle.loads(pickle.dumps(shared)) == shared
+
+
+def test_stack_export():
+    stack = Stack('test-stack')
+    stack += VPC('VPC', '10.10.0.0/16')
+    for index in range(10):
+        stack += Subnet('Subnet%s' % index, stack['VPC'], '10.10.10.0/24')
+        group = SecurityGroup('Group%s' % index, stack['VPC'])
+        stack += group
+
+    resources = stack.export(dedup=True)['Resources']
+    assert resources['Group0'] is resources['Group9']
+    assert resources['Subnet0'] is resources['Subnet9']
+    assert resources['Subnet0']['Properties']['VpcId'] is \
+        resources['Group0']['Properties']['VpcId']
+    assert yaml.dump(stack.export(dedup=False)) == \
+        yaml.dump(stack.export(dedup=True), Dumper=TemplateDumper)
+    assert stack.export(dedup=False)['Resources']['Group0'] is not \
+        stack.export(dedup=False)['Resources']['Group9']
+    assert '&id' not in stack.body
+
+    # By default exported fragments can be modified
+    resources = stack.export()['Resources']
+    resources['Group0']['Properties']['GroupDescription'] = 'builders'
+    assert 'builders' not in stack.body
+
+
+def test_stack_body():
+    stack = Stack('test-stack', description='shared fragments ' * 10)
+    stack += VPC('VPC', '10.10.0.0/16')
+    for name in ('Yes', '123', 'Subnet'):
+        stack += Subnet(name, stack['VPC'], '10.10.10.0/24')
+    stack.add_mapping('Images', 'useast1', {'Id': 'ami-1234'})
+    assert stack.body == yaml.dump(stack.export(), Dumper=TemplateDumper)
+    assert "'123':" in stack.body
+    assert stack.body == yaml.dump(stack.export(dedup=False))
+    assert yaml.safe_load(Stack('empty').body)['Resources'] == {}
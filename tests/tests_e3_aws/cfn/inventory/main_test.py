@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from e3.aws import AWSEnv
+from e3.aws.cfn.inventory import StackInventory
+
+
+def summary(name, status, updated=None, region='us-east-1'):
+    stack_id = 'arn:aws:cloudformation:%s:1:stack/%s/1' % (region, name)
+    result = {'StackId': stack_id,
+              'StackName': name,
+              'StackStatus': status,
+              'CreationTime': datetime(2020, 1, 1)}
+    if updated is not None:
+        result['LastUpdatedTime'] = updated
+    return result
+
+
+def stack(name, status, tags, region='us-east-1'):
+    return {'Stacks': [{
+        'StackId': summary(name, status, region=region)['StackId'],
+        'StackName': name,
+        'StackStatus': status,
+        'CreationTime': datetime(2020, 1, 1),
+        'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]}]}
+
+
+def test_inventory():
+    aws_env = AWSEnv(regions=['us-east-1', 'eu-west-1'], stub=True)
+    us = aws_env.stub('cloudformation', region='us-east-1')
+    eu = aws_env.stub('cloudformation', region='eu-west-1')
+
+    us.add_response('list_stacks', {
+        'StackSummaries': [summary('farm-1', 'CREATE_COMPLETE'),
+                           summary('farm-2', 'UPDATE_IN_PROGRESS',
+                                   datetime(2020, 2, 1))],
+        'NextToken': 'page2'}, {})
+    us.add_response('list_stacks', {
+        'StackSummaries': [summary('old', 'DELETE_COMPLETE')]},
+        {'NextToken': 'page2'})
+    # Many stacks changed in us-east-1 so they are described all at once
+    us.add_response('describe_stacks', {
+        'Stacks': stack('farm-1', 'CREATE_COMPLETE',
+                        {'team': 'build'})['Stacks'],
+        'NextToken': 'page2'}, {})
+    us.add_response('describe_stacks',
+                    stack('farm-2', 'UPDATE_IN_PROGRESS', {'team': 'qa'}),
+                    {'NextToken': 'page2'})
+    eu.add_response('list_stacks', {
+        'StackSummaries': [summary('farm-1', 'CREATE_COMPLETE',
+                                   region='eu-west-1')]}, {})
+    eu.add_response('describe_stacks',
+                    stack('farm-1', 'CREATE_COMPLETE', {'team': 'build'},
+                          region='eu-west-1'),
+                    {'StackName': summary('farm-1', '',
+                                          region='eu-west-1')['StackId']})
+
+    inventory = StackInventory('inventory.db')
+    inventory.MAX_SINGLE_DESCRIBE = 1
+    assert inventory.refresh() == 4
+    assert [(s['region'], s['name']) for s in inventory.query('farm-*')] == [
+        ('eu-west-1', 'farm-1'), ('us-east-1', 'farm-1'),
+        ('us-east-1', 'farm-2')]
+    assert [s['name'] for s in inventory.query(
+        status=['UPDATE_IN_PROGRESS'])] == ['farm-2']
+    assert [s['region'] for s in inventory.query(
+        tags={'team': 'build'})] == ['eu-west-1', 'us-east-1']
+    assert inventory.query(region='us-east-1', tags={'team': None},
+                           name='*-2')[0]['tags'] == {'team': 'qa'}
+    assert [s['name'] for s in inventory.query(
+        include_deleted=True, region='us-east-1')] == [
+            'farm-1', 'farm-2', 'old']
+    inventory.close()
+
+    # Only changed stacks are described. Stacks no longer listed are
+    # removed.
+    us.add_response('list_stacks', {
+        'StackSummaries': [summary('farm-1', 'CREATE_COMPLETE'),
+                           summary('farm-2', 'UPDATE_COMPLETE',
+                                   datetime(2020, 2, 1))]}, {})
+    us.add_response('describe_stacks',
+                    stack('farm-2', 'UPDATE_COMPLETE', {'team': 'qa'}),
+                    {'StackName': summary('farm-2', '')['StackId']})
+    eu.add_response('list_stacks', {'StackSummaries': []}, {})
+
+    inventory = StackInventory('inventory.db')
+    assert inventory.refresh() == 1
+    assert [(s['region'], s['name'], s['status'])
+            for s in inventory.query(include_deleted=True)] == [
+        ('us-east-1', 'farm-1', 'CREATE_COMPLETE'),
+        ('us-east-1', 'farm-2', 'UPDATE_COMPLETE')]
+    us.assert_no_pending_responses()
+    eu.assert_no_pending_responses()
@@ -0,0 +1,77 @@
+import os
+
+from e3.aws.cfn.render import render_stacks
+
+STACK_MODULE = """
+from e3.aws.cfn import Stack
+from e3.aws.cfn.s3 import Bucket
+
+
+def stack(buckets=1):
+    s = Stack('storage')
+    for index in range(buckets):
+        s += Bucket('Bucket%s' % index)
+    return s
+
+
+def broken():
+    raise ValueError('broken factory')
+"""
+
+
+def test_render_stacks():
+    with open('storage.py', 'w') as fd:
+        fd.write(STACK_MODULE)
+    factories = {'small': 'storage.py', 'large': 'storage.py:stack'}
+    params = {'large': {'buckets': 3}}
+
+    results = render_stacks(factories, 'out', params=params, max_workers=2)
+    assert sorted(results) == ['large', 'small']
+    assert not results['small'].skipped
+    assert results['small'].build_time >= 0
+    assert results['small'].sha256 != results['large'].sha256
+    with open(os.path.join('out', 'large.yaml')) as fd:
+        assert 'Bucket2' in fd.read()
+
+    # Nothing changed so both stacks are skipped
+    again = render_stacks(factories, 'out', params=params,
+                          skip_unchanged=True)
+    assert all(result.skipped for result in again.values())
+    assert again['large'].sha256 == results['large'].sha256
+
+    # A change of parameters and a missing template trigger a new rendering
+    os.remove(os.path.join('out', 'small.yaml'))
+    params['large']['buckets'] = 2
+    again = render_stacks(factories, 'out', params=params,
+                          skip_unchanged=True)
+    assert not again['small'].skipped
+    assert again['small'].sha256 == results['small'].sha256
+    assert not again['large'].skipped
+    assert again['large'].sha256 != results['large'].sha256
+
+
+def test_render_inputs_and_errors():
+    with open('storage.py', 'w') as fd:
+        fd.write(STACK_MODULE)
+    with open('shared.py', 'w') as fd:
+        fd.write('NAME = "storage"\n')
+    factories = {'storage': 'storage.py', 'broken': 'storage.py:broken'}
+
+    # A failing factory does not prevent the others from being rendered
+    results = render_stacks(factories, 'out', extra_inputs=['shared.py'],
+                            max_workers=1)
+    assert 'broken factory' in str(results['broken'])
+    assert results['storage'].error is None
+    assert os.path.isfile(os.path.join('out', 'storage.yaml'))
+
+    results = render_stacks(factories, 'out', extra_inputs=['shared.py'],
+                            skip_unchanged=True)
+    assert results['storage'].skipped
+    assert not results['broken'].skipped
+
+    # Changes in extra inputs trigger a new rendering
+    with open('shared.py', 'a') as fd:
+        fd.write('SIZE = 2\n')
+    results = render_stacks({'storage': 'storage.py'}, 'out',
+                            extra_inputs=['shared.py'], skip_unchanged=True)
+    assert not results['storage'].skipped
@@ -0,0 +1,56 @@
+from botocore.stub import ANY
+from e3.aws import AWSEnv
+from e3.aws.cfn import Stack
+from e3.aws.cfn.ec2 import Instance
+from e3.aws.cfn.replication import replicate
+
+
+def image(ami_id, name, date):
+    return {'ImageId': ami_id, 'Name': name, 'CreationDate': date,
+            'RootDeviceName': '/dev/sda1'}
+
+
+def test_replicate():
+    regions = ['us-east-1', 'eu-west-1', 'ap-south-1']
+    aws_env = AWSEnv(regions=regions, stub=True)
+
+    names = ['builder-*', 'tester']
+    filters = {'Filters': [{'Name': 'name', 'Values': names}],
+               'Owners': ['self']}
+    stub = aws_env.stub('ec2', region='us-east-1')
+    stub.add_response('describe_images', {'Images': [
+        image('ami-1', 'builder-1', '2020-01-01T00:00:00.000Z'),
+        image('ami-2', 'builder-2', '2020-02-01T00:00:00.000Z'),
+        image('ami-3', 'tester', '2020-01-01T00:00:00.000Z')]}, filters)
+    stub = aws_env.stub('ec2', region='eu-west-1')
+    stub.add_response('describe_images', {'Images': [
+        image('ami-4', 'builder-1', '2020-01-01T00:00:00.000Z'),
+        image('ami-5', 'tester', '2020-01-01T00:00:00.000Z')]}, filters)
+    # No tester AMI in ap-south-1
+    stub = aws_env.stub('ec2', region='ap-south-1')
+    stub.add_response('describe_images', {'Images': [
+        image('ami-6', 'builder-1', '2020-01-01T00:00:00.000Z')]}, filters)
+
+    aws_env.stub('cloudformation', region='us-east-1').add_response(
+        'create_stack', {'StackId': 'stack-us'},
+        {'StackName': 'farm', 'TemplateBody': ANY,
+         'Capabilities': ['CAPABILITY_IAM']})
+    aws_env.stub('cloudformation', region='eu-west-1').add_client_error(
+        'create_stack', service_error_code='LimitExceededException')
+
+    def factory(region, images):
+        s = Stack('farm')
+        s += Instance('Builder', images['builder-*'])
+        s += Instance('Tester', images['tester'])
+        return s
+
+    results = replicate(factory, images=names, owners=['self'])
+
+    assert results['us-east-1'].success
+    assert results['us-east-1'].response['StackId'] == 'stack-us'
+    assert 'ami-2' in results['us-east-1'].body
+    assert results['us-east-1'].images['builder-*'].region == 'us-east-1'
+    assert 'LimitExceeded' in str(results['eu-west-1'].error)
+    assert 'ami-4' in results['eu-west-1'].body
+    assert 'cannot find AMI tester' in str(results['ap-south-1'].error)
+    assert results['ap-south-1'].stack is None
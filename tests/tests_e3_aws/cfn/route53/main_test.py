@@ -0,0 +1,98 @@
+import pytest
+from e3.aws.cfn import AWSType, Resource, Stack
+from e3.aws.cfn.route53 import (AliasTarget, HealthCheck, RecordSet,
+                                RecordSetGroup, group_record_sets,
+                                latency_record_sets)
+
+
+class Consumer(Resource):
+    """Resource using a reference to a DNS record."""
+
+    def __init__(self, name, record_set):
+        """Initialize a resource depending on record_set."""
+        super(Consumer, self).__init__(name, kind=AWSType.S3_BUCKET)
+        self.record_set = record_set
+        self.depends = record_set.name
+
+    @property
+    def properties(self):
+        return {'BucketName': self.record_set.ref}
+
+
+def test_group_record_sets():
+    s = Stack(name='teststack')
+    for i in range(600):
+        s += RecordSet('Host%s' % i, 'example.com', 'h%s.example.com' % i,
+                       'A', 300, ['10.0.%s.%s' % (i // 256, i % 256)])
+    s += RecordSet('Multi', 'example.com', 'multi.example.com',
+                   'A', 300, ['10.1.0.%s' % i for i in range(10)])
+    s += RecordSet('Other', 'example.org', 'www.example.org',
+                   'CNAME', 300, ['www.example.com'])
+    s['Other'].depends = 'Host0'
+    s += Consumer('Consumer', s['Host42'])
+
+    groups = group_record_sets(s)
+    assert [g.name for g in groups] == \
+        ['ExampleComRecords1', 'ExampleComRecords2', 'ExampleOrgRecords1']
+    assert len(s.resources) == 4
+    assert all(isinstance(g, RecordSetGroup) for g in groups)
+
+    template = s.export()['Resources']
+    assert len(template['ExampleComRecords1']['Properties']
+               ['RecordSets']) == 500
+    assert len(template['ExampleComRecords2']['Properties']
+               ['RecordSets']) == 101
+    assert 'HostedZoneName' not in \
+        template['ExampleComRecords2']['Properties']['RecordSets'][0]
+    assert template['ExampleOrgRecords1']['DependsOn'] == \
+        'ExampleComRecords1'
+    assert template['Consumer']['DependsOn'] == 'ExampleComRecords1'
+    assert template['Consumer']['Properties']['BucketName'] == \
+        'h42.example.com'
+    assert s.body
+
+
+def test_latency_record_sets():
+    s = Stack(name='teststack')
+    checks = {region: HealthCheck('Check%s' % i, fqdn=fqdn,
+                                  resource_path='/health')
+              for i, (region, fqdn) in enumerate(
+                  [('us-east-1', 'api.us-east-1.example.com'),
+                   ('eu-west-1', 'api.eu-west-1.example.com')])}
+    for check in checks.values():
+        s += check
+    targets = {'us-east-1': 'api.us-east-1.example.com',
+               'eu-west-1': AliasTarget('lb.eu-west-1.amazonaws.com',
+                                        'Z32O12XQLNTSW2',
+                                        evaluate_target_health=True)}
+    for record_set in latency_record_sets('Api', 'example.com',
+                                          'api.example.com', targets,
+                                          health_checks=checks):
+        s += record_set
+
+    resources = s.export()['Resources']
+    assert resources['Check0']['Properties']['HealthCheckConfig'] == {
+        'Type': 'HTTPS',
+        'FullyQualifiedDomainName': 'api.us-east-1.example.com',
+        'ResourcePath': '/health',
+        'RequestInterval': 30,
+        'FailureThreshold': 3}
+    us = resources['ApiUsEast1']['Properties']
+    assert us['SetIdentifier'] == 'us-east-1'
+    assert us['Region'] == 'us-east-1'
+    assert us['ResourceRecords'] == ['api.us-east-1.example.com']
+    assert us['HealthCheckId'].name == 'Check0'
+    eu = resources['ApiEuWest1']['Properties']
+    assert 'TTL' not in eu
+    assert eu['AliasTarget']['EvaluateTargetHealth'] is True
+    assert eu['HealthCheckId'].name == 'Check1'
+
+    with pytest.raises(AssertionError):
+        RecordSet('Weighted', 'example.com', 'www.example.com', 'A', 60,
+                  ['10.0.0.1'], weight=10)
+    with pytest.raises(AssertionError):
+        RecordSet('Both', 'example.com', 'www.example.com', 'A', 60,
+                  ['10.0.0.1'], set_identifier='a', weight=10,
+                  failover='PRIMARY')
+    with pytest.raises(AssertionError):
+        HealthCheck('Match', check_type='HTTP_STR_MATCH', fqdn='example.com')
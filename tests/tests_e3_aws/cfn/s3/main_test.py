@@ -0,0 +1,80 @@
+import pytest
+from e3.aws.cfn import Stack
+from e3.aws.cfn.s3 import (Bucket, IntelligentTieringConfiguration,
+                           InventoryConfiguration, LifecycleRule,
+                           MetricsConfiguration)
+
+
+def test_bucket_configurations():
+    """Export a bucket with performance and cost configurations."""
+    logs = Bucket('Logs')
+    data = Bucket('Data')
+    data.set_transfer_acceleration()
+    data.add_lifecycle_rule(LifecycleRule(
+        'cleanup',
+        abort_incomplete_multipart_days=7,
+        transitions={'GLACIER': 90, 'STANDARD_IA': 30},
+        expiration_days=365))
+    data.add_intelligent_tiering(IntelligentTieringConfiguration(
+        'archive', prefix='raw/', archive_days=90, deep_archive_days=180))
+    data.add_metrics(MetricsConfiguration('hot', tags={'tier': 'hot'}))
+    data.add_inventory(InventoryConfiguration(
+        'weekly', logs, frequency='Weekly', report_format='Parquet',
+        fields=['Size', 'StorageClass']))
+
+    stack = Stack('test-stack', 'this is a test stack')
+    stack += logs
+    stack += data
+    props = stack.export()['Resources']['Data']['Properties']
+
+    assert props['AccelerateConfiguration'] == {
+        'AccelerationStatus': 'Enabled'}
+    assert props['LifecycleConfiguration']['Rules'] == [{
+        'Id': 'cleanup',
+        'Status': 'Enabled',
+        'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 7},
+        'ExpirationInDays': 365,
+        'Transitions': [
+            {'StorageClass': 'STANDARD_IA', 'TransitionInDays': 30},
+            {'StorageClass': 'GLACIER', 'TransitionInDays': 90}]}]
+    assert props['IntelligentTieringConfigurations'] == [{
+        'Id': 'archive',
+        'Prefix': 'raw/',
+        'Status': 'Enabled',
+        'Tierings': [{'AccessTier': 'ARCHIVE_ACCESS', 'Days': 90},
+                     {'AccessTier': 'DEEP_ARCHIVE_ACCESS', 'Days': 180}]}]
+    assert props['MetricsConfigurations'] == [{
+        'Id': 'hot', 'TagFilters': [{'Key': 'tier', 'Value': 'hot'}]}]
+    inventory = props['InventoryConfigurations'][0]
+    assert inventory['Destination']['BucketArn'].name == 'Logs'
+    assert inventory['Destination']['Format'] == 'Parquet'
+    assert inventory['ScheduleFrequency'] == 'Weekly'
+    assert inventory['IncludedObjectVersions'] == 'Current'
+
+    # Buckets without configuration are left unchanged
+    assert stack.export()['Resources']['Logs']['Properties'] == {
+        'AccessControl': 'Private'}
+
+
+def test_bucket_configuration_validation():
+    """Check that invalid configurations are rejected."""
+    with pytest.raises(AssertionError):
+        LifecycleRule('nothing')
+    with pytest.raises(AssertionError):
+        LifecycleRule('early', transitions={'STANDARD_IA': 7})
+    with pytest.raises(AssertionError):
+        IntelligentTieringConfiguration('short', archive_days=30)
+    with pytest.raises(AssertionError):
+        IntelligentTieringConfiguration('deep', deep_archive_days=1000)
+    with pytest.raises(AssertionError):
+        IntelligentTieringConfiguration('order', archive_days=200,
+                                        deep_archive_days=180)
+    with pytest.raises(AssertionError):
+        MetricsConfiguration('x' * 65)
+    with pytest.raises(AssertionError):
+        InventoryConfiguration('inv', 'arn:aws:s3:::logs', fields=['Owner'])
+
+    bucket = Bucket('Data')
+    bucket.add_metrics(MetricsConfiguration('all'))
+    with pytest.raises(AssertionError):
+        bucket.add_metrics(MetricsConfiguration('all'))
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+import json
+
+from e3.aws import AWSEnv, default_region
+from e3.aws.cfn import AWSType, Stack
+from e3.aws.cfn.ec2 import (VPC, InternetGateway, Subnet,
+                            VPCGatewayAttachment)
+from e3.aws.cfn.trace import (DurationHistory, chrome_trace, critical_path,
+                              deployment_spans, event_spans, otel_spans)
+
+T0 = datetime(2020, 1, 1)
+
+TYPES = {'net': 'AWS::CloudFormation::Stack',
+         'VPC': 'AWS::EC2::VPC',
+         'Gate': 'AWS::EC2::InternetGateway',
+         'Subnet': 'AWS::EC2::Subnet',
+         'GateAttach': 'AWS::EC2::VPCGatewayAttachment'}
+
+
+def event(index, name, status, seconds):
+    return {'StackId': 'stack-net',
+            'EventId': 'e%s' % index,
+            'StackName': 'net',
+            'LogicalResourceId': name,
+            'ResourceType': TYPES[name],
+            'ResourceStatus': status,
+            'Timestamp': T0 + timedelta(seconds=seconds)}
+
+
+def test_deployment_trace():
+    stack = Stack('net')
+    stack += VPC('VPC', '10.10.0.0/16')
+    stack += InternetGateway('Gate')
+    stack += Subnet('Subnet', stack['VPC'], '10.10.10.0/24')
+    stack += VPCGatewayAttachment('GateAttach', stack['VPC'], stack['Gate'])
+
+    history = [('net', 'UPDATE_COMPLETE', -100),
+               ('net', 'CREATE_IN_PROGRESS', 0),
+               ('VPC', 'CREATE_IN_PROGRESS', 1),
+               ('Gate', 'CREATE_IN_PROGRESS', 1),
+               ('Gate', 'CREATE_COMPLETE', 5),
+               ('VPC', 'CREATE_COMPLETE', 10),
+               ('Subnet', 'CREATE_IN_PROGRESS', 11),
+               ('GateAttach', 'CREATE_IN_PROGRESS', 11),
+               ('Subnet', 'CREATE_COMPLETE', 15),
+               ('GateAttach', 'CREATE_COMPLETE', 30),
+               ('net', 'CREATE_COMPLETE', 31)]
+    events = [event(i, *e) for i, e in enumerate(history)][::-1]
+
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('cloudformation')
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': events[:6], 'NextToken': 'p2'},
+                          {'StackName': 'net'})
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': events[6:]},
+                          {'StackName': 'net', 'NextToken': 'p2'})
+        spans = deployment_spans('net')
+        stub.assert_no_pending_responses()
+
+    assert spans['net'].duration == 31
+    assert spans['GateAttach'].duration == 19
+    assert [s.name for s in critical_path(stack, spans)] == [
+        'VPC', 'GateAttach']
+
+    trace = json.loads(json.dumps(chrome_trace(spans, 'net')))
+    complete = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert complete[0]['name'] == 'net'
+    assert {e['name']: e['dur'] for e in complete}['VPC'] == 9000000
+
+    otel = otel_spans(spans, 'net')
+    assert len({s['traceId'] for s in otel}) == 1
+    root = [s for s in otel if s['name'] == 'net'][0]
+    assert 'parentSpanId' not in root
+    assert all(s['parentSpanId'] == root['spanId']
+               for s in otel if s is not root)
+
+    DurationHistory('durations.json').record(spans)
+    history = DurationHistory('durations.json')
+    assert history.estimate(AWSType.EC2_VPC) == 9
+    assert history.estimate('AWS::CloudFormation::Stack') is None
+
+
+def test_replacement_trace():
+    stack = Stack('net')
+    stack += VPC('VPC', '10.10.0.0/16')
+    stack += Subnet('Subnet', stack['VPC'], '10.10.20.0/24')
+
+    # The subnet is replaced, the old one is deleted during the cleanup
+    history = [('net', 'UPDATE_IN_PROGRESS', 0),
+               ('Subnet', 'UPDATE_IN_PROGRESS', 1),
+               ('Subnet', 'UPDATE_IN_PROGRESS', 2),
+               ('Subnet', 'UPDATE_COMPLETE', 6),
+               ('net', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS', 7),
+               ('Subnet', 'DELETE_IN_PROGRESS', 8),
+               ('Subnet', 'DELETE_COMPLETE', 60),
+               ('net', 'UPDATE_COMPLETE', 61)]
+    events = [event(i, *e) for i, e in enumerate(history)]
+
+    spans = event_spans(events)
+    assert spans['Subnet'].duration == 5
+    assert spans['Subnet'].status == 'UPDATE_COMPLETE'
+    assert spans['net'].duration == 61
+    assert [s.name for s in critical_path(stack, spans)] == ['Subnet']
+
+    cleanup = event_spans(events, cleanup=True)
+    assert cleanup['Subnet'].duration == 52
+    assert cleanup['Subnet'].status == 'DELETE_COMPLETE'
+    assert critical_path(stack, cleanup) == []
+
+    history = DurationHistory('durations.json')
+    history.record(cleanup)
+    assert history.estimate(AWSType.EC2_SUBNET) is None
+    history.record(spans)
+    assert history.estimate(AWSType.EC2_SUBNET) == 5
@@ -0,0 +1,135 @@
+from e3.aws import AWSEnv
+from e3.aws.ec2.ami import AMI, AMICatalog
+
+
+def image(ami_id, name, date, **tags):
+    return {'ImageId': ami_id, 'Name': name, 'CreationDate': date,
+            'RootDeviceName': '/dev/sda1',
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]}
+
+
+def test_ami_catalog():
+    regions = ['us-east-1', 'eu-west-1']
+    aws_env = AWSEnv(regions=regions, stub=True)
+    params = {'Owners': ['self'],
+              'Filters': [{'Name': 'name', 'Values': ['build-*']},
+                          {'Name': 'tag-key', 'Values': ['project']}]}
+    aws_env.stub('ec2', region='us-east-1').add_response(
+        'describe_images',
+        {'Images': [
+            image('ami-1', 'build-farm-1', '2020-01-01T00:00:00.000Z',
+                  project='farm', os='linux'),
+            image('ami-2', 'build-farm-2', '2020-03-01T00:00:00.000Z',
+                  project='farm', os='linux'),
+            image('ami-3', 'build-tools-1', '2020-04-01T00:00:00.000Z',
+                  project='tools', os='windows')]},
+        params)
+    aws_env.stub('ec2', region='eu-west-1').add_response(
+        'describe_images',
+        {'Images': [
+            image('ami-4', 'build-farm-2', '2020-02-01T00:00:00.000Z',
+                  project='farm', os='linux')]},
+        params)
+
+    catalog = AMICatalog(owners=['self'], names=['build-*'],
+                         tags={'project': None})
+    assert sorted(catalog.refresh()) == sorted(regions)
+
+    assert catalog.latest('build-farm-*').id == 'ami-2'
+    assert catalog.latest('build-farm-*', region='eu-west-1').id == 'ami-4'
+    assert catalog.latest('build-farm-1').id == 'ami-1'
+    assert catalog.latest('test-*') is None
+    assert [a.id for a in catalog.match('build-*')] == [
+        'ami-3', 'ami-2', 'ami-4', 'ami-1']
+    assert [a.id for a in catalog.by_tag('os', 'linux')] == [
+        'ami-2', 'ami-4', 'ami-1']
+    assert [a.id for a in catalog.by_tag('project',
+                                         region='us-east-1')] == [
+        'ami-3', 'ami-2', 'ami-1']
+
+    catalog.save('catalog.json')
+    catalog = AMICatalog(owners=['self'], names=['build-*'],
+                         tags={'project': None})
+    assert catalog.load('catalog.json')
+    # Data is recent enough, so no request is done
+    assert catalog.refresh(max_age=3600) == []
+    assert catalog.latest('build-farm-*').region == 'us-east-1'
+    # The tag index is rebuilt when loading the catalog
+    assert [a.id for a in catalog.by_tag('os', 'windows')] == ['ami-3']
+    assert [a.id for a in catalog.by_tag('os')] == [
+        'ami-3', 'ami-2', 'ami-4', 'ami-1']
+    assert catalog.by_tag('os', 'mac') == []
+    assert catalog.by_tag('team') == []
+
+    # Data saved with other filters is not reused
+    assert not AMICatalog(owners=['self']).load('catalog.json')
+
+
+def test_ami_copy():
+    regions = ['us-east-1', 'eu-west-1', 'ap-south-1', 'us-west-2']
+    aws_env = AWSEnv(regions=regions, stub=True)
+    source = AMI('ami-1', 'us-east-1',
+                 data=image('ami-1', 'build-farm-1',
+                            '2020-01-01T00:00:00.000Z'))
+    params = {'SourceImageId': 'ami-1', 'SourceRegion': 'us-east-1',
+              'Name': 'build-farm-1'}
+
+    eu = aws_env.stub('ec2', region='eu-west-1')
+    eu.add_response('copy_image', {'ImageId': 'ami-eu'}, params)
+    ap = aws_env.stub('ec2', region='ap-south-1')
+    ap.add_response('copy_image', {'ImageId': 'ami-ap'}, params)
+    aws_env.stub('ec2', region='us-west-2').add_client_error(
+        'copy_image', service_error_code='AuthFailure')
+
+    # First round: nothing completed. The new image is not visible yet in
+    # eu-west-1 and requests are throttled in ap-south-1
+    eu.add_client_error('describe_images',
+                        service_error_code='InvalidAMIID.NotFound',
+                        expected_params={'ImageIds': ['ami-eu']})
+    ap.add_client_error('describe_images',
+                        service_error_code='RequestLimitExceeded',
+                        expected_params={'ImageIds': ['ami-ap']})
+    eu.add_response('describe_images', {'Images': [
+        dict(image('ami-eu', 'build-farm-1', '2020-01-02T00:00:00.000Z'),
+             State='pending')]}, {'ImageIds': ['ami-eu']})
+    ap.add_response('describe_images', {'Images': [
+        dict(image('ami-ap', 'build-farm-1', '2020-01-02T00:00:00.000Z'),
+             State='pending')]}, {'ImageIds': ['ami-ap']})
+    # Second round: the copy fails in ap-south-1
+    eu.add_response('describe_images', {'Images': [
+        dict(image('ami-eu', 'build-farm-1', '2020-01-02T00:00:00.000Z'),
+             State='pending')]}, {'ImageIds': ['ami-eu']})
+    ap.add_response('describe_images', {'Images': [
+        dict(image('ami-ap', 'build-farm-1', '2020-01-02T00:00:00.000Z'),
+             State='failed', StateReason={'Message': 'no space'})]},
+        {'ImageIds': ['ami-ap']})
+    # Third round: the copy to eu-west-1 is available
+    eu.add_response('describe_images', {'Images': [
+        dict(image('ami-eu', 'build-farm-1', '2020-01-02T00:00:00.000Z'),
+             State='available')]}, {'ImageIds': ['ami-eu']})
+
+    copies = source.copy_to(poll_interval=0)
+    assert sorted(copies) == ['ap-south-1', 'eu-west-1', 'us-west-2']
+    assert copies['eu-west-1'].ami.id == 'ami-eu'
+    assert copies['eu-west-1'].ami.region == 'eu-west-1'
+    assert copies['eu-west-1'].duration >= 0
+    assert 'no space' in copies['ap-south-1'].error
+    assert 'AuthFailure' in str(copies['us-west-2'].error)
+    assert copies['us-west-2'].duration is None
+    eu.assert_no_pending_responses()
+    ap.assert_no_pending_responses()
+
+
+def test_ami_copy_poll_error():
+    aws_env = AWSEnv(regions=['us-east-1', 'eu-west-1'], stub=True)
+    source = AMI('ami-1', 'us-east-1',
+                 data=image('ami-1', 'build-farm-1',
+                            '2020-01-01T00:00:00.000Z'))
+    eu = aws_env.stub('ec2', region='eu-west-1')
+    eu.add_response('copy_image', {'ImageId': 'ami-eu'})
+    eu.add_client_error('describe_images',
+                        service_error_code='UnauthorizedOperation')
+
+    copies = source.copy_to(poll_interval=0)
+    assert 'UnauthorizedOperation' in str(copies['eu-west-1'].error)
+    eu.assert_no_pending_responses()
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+
+from e3.aws import AWSEnv
+from e3.aws.main import main
+
+STACK_MODULE = """
+from e3.aws.cfn import Stack
+from e3.aws.cfn.ec2 import VPC, Subnet
+from e3.aws.cfn.s3 import Bucket
+
+
+def stack():
+    s = Stack('farm')
+    s += VPC('VPC', '10.10.0.0/16')
+    s += Subnet('Subnet', s['VPC'], '10.10.10.0/24')
+    s += Bucket('Logs')
+    return s
+"""
+
+STARTUP_CHECK = """
+import sys
+from e3.aws.main import main
+result = main(['render', 'farm.py'])
+sys.stderr.write('botocore modules: %s\\n'
+                 % [m for m in sys.modules if m.startswith('botocore')])
+sys.exit(result)
+"""
+
+
+def test_render():
+    with open('farm.py', 'w') as fd:
+        fd.write(STACK_MODULE)
+    assert main(['render', '--output', 'farm.yaml', 'farm.py:stack']) == 0
+    with open('farm.yaml') as fd:
+        assert 'AWS::EC2::Subnet' in fd.read()
+
+
+def test_startup():
+    """Check the cold start of the render command.
+
+    Rendering a template should not import botocore. The import time of
+    the template modules is measured by tests/benchmark-startup.py.
+    """
+    with open('farm.py', 'w') as fd:
+        fd.write(STACK_MODULE)
+    process = subprocess.run(
+        [sys.executable, '-c', STARTUP_CHECK],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    assert 'AWS::S3::Bucket' in process.stdout
+    assert process.stderr.splitlines()[-1] == 'botocore modules: []'
+
+
+def test_aws_env_regions():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    aws_env.regions = ['eu-west-1', 'us-east-1']
+    assert aws_env.regions == ['eu-west-1', 'us-east-1']
+
+
+def test_aws_env_session():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    session = object()
+    aws_env.session = session
+    assert aws_env.session is session
@@ -0,0 +1,14 @@
+from e3.aws.poll import Backoff
+
+
+def test_backoff():
+    delays = Backoff(0.001, 0.004, 60)
+    intervals = []
+    for progress in (False, False, False, False, True, False):
+        assert delays.wait(progress)
+        intervals.append(delays.interval)
+    assert intervals == [0.001, 0.002, 0.004, 0.004, 0.001, 0.002]
+
+    delays = Backoff(0.001, 0.004, 0)
+    assert delays.expired
+    assert not delays.wait()
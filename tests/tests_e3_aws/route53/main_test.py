@@ -0,0 +1,98 @@
+import pytest
+from e3.aws import AWSEnv, default_region
+from e3.aws.cfn.route53 import RecordSet
+from e3.aws.route53.records import batch_changes, sync_record_sets
+
+
+def test_sync_record_sets():
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('route53')
+        stub.add_response(
+            'list_hosted_zones_by_name',
+            {'HostedZones': [{'Id': '/hostedzone/Z1',
+                              'Name': 'example.com.',
+                              'CallerReference': 'ref'}],
+             'IsTruncated': False,
+             'MaxItems': '1'},
+            {'DNSName': 'example.com.', 'MaxItems': '1'})
+        stub.add_response(
+            'list_resource_record_sets',
+            {'ResourceRecordSets': [
+                {'Name': 'example.com.', 'Type': 'SOA', 'TTL': 900,
+                 'ResourceRecords': [{'Value': 'soa'}]},
+                {'Name': 'unchanged.example.com.', 'Type': 'A', 'TTL': 300,
+                 'ResourceRecords': [{'Value': '10.0.0.2'},
+                                     {'Value': '10.0.0.1'}]},
+                {'Name': 'old.example.com.', 'Type': 'A', 'TTL': 300,
+                 'ResourceRecords': [{'Value': '10.0.0.3'}]}],
+             'IsTruncated': True,
+             'NextRecordName': 'updated.example.com.',
+             'NextRecordType': 'A',
+             'MaxItems': '300'},
+            {'HostedZoneId': '/hostedzone/Z1'})
+        stub.add_response(
+            'list_resource_record_sets',
+            {'ResourceRecordSets': [
+                {'Name': 'updated.example.com.', 'Type': 'A', 'TTL': 300,
+                 'ResourceRecords': [{'Value': '10.0.0.4'}]}],
+             'IsTruncated': False,
+             'MaxItems': '300'},
+            {'HostedZoneId': '/hostedzone/Z1',
+             'StartRecordName': 'updated.example.com.',
+             'StartRecordType': 'A'})
+        stub.add_response(
+            'change_resource_record_sets',
+            {'ChangeInfo': {'Id': 'C1', 'Status': 'PENDING',
+                            'SubmittedAt': '2020-01-01'}},
+            {'HostedZoneId': '/hostedzone/Z1',
+             'ChangeBatch': {'Changes': [
+                 {'Action': 'UPSERT',
+                  'ResourceRecordSet': {
+                      'Name': 'updated.example.com.', 'Type': 'A',
+                      'TTL': 300,
+                      'ResourceRecords': [{'Value': '10.0.0.5'}]}},
+                 {'Action': 'UPSERT',
+                  'ResourceRecordSet': {
+                      'Name': 'new.example.com.', 'Type': 'CNAME',
+                      'TTL': 60,
+                      'ResourceRecords': [{'Value': 'example.com'}]}},
+                 {'Action': 'DELETE',
+                  'ResourceRecordSet': {
+                      'Name': 'old.example.com.', 'Type': 'A',
+                      'TTL': 300,
+                      'ResourceRecords': [{'Value': '10.0.0.3'}]}}]}})
+
+        records = [
+            RecordSet('R1', 'example.com', 'Unchanged.example.com', 'A', 300,
+                      ['10.0.0.1', '10.0.0.2']),
+            RecordSet('R2', 'example.com', 'updated.example.com', 'A', 300,
+                      ['10.0.0.5']),
+            RecordSet('R3', 'example.com', 'new.example.com', 'CNAME', 60,
+                      ['example.com'])]
+        with stub:
+            result = sync_record_sets(records, delete=True)
+        assert [c['Id'] for c in result['example.com']] == ['C1']
+        stub.assert_no_pending_responses()
+
+        # Duplicate records are rejected before any request
+        records.append(RecordSet('R4', 'example.com', 'New.example.com.',
+                                 'CNAME', 300, ['example.org']))
+        with stub:
+            with pytest.raises(AssertionError, match='duplicate record'):
+                sync_record_sets(records)
+
+
+def test_batch_changes():
+    changes = [{'Action': 'UPSERT',
+                'ResourceRecordSet': {
+                    'Name': 'h%s.example.com.' % i, 'Type': 'A', 'TTL': 60,
+                    'ResourceRecords': [{'Value': '10.0.0.1'}]}}
+               for i in range(1200)]
+    changes += [{'Action': 'DELETE',
+                 'ResourceRecordSet': {
+                     'Name': 'd%s.example.com.' % i, 'Type': 'A', 'TTL': 60,
+                     'ResourceRecords': [{'Value': '10.0.0.1'}]}}
+                for i in range(1100)]
+    batches = batch_changes(changes)
+    assert [len(b) for b in batches] == [500, 500, 800, 500]
@@ -0,0 +1,74 @@
+import hashlib
+
+from botocore.stub import ANY
+from e3.aws import AWSEnv, default_region
+from e3.aws.s3.upload import MIN_PART_SIZE, Uploader
+
+
+def test_upload():
+    small = b'small content'
+    large = b'x' * (MIN_PART_SIZE * 2 + 10)
+    with open('small', 'wb') as fd:
+        fd.write(small)
+    with open('large', 'wb') as fd:
+        fd.write(large)
+    with open('same', 'wb') as fd:
+        fd.write(b'same')
+
+    aws_env = AWSEnv(regions=['us-east-1'], stub=True)
+    with default_region('us-east-1'):
+        stub = aws_env.stub('s3')
+        stub.add_client_error('head_object', service_error_code='404',
+                              http_status_code=404,
+                              expected_params={'Bucket': 'artifacts',
+                                               'Key': 'small'})
+        stub.add_response(
+            'put_object', {},
+            {'Bucket': 'artifacts', 'Key': 'small', 'Body': small,
+             'Metadata': {'sha256': hashlib.sha256(small).hexdigest()}})
+        stub.add_response(
+            'head_object',
+            {'Metadata': {'sha256': hashlib.sha256(b'same').hexdigest()}},
+            {'Bucket': 'artifacts', 'Key': 'same'})
+        stub.add_response(
+            'head_object',
+            {'Metadata': {'sha256': 'outdated'}},
+            {'Bucket': 'artifacts', 'Key': 'large'})
+        stub.add_response(
+            'create_multipart_upload', {'UploadId': 'U1'},
+            {'Bucket': 'artifacts', 'Key': 'large',
+             'Metadata': {'sha256': hashlib.sha256(large).hexdigest()}})
+        for number in range(1, 4):
+            stub.add_response(
+                'upload_part', {'ETag': 'E%s' % number},
+                {'Bucket': 'artifacts', 'Key': 'large', 'UploadId': 'U1',
+                 'PartNumber': number, 'Body': ANY})
+        stub.add_response(
+            'complete_multipart_upload', {},
+            {'Bucket': 'artifacts', 'Key': 'large', 'UploadId': 'U1',
+             'MultipartUpload': {'Parts': [
+                 {'ETag': 'E1', 'PartNumber': 1},
+                 {'ETag': 'E2', 'PartNumber': 2},
+                 {'ETag': 'E3', 'PartNumber': 3}]}})
+        stub.add_response(
+            'head_object',
+            {'Metadata': {'sha256': hashlib.sha256(b'same').hexdigest()}},
+            {'Bucket': 'artifacts', 'Key': 'same'})
+
+        progress = []
+        uploader = Uploader('artifacts', max_workers=1,
+                            part_size=MIN_PART_SIZE,
+                            multipart_threshold=MIN_PART_SIZE,
+                            progress=lambda *args: progress.append(args))
+        with stub:
+            # Small objects are sent concurrently with multipart uploads,
+            # so use two calls to get a deterministic sequence of requests.
+            result = uploader.upload({'small': 'small', 'same': 'same'})
+            result.update(uploader.upload({'large': 'large'}))
+            assert progress[-1] == ('large', len(large), len(large))
+            # Progress is reported per call
+            assert uploader.upload({'same': 'same'}) == {'same': False}
+        stub.assert_no_pending_responses()
+
+    assert result == {'small': True, 'large': True, 'same': False}
+    assert progress.count(('same', 4, 4)) == 2